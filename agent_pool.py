@@ -0,0 +1,88 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+class AgentPool:
+    """
+    Bounded pool of prebuilt agents, one per key (e.g. region, model id and guardrail version). An agent is
+    built once, in a worker thread since building it can make blocking AWS calls, and reused by every later
+    request with the same key; concurrent requests for a key being built wait for that one build. The least
+    recently used agent is dropped when the pool is full. Used from the event loop only, so no lock is needed.
+    """
+
+    def __init__(self, max_size: int = 8):
+        self.max_size = max_size
+        self._agents: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._pending: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+        self.build_seconds = 0.0
+
+    async def _build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            agent = await asyncio.to_thread(build)
+        finally:
+            self._pending.pop(key, None)
+        elapsed = time.perf_counter() - start
+        self.build_seconds += elapsed
+        self._agents[key] = agent
+        while len(self._agents) > self.max_size:
+            evicted, _ = self._agents.popitem(last=False)
+            self.evictions += 1
+            logger.info(f"Evicted agent {evicted} from the pool")
+        logger.info(f"Built agent {key} in {elapsed * 1000:.1f} ms, {len(self._agents)} of {self.max_size} in the pool")
+        return agent
+
+    async def get(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """Agent for key, built with build() if the pool does not have it"""
+        agent = self._agents.get(key)
+        if agent is not None:
+            self.hits += 1
+            self._agents.move_to_end(key)
+            return agent
+        task = self._pending.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._pending[key] = asyncio.ensure_future(self._build(key, build))
+        else:
+            self.waits += 1
+        # a cancelled request must not cancel the build other requests wait for
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, hits, misses (builds), requests that waited for a build in progress and evictions"""
+        return {
+            "size": len(self._agents),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "waits": self.waits,
+            "evictions": self.evictions,
+            "build_seconds": round(self.build_seconds, 3),
+            "keys": [list(key) if isinstance(key, tuple) else key for key in self._agents],
+        }
@@ -0,0 +1,196 @@
+import json
+import math
+import logging
+import numpy as np
+from pathlib import Path
+from typing import Literal, Optional, Sequence, Union
+from pydantic import BaseModel, Field
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Index spec of a FAISS index, stored next to index.faiss
+INDEX_SPEC_FILE = "index_spec.json"
+
+IndexKind = Literal["flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "sq_fp16"]
+# Index types that keep the original vectors, so they can be turned back into a flat index exactly
+LOSSLESS_KINDS = ("flat", "hnsw", "ivf_flat")
+
+
+class IndexSpec(BaseModel):
+    """
+    Type and parameters of the FAISS index used for the vector store. Specs are written as strings such
+    as "flat", "hnsw:m=32,ef_search=128", "ivf_flat:nlist=64,nprobe=8", "ivf_pq:pq_m=16" or "sq8".
+    """
+    kind: IndexKind = Field(default="flat", description="Index type: flat, hnsw, ivf_flat, ivf_pq, sq8 or sq_fp16")
+    m: int = Field(default=32, description="HNSW: number of neighbors per node")
+    ef_construction: int = Field(default=40, description="HNSW: size of the candidate list at build time")
+    ef_search: int = Field(default=64, description="HNSW: size of the candidate list at query time")
+    nlist: Optional[int] = Field(default=None, description="IVF: number of clusters, defaults to ~4*sqrt(n)")
+    nprobe: int = Field(default=8, description="IVF: number of clusters visited at query time")
+    pq_m: int = Field(default=16, description="IVF-PQ: number of sub-quantizers, reduced to a divisor of the dimension")
+    pq_nbits: int = Field(default=8, description="IVF-PQ: bits per sub-quantizer code")
+
+    @classmethod
+    def parse(cls, spec: Union[str, "IndexSpec", None]) -> "IndexSpec":
+        """Parse a spec string like "ivf_pq:nlist=64,pq_m=16" """
+        if spec is None:
+            return cls()
+        if isinstance(spec, IndexSpec):
+            return spec
+        kind, _, params = spec.strip().partition(":")
+        values = {}
+        for param in filter(None, params.split(",")):
+            key, sep, value = param.partition("=")
+            if not sep:
+                raise ValueError(f"Invalid index spec parameter '{param}' in '{spec}', expected key=value")
+            values[key.strip()] = value.strip()
+        return cls(kind=kind.strip().lower(), **values)
+
+    def __str__(self) -> str:
+        defaults = IndexSpec(kind=self.kind)
+        params = [f"{k}={v}" for k, v in self.model_dump().items() if k != "kind" and v != getattr(defaults, k)]
+        return self.kind + (":" + ",".join(params) if params else "")
+
+    @property
+    def lossless(self) -> bool:
+        return self.kind in LOSSLESS_KINDS
+
+    def factory_string(self, dimension: int, count: int) -> str:
+        """faiss.index_factory description for this spec, cluster and code sizes are fitted to count vectors"""
+        if self.kind == "flat":
+            return "Flat"
+        if self.kind == "hnsw":
+            return f"HNSW{self.m}"
+        if self.kind == "sq8":
+            return "SQ8"
+        if self.kind == "sq_fp16":
+            return "SQfp16"
+        nlist = self.nlist or max(1, int(4 * math.sqrt(count)))
+        nlist = max(1, min(nlist, count))
+        if self.kind == "ivf_flat":
+            return f"IVF{nlist},Flat"
+        # ivf_pq: the number of sub-quantizers has to divide the dimension and every sub-quantizer needs
+        # at least 2^nbits training vectors
+        pq_m = max(d for d in range(1, min(self.pq_m, dimension) + 1) if dimension % d == 0)
+        nbits = max(1, min(self.pq_nbits, int(math.log2(max(count, 2)))))
+        return f"IVF{nlist},PQ{pq_m}x{nbits}"
+
+
+def apply_search_params(index, spec: IndexSpec):
+    """Set the query time parameters (HNSW efSearch, IVF nprobe) of spec on a FAISS index"""
+    import faiss
+    if spec.kind == "hnsw":
+        faiss.downcast_index(index).hnsw.efSearch = spec.ef_search
+    elif spec.kind in ("ivf_flat", "ivf_pq"):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(spec.nprobe, ivf.nlist)
+    return index
+
+
+def selector_search_params(index, positions: np.ndarray):
+    """SearchParameters restricting a search of index to positions, keeping its efSearch / nprobe"""
+    import faiss
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(positions, dtype=np.int64))
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    except RuntimeError:
+        downcast = faiss.downcast_index(index)
+        if isinstance(downcast, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=downcast.hnsw.efSearch)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+    # the parameters do not own the selector, keep it alive as long as they are
+    params.selector_ref = selector
+    return params
+
+
+def build_index(spec: IndexSpec, vectors: np.ndarray):
+    """Build (train if needed) a FAISS index of the given spec over vectors, using L2 distance like the default"""
+    import faiss
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimension = vectors.shape
+    description = spec.factory_string(dimension, count)
+    index = faiss.index_factory(dimension, description, faiss.METRIC_L2)
+    if spec.kind == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = spec.ef_construction
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    logger.info(f"Built {description} index ({spec}) over {count} vectors")
+    return apply_search_params(index, spec)
+
+
+def _ensure_direct_map(index):
+    """IVF indexes can only reconstruct vectors by position once they have a direct map"""
+    import faiss
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        # not an IVF index
+        return
+    if ivf.direct_map.no():
+        ivf.make_direct_map()
+
+
+def reconstruct_all(index) -> np.ndarray:
+    """Return all vectors stored in a FAISS index, in index order"""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    _ensure_direct_map(index)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def reconstruct_positions(index, positions: Sequence[int]) -> np.ndarray:
+    """Return the vectors stored at the given positions of a FAISS index (decoded, for lossy kinds)"""
+    if len(positions) == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    _ensure_direct_map(index)
+    return np.vstack([index.reconstruct(int(position)) for position in positions])
+
+
+def to_flat_index(index):
+    """Turn any FAISS index back into a flat L2 index with the same vectors (exact for lossless kinds)"""
+    import faiss
+    flat = faiss.IndexFlatL2(index.d)
+    flat.add(reconstruct_all(index))
+    return flat
+
+
+def apply_index_spec(vectorstore, spec: IndexSpec):
+    """Replace the (flat) index of a LangChain FAISS vector store by an index of the given spec"""
+    if spec.kind == "flat":
+        return vectorstore
+    vectorstore.index = build_index(spec, reconstruct_all(vectorstore.index))
+    return vectorstore
+
+
+def save_index_spec(path: Union[str, Path], spec: IndexSpec):
+    (Path(path) / INDEX_SPEC_FILE).write_text(json.dumps({"spec": str(spec), **spec.model_dump()}, indent=2))
+
+
+def load_index_spec(path: Union[str, Path]) -> IndexSpec:
+    """Spec of the index saved at path, indexes built before specs were recorded are flat"""
+    spec_path = Path(path) / INDEX_SPEC_FILE
+    if not spec_path.exists():
+        return IndexSpec()
+    values = json.loads(spec_path.read_text())
+    values.pop("spec", None)
+    return IndexSpec(**values)
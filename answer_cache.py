@@ -0,0 +1,154 @@
+import time
+import hashlib
+import logging
+import threading
+import numpy as np
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def index_fingerprint(vectorstore, *parts: Any) -> str:
+    """
+    Fingerprint of the contents of a vector store (the ids of its vectors, which change whenever a chunk
+    is added, changed or removed) together with any other settings the cached answers depend on
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(f"{part}\0".encode("utf-8"))
+    ids = vectorstore.index_to_docstore_id
+    for position in range(len(ids)):
+        digest.update(f"{ids[position]}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CachedAnswer(BaseModel):
+    """An answer returned for an earlier question"""
+    question: str = Field(..., description="Question the answer was generated for")
+    answer: str = Field(..., description="Answer, including its citations")
+    citations: List[str] = Field(default_factory=list, description="Paths cited by the answer")
+    scope: str = Field(default="", description="Retrieval filters the answer was generated with, answers are only shared within a scope")
+    created: float = Field(..., description="time.monotonic() when the answer was generated")
+    last_used: float = Field(..., description="time.monotonic() when the answer was last returned")
+    hits: int = Field(default=0, description="Number of times the answer was served from the cache")
+
+
+class SemanticAnswerCache(BaseModel):
+    """
+    Cache of answers keyed by the embedding of the question. A question whose cosine similarity to an
+    earlier question is at least threshold gets the earlier answer. Entries expire after ttl_seconds,
+    the least recently used ones are evicted beyond max_size, and everything is dropped when the
+    fingerprint of the index the answers were generated from changes.
+    """
+    threshold: float = Field(default=0.95, description="Minimum cosine similarity between questions to reuse an answer")
+    max_size: int = Field(default=256, description="Maximum number of cached answers")
+    ttl_seconds: float = Field(default=3600, description="Seconds after which a cached answer expires")
+    fingerprint: Optional[str] = Field(default=None, description="Fingerprint of the index the cached answers come from")
+    hits: int = Field(default=0, description="Number of questions answered from the cache")
+    misses: int = Field(default=0, description="Number of questions that were not in the cache")
+    invalidations: int = Field(default=0, description="Number of times the cache was cleared because the index changed")
+
+    # Initialized in __init__
+    entries: List[CachedAnswer] = Field(default_factory=list, exclude=True)
+    vectors: Optional[Any] = Field(default=None, exclude=True)
+    lock: Optional[Any] = Field(default=None, exclude=True)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        # unit-norm question embeddings, one row per entry
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, keep: List[bool]):
+        self.entries = [entry for entry, k in zip(self.entries, keep) if k]
+        self.vectors = self.vectors[np.asarray(keep, dtype=bool)] if len(keep) else self.vectors
+
+    def set_fingerprint(self, fingerprint: str):
+        """Drop all cached answers if they were generated from a different index"""
+        with self.lock:
+            if fingerprint == self.fingerprint:
+                return
+            if self.entries:
+                self.invalidations += 1
+                logger.info(f"Index changed, dropping {len(self.entries)} cached answers")
+            self.entries, self.vectors = [], np.zeros((0, 0), dtype=np.float32)
+            self.fingerprint = fingerprint
+
+    def lookup(self, question_vector: List[float], scope: str = "") -> Optional[CachedAnswer]:
+        """Return the cached answer of the most similar earlier question of the same scope above threshold, if any"""
+        query = self._normalize(question_vector)
+        now = time.monotonic()
+        with self.lock:
+            expired = [now - entry.created > self.ttl_seconds for entry in self.entries]
+            if any(expired):
+                self._remove([not e for e in expired])
+            if self.entries:
+                similarities = self.vectors @ query
+                similarities[[entry.scope != scope for entry in self.entries]] = -1
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry = self.entries[best]
+                    entry.last_used = now
+                    entry.hits += 1
+                    self.hits += 1
+                    logger.info(f"Answer cache hit (similarity={similarities[best]:.3f}) for earlier question: {entry.question}")
+                    return entry
+            self.misses += 1
+            return None
+
+    def add(self, question: str, question_vector: List[float], answer: str, citations: List[str], scope: str = ""):
+        """Cache the answer to question, evicting the least recently used answers beyond max_size"""
+        if self.max_size <= 0:
+            return
+        now = time.monotonic()
+        entry = CachedAnswer(question=question, answer=answer, citations=citations, scope=scope, created=now, last_used=now)
+        vector = self._normalize(question_vector)
+        with self.lock:
+            self.entries.append(entry)
+            self.vectors = np.vstack([self.vectors, vector[None, :]]) if len(self.vectors) else vector[None, :]
+            while len(self.entries) > self.max_size:
+                oldest = min(range(len(self.entries)), key=lambda i: self.entries[i].last_used)
+                self._remove([i != oldest for i in range(len(self.entries))])
+
+    def clear(self):
+        with self.lock:
+            self.entries, self.vectors = [], np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit, miss and invalidation counters of the cache"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+        }
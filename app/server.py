@@ -1,17 +1,24 @@
 import os
+import json
+import time
+import asyncio
 import logging
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from colorama import init, Fore
-from botocore.config import Config
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
 from utils import create_bedrock_client
 from fmbench_rag_setup import FMBenchRagSetup
-from fastapi import FastAPI, HTTPException
-from typing import List, Optional
+from conversation_store import create_conversation_store
+from agent_pool import AgentPool
+from fastapi import FastAPI, HTTPException, Request
+from typing import Any, List, Literal, Optional, Tuple
 from langchain_aws import ChatBedrockConverse
-from fastapi.responses import RedirectResponse
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from guardrails import BedrockGuardrailManager
 from langgraph.prebuilt import create_react_agent
 from langchain_core.messages import HumanMessage, SystemMessage
@@ -73,17 +80,50 @@ except Exception as e:
 
 # Global instance of the RAG setup
 _rag_system = None
-_react_agent = None
+_rag_system_lock = threading.Lock()
 _guardrail_id = None
 _guardrail_version = None
-_bedrock_client = None
+_guardrail_lock = threading.Lock()
+# Bedrock runtime client of each region, created on first use
+_bedrock_clients = {}
+_bedrock_clients_lock = threading.Lock()
+# Agents built once per (region, model id, guardrail version) and reused by later requests
+_agent_pool = AgentPool(max_size=int(os.environ.get("AGENT_POOL_SIZE", 8)))
+# Warm-up attempts before giving up (requests still set up lazily), the delay between attempts doubles
+WARMUP_MAX_ATTEMPTS = int(os.environ.get("WARMUP_MAX_ATTEMPTS", 3))
+WARMUP_RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", 30))
+# Time the Lambda init phase waits for the warm-up, Lambda allows ~10 s of init
+WARMUP_INIT_SECONDS = float(os.environ.get("WARMUP_INIT_SECONDS", 8))
+
+def _get_rag_system() -> FMBenchRagSetup:
+    """The RAG system, set up on first use (once, even when concurrent requests arrive together)"""
+    global _rag_system
+    with _rag_system_lock:
+        if _rag_system is None:
+            bedrock_role_arn = os.environ.get("BEDROCK_ROLE_ARN")
+            index_format = os.environ.get("INDEX_FORMAT", "faiss")
+            _rag_system = FMBenchRagSetup(
+                bedrock_role_arn=bedrock_role_arn,
+                index_format=index_format,
+                hybrid_search=os.environ.get("HYBRID_SEARCH", "false").lower() == "true",
+                answer_cache_size=int(os.environ.get("ANSWER_CACHE_SIZE", 0)),
+                context_budget_tokens=int(os.environ.get("CONTEXT_BUDGET_TOKENS", 0))
+            ).setup()
+    return _rag_system
+
+def _filters(content_type: Optional[str], directory: Optional[str], extension: Optional[str]) -> Optional[dict]:
+    filters = {field: value for field, value in
+               (("content_type", content_type), ("directory", directory), ("extension", extension)) if value}
+    return filters or None
 
 # ----------------------------
 # Tool Definition
 # ----------------------------
-@tool
-def get_fmbench_info(
-    question: str
+def _get_fmbench_info(
+    question: str,
+    content_type: Optional[str] = None,
+    directory: Optional[str] = None,
+    extension: Optional[str] = None
 ) -> str:
     """
     Retrieves information about Foundation Model Benchmarking Tool (FMBench) from official documentation.
@@ -92,26 +132,76 @@ def get_fmbench_info(
     Args:
         question: A clear, specific question about FMBench capabilities,
                  such as supported instance types, inference containers, metrics, or deployment options.
+        content_type: Optional, only search chunks of this type: yaml, markdown_with_code,
+                 markdown_with_headers or markdown.
+        directory: Optional, only search files under this directory, e.g. fmbench/configs for config files or docs for documentation.
+        extension: Optional, only search files with this extension, e.g. yml for config files, md or py.
                  
     Returns:
         A string containing the answer and additional context from the documentation.
     """
-    global _rag_system
-    
-    # Initialize the RAG system if it hasn't been set up yet
-    if _rag_system is None:
-        bedrock_role_arn = os.environ.get("BEDROCK_ROLE_ARN")
-        _rag_system = FMBenchRagSetup(bedrock_role_arn=bedrock_role_arn).setup()
-        
-    # Use the RAG system to answer the question
-    result = _rag_system.query(question)
-    return result
+    # Use the RAG system to answer the question, searching only the requested partitions
+    return _get_rag_system().query(question, filters=_filters(content_type, directory, extension))
+
+async def _aget_fmbench_info(
+    question: str,
+    content_type: Optional[str] = None,
+    directory: Optional[str] = None,
+    extension: Optional[str] = None
+) -> str:
+    # setting up loads the index, keep it off the event loop
+    rag_system = _rag_system if _rag_system is not None else await asyncio.to_thread(_get_rag_system)
+    return await rag_system.aquery(question, filters=_filters(content_type, directory, extension))
+
+# the agent awaits the coroutine when it is invoked with ainvoke, the function serves invoke
+get_fmbench_info = StructuredTool.from_function(
+    func=_get_fmbench_info,
+    coroutine=_aget_fmbench_info,
+    name="get_fmbench_info",
+)
 
 tools = [get_fmbench_info]
 
 # ----------------------------
 # Agent Setup
 # ----------------------------
+def _get_guardrail() -> Tuple[str, str]:
+    """Id and version of the guardrail, looked up (or created) once"""
+    global _guardrail_id
+    global _guardrail_version
+    with _guardrail_lock:
+        if _guardrail_id is None or _guardrail_version is None:
+            bedrock_role_arn = os.environ.get("BEDROCK_ROLE_ARN")
+            logger.info(f"bedrock_role_arn={bedrock_role_arn}")
+            # Basic usage with default configuration
+            manager = BedrockGuardrailManager(region="us-east-1", bedrock_role_arn=bedrock_role_arn)
+            _guardrail_id, _guardrail_version = manager.get_or_create_guardrail()
+            logger.info(f"guardrail_id={_guardrail_id}, guardrail_version={_guardrail_version}")
+    return _guardrail_id, _guardrail_version
+
+def _get_bedrock_client(region: str):
+    """Bedrock runtime client of the region, assuming BEDROCK_ROLE_ARN if set, created once"""
+    with _bedrock_clients_lock:
+        if region not in _bedrock_clients:
+            _bedrock_clients[region] = create_bedrock_client(os.environ.get("BEDROCK_ROLE_ARN"), "bedrock-runtime", region)
+        return _bedrock_clients[region]
+
+def _build_agent(region: str, model_id: str, guardrail_id: str, guardrail_version: str):
+    """ReAct agent answering with model_id in region behind the guardrail"""
+    model = ChatBedrockConverse(
+        client=_get_bedrock_client(region),
+        model=model_id,
+        guardrail_config={
+            "guardrailIdentifier": guardrail_id,
+            "guardrailVersion": guardrail_version,
+            "trace": "enabled"
+        },
+    )
+    return create_react_agent(model, tools)
+
+async def _get_agent(region: str, model_id: str, guardrail_id: str, guardrail_version: str):
+    return await _agent_pool.get((region, model_id, guardrail_version),
+                                 lambda: _build_agent(region, model_id, guardrail_id, guardrail_version))
 SYSTEM_PROMPT = (
     "You are a helpful technical assistant for the Foundation Model Benchmarking Tool (FMBench). "
     "Use the available tools to answer user questions about model benchmarking, configurations, and deployment options. " 
@@ -123,7 +213,9 @@ SYSTEM_PROMPT = (
     "FMBench documentation: https://aws-samples.github.io/foundation-model-benchmarking-tool/ "
     "FMBench configuration files: https://github.com/aws-samples/foundation-model-benchmarking-tool/tree/main/fmbench/configs")
 
-conversation_memory = {}
+# Message history of each conversation thread, bounded so a long-lived server does not grow forever.
+# CONVERSATION_BACKEND=sqlite or redis shares it across workers so a follow-up can land on any of them.
+conversation_memory = create_conversation_store()
 class GenerateRequest(BaseModel):
     question: str = Field(..., description="The question to answer")
     region: str = Field(default="us-east-1", description="AWS region for Bedrock")
@@ -135,6 +227,14 @@ class GenerateRequest(BaseModel):
         default=0, 
         description="Conversation thread ID for maintaining chat history"
     )
+    response_mode: Literal["full", "turn"] = Field(
+        default="full",
+        description="full returns every message of the thread, turn only the question and the messages the agent added for it"
+    )
+    since: Optional[int] = Field(
+        default=None,
+        description="Return the messages of the thread from this position on, the cursor of an earlier response; overrides response_mode"
+    )
 
 class MessageOutput(BaseModel):
     role: str = Field(..., description="Role of the message sender (system, human, ai)")
@@ -142,12 +242,176 @@ class MessageOutput(BaseModel):
 
 class GenerateResponse(BaseModel):
     result: List[MessageOutput] = Field(..., description="List of messages in the conversation")
+    cursor: int = Field(..., description="Number of messages in the thread, pass it as since to get only the messages of later turns")
+
+
+# ----------------------------
+# Warm-up
+# ----------------------------
+async def _warm_up(app: FastAPI):
+    """
+    Do what the first request would otherwise pay for: load the index (RAG setup), look up the guardrail,
+    create the Bedrock client and build the agent of the default model. The RAG setup runs alongside the
+    other steps. Timings of each step go to app.state.startup, a failure is recorded and requests set up lazily.
+    """
+    startup = app.state.startup
+    if startup["status"] == "ready":
+        return
+    timings = {}
+    startup.update(status="warming", attempts=startup["attempts"] + 1, timings_ms=timings, error=None)
+    region = GenerateRequest.model_fields["region"].default
+    model_id = GenerateRequest.model_fields["response_model_id"].default
+    start = time.perf_counter()
+
+    async def timed(step: str, func, *args):
+        step_start = time.perf_counter()
+        result = await asyncio.to_thread(func, *args)
+        timings[step] = round((time.perf_counter() - step_start) * 1000, 1)
+        return result
+
+    async def warm_agent():
+        guardrail_id, guardrail_version = await timed("guardrail", _get_guardrail)
+        await timed("bedrock_client", _get_bedrock_client, region)
+        step_start = time.perf_counter()
+        await _get_agent(region, model_id, guardrail_id, guardrail_version)
+        timings["agent"] = round((time.perf_counter() - step_start) * 1000, 1)
 
+    try:
+        await asyncio.gather(timed("rag_system", _get_rag_system), warm_agent())
+        startup["status"] = "ready"
+    except Exception as e:
+        logger.error(f"Warm-up attempt {startup['attempts']} of {WARMUP_MAX_ATTEMPTS} failed, "
+                     f"requests will set up on first use: {str(e)}", exc_info=True)
+        startup.update(status="failed", error=str(e))
+    timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(f"Warm-up {startup['status']} in {timings['total']:.0f} ms: " +
+                ", ".join(f"{step}={ms:.0f} ms" for step, ms in timings.items() if step != "total"))
+
+async def _warm_up_with_retries(app: FastAPI):
+    """Warm up until it succeeds or WARMUP_MAX_ATTEMPTS attempts failed, the wait doubles after each failure"""
+    startup = app.state.startup
+    while True:
+        await _warm_up(app)
+        if startup["status"] == "ready" or startup["attempts"] >= WARMUP_MAX_ATTEMPTS:
+            return
+        await asyncio.sleep(WARMUP_RETRY_SECONDS * 2 ** (startup["attempts"] - 1))
+
+def _start_warm_up(app: FastAPI) -> Optional[asyncio.Task]:
+    """
+    Warm up (with retries) in the background, unless the warm-up is already running, has succeeded or is
+    out of attempts. Returns the running warm-up task, if any.
+    """
+    task = app.state.warm_up_task
+    if task is not None and not task.done():
+        return task
+    startup = app.state.startup
+    if startup["status"] == "ready" or startup["attempts"] >= WARMUP_MAX_ATTEMPTS:
+        return None
+    app.state.warm_up_task = asyncio.create_task(_warm_up_with_retries(app))
+    return app.state.warm_up_task
+
+async def _warm_up_within(app: FastAPI, seconds: float):
+    """Start the warm-up and wait at most seconds for it, it carries on in the background after that"""
+    task = _start_warm_up(app)
+    if task is not None:
+        await asyncio.wait({task}, timeout=seconds)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm up in the background when the server starts, so /ready can report it. Mangum runs the lifespan
+    around every Lambda invocation, there the warm-up started in the init phase (and its retries) keeps
+    running on the event loop Mangum reuses between invocations and is never awaited by a request.
+    """
+    if os.environ.get("WARMUP", "true").lower() == "true":
+        _start_warm_up(app)
+    yield
+    task = app.state.warm_up_task
+    if not inside_lambda and task is not None and not task.done():
+        task.cancel()
 
 # ----------------------------
 # FastAPI App Initialization
 # ----------------------------
-app = FastAPI(title="Foundation Model Benchmarking Tool (FMBench) Assistant", root_path="/prod")
+app = FastAPI(title="Foundation Model Benchmarking Tool (FMBench) Assistant", root_path="/prod", lifespan=lifespan)
+# Progress and timing of the warm-up run before traffic arrives, reported by /ready
+app.state.startup = {"status": "pending", "attempts": 0, "timings_ms": {}, "error": None}
+app.state.warm_up_task = None
+
+
+class StreamExemptGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that never compresses the routes in exclude_paths. Starlette releases that do not
+    exclude text/event-stream would buffer a server-sent event stream until enough bytes are compressed.
+    """
+
+    def __init__(self, app: Any, exclude_paths: Tuple[str, ...] = (), **kwargs):
+        super().__init__(app, **kwargs)
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# compress JSON responses when the client accepts gzip, server-sent events are left uncompressed
+app.add_middleware(StreamExemptGZipMiddleware, minimum_size=1000, exclude_paths=("/generate/stream",))
+
+async def _prepare_conversation(request: GenerateRequest) -> Tuple[Any, list]:
+    """
+    The agent for the model and region of the request (built on first use, then taken from the pool) and
+    the messages of the conversation of the request with its question appended.
+    """
+    body = request.model_dump()
+    logger.debug(f"Request body: {body}")
+    # Extract parameters from the validated request model
+    question = body.get('question')
+    thread_id = body.get('thread_id')
+    region = body.get('region')
+    model_id = body.get('response_model_id')
+
+    # create guardrails if not created already (by the warm-up), boto3 calls block, keep them off the event loop
+    if _guardrail_id is None or _guardrail_version is None:
+        await asyncio.to_thread(_get_guardrail)
+    agent = await _get_agent(region, model_id, _guardrail_id, _guardrail_version)
+
+    # Retrieve conversation memory, empty for a new (or expired) thread
+    messages = await asyncio.to_thread(conversation_memory.get, thread_id)
+    if not messages:
+        messages.append(SystemMessage(content=SYSTEM_PROMPT))
+    messages.append(HumanMessage(content=question))
+    return agent, messages
+
+def _format_outputs(messages: list) -> List[dict]:
+    return [
+        {
+            "role": msg.__class__.__name__.lower().replace("message", ""),
+            "content": msg.content
+        }
+        for msg in messages
+    ]
+
+def _response(request: GenerateRequest, messages: list, turn_start: int) -> dict:
+    """
+    Body of a response: the messages the request asked for and the cursor of the thread. turn_start is the
+    position of the question of this turn, a cursor past it (history expired meanwhile) still gets the turn.
+    """
+    if request.since is not None:
+        start = min(max(request.since, 0), turn_start)
+    else:
+        start = turn_start if request.response_mode == "turn" else 0
+    return {"result": _format_outputs(messages[start:]), "cursor": len(messages)}
+
+def _chunk_text(content) -> str:
+    """Text of a streamed message chunk, Bedrock Converse streams a list of content blocks"""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict) and block.get("type") == "text")
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @app.post("/generate")
 async def generate_answer(request: GenerateRequest):
@@ -157,83 +421,83 @@ async def generate_answer(request: GenerateRequest):
     This endpoint processes natural language questions and returns AI-generated responses.
     It maintains conversation history using thread_id and leverages AWS Bedrock models.
     """
-    global _react_agent
-    global _guardrail_id
-    global _guardrail_version
-    global _bedrock_client
-    
     logger.info(f"Received request: {request}")
     try:
-        body = request.model_dump()
-        print(f"Request body: {body}")
-        # Extract parameters from the validated request model
-        question = body.get('question')
-        thread_id = body.get('thread_id')
-        region = body.get('region')
-        model_id = body.get('response_model_id')
-        
-        # Initialize or retrieve conversation memory
-        if thread_id not in conversation_memory:
-            conversation_memory[thread_id] = []
-        
-        # Set up Bedrock client and model
-        config = Config(
-            retries = {
-                'max_attempts': 10,
-                'mode': 'adaptive'
-            }
-        )
-
-        # create guardrails if not created already 
-        bedrock_role_arn = os.environ.get("BEDROCK_ROLE_ARN")
-        logger.info(f"bedrock_role_arn={bedrock_role_arn}")
-        if _guardrail_id is None or _guardrail_version is None:
-            # Basic usage with default configuration
-            manager = BedrockGuardrailManager(region="us-east-1", bedrock_role_arn=bedrock_role_arn)
-            _guardrail_id, _guardrail_version = manager.get_or_create_guardrail()
-        
-        guardrail_config = {
-            "guardrailIdentifier": _guardrail_id,
-            "guardrailVersion": _guardrail_version,
-            "trace": "enabled"
-        }
-        logger.info(f"guardrail_config={guardrail_config}")
-
-        if _bedrock_client is None:
-            _bedrock_client = create_bedrock_client(bedrock_role_arn, "bedrock-runtime", region)
-        model = ChatBedrockConverse(
-            client=_bedrock_client,
-            model=model_id,
-            guardrail_config=guardrail_config,
-        )
-        
-        # Create the agent executor
-        if _react_agent is None:
-            _react_agent = create_react_agent(model, tools)
-
-        messages = conversation_memory[thread_id]
-        if not messages:
-            messages.append(SystemMessage(content=SYSTEM_PROMPT))
-        messages.append(HumanMessage(content=question))
-
-        response = _react_agent.invoke({"messages": messages})
-        logger.info(response["messages"])
-        conversation_memory[request.thread_id] = response["messages"]
+        agent, messages = await _prepare_conversation(request)
+        turn_start = len(messages) - 1
+
+        # awaited end to end (agent, tool, retrieval and generation), so requests overlap on one worker
+        response = await agent.ainvoke({"messages": messages})
+        logger.info(response["messages"][turn_start:])
+        await asyncio.to_thread(conversation_memory.put, request.thread_id, response["messages"])
 
         # Format the output
-        outputs = [
-            {
-                "role": msg.__class__.__name__.lower().replace("message", ""),
-                "content": msg.content
-            }
-            for msg in response["messages"]
-        ]
-        return {"result": outputs}
+        return _response(request, response["messages"], turn_start)
 
     except Exception as e:
         logger.error(f"Error in agent processing: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate/stream")
+async def generate_answer_stream(request: GenerateRequest):
+    """
+    Same as /generate, streamed as server-sent events while the agent runs:
+    - token: {"content": ...} text of the answer as the model generates it
+    - tool: {"name": ..., "status": "start" | "end"} when the agent calls a tool and when the tool returns
+    - done: {"result": [...], "cursor": ...} the messages selected by response_mode and since, as returned by /generate
+    - error: {"detail": ...} if the agent failed, nothing follows
+    """
+    logger.info(f"Received streaming request: {request}")
+
+    async def events():
+        try:
+            agent, messages = await _prepare_conversation(request)
+            turn_start = len(messages) - 1
+            result = None
+            async for event in agent.astream_events({"messages": messages}, version="v2"):
+                kind = event["event"]
+                if kind == "on_chat_model_stream" and event["metadata"].get("langgraph_node") == "agent":
+                    # tokens of the agent's model, the model answering inside the tool is not streamed
+                    text = _chunk_text(event["data"]["chunk"].content)
+                    if text:
+                        yield _sse("token", {"content": text})
+                elif kind in ("on_tool_start", "on_tool_end"):
+                    yield _sse("tool", {"name": event["name"], "status": "start" if kind == "on_tool_start" else "end"})
+                elif kind == "on_chain_end" and not event["parent_ids"]:
+                    result = event["data"]["output"]
+            logger.info(result["messages"][turn_start:])
+            await asyncio.to_thread(conversation_memory.put, request.thread_id, result["messages"])
+            yield _sse("done", _response(request, result["messages"], turn_start))
+        except Exception as e:
+            logger.error(f"Error in agent processing: {str(e)}", exc_info=True)
+            yield _sse("error", {"detail": str(e)})
+
+    # no-cache and no buffering so proxies pass events through as they are produced
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """Hit and miss counters of the retrieval caches of the RAG system, empty until the first question"""
+    return _rag_system.cache_stats() if _rag_system is not None else {}
+
+@app.get("/conversation-stats")
+async def conversation_stats():
+    """Live conversation threads, their approximate size in bytes and evictions by reason"""
+    return await asyncio.to_thread(conversation_memory.stats)
+
+@app.get("/agent-pool-stats")
+async def agent_pool_stats():
+    """Agents in the pool, their keys, and hits, misses (builds), waits and evictions"""
+    return _agent_pool.stats()
+
+@app.get("/ready")
+async def ready(request: Request):
+    """200 once the warm-up has loaded the index and built the default agent, 503 before or if it failed"""
+    startup = request.app.state.startup
+    return JSONResponse(status_code=200 if startup["status"] == "ready" else 503,
+                        content={"ready": startup["status"] == "ready", **startup, "max_attempts": WARMUP_MAX_ATTEMPTS})
+
 @app.get("/docs")
 async def redirect_root_to_docs():
     RedirectResponse("/docs")
@@ -254,6 +518,13 @@ if not inside_lambda:
         print("FMBench Assistant app loaded successfully")
 else:
     logger.info(f"running inside a Lambda")
+    # the init phase runs before the first invocation (with a full CPU), warm up there. Mangum runs every
+    # invocation on this thread's event loop, so a warm-up that outlasts the init budget carries on during
+    # the first invocations instead of holding up (or timing out) the init phase
+    if os.environ.get("WARMUP", "true").lower() == "true":
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(_warm_up_within(app, WARMUP_INIT_SECONDS))
     # Lambda Handler for AWS Lambda deployment
     from mangum import Mangum
     handler = Mangum(
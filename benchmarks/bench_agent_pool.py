@@ -0,0 +1,88 @@
+"""
+Per-request overhead of getting the agent for /generate, before any model call: building the Bedrock
+client, the ChatBedrockConverse model and the ReAct agent on every request (what honouring the request's
+model without a pool costs), building only the model and reusing the first agent (the old server, which
+ignored the model), and a lookup in the agent pool. Nothing is sent to AWS: creating the clients and
+models does not call Bedrock.
+
+    python benchmarks/bench_agent_pool.py --runs 200
+"""
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+import server
+from agent_pool import AgentPool
+
+MODELS = [
+    "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    "us.anthropic.claude-3-5-sonnet-20241022-v2:0",
+    "us.amazon.nova-pro-v1:0",
+]
+GUARDRAIL = ("benchmark-guardrail", "1")
+
+
+def build_model(client, model_id: str):
+    return server.ChatBedrockConverse(
+        client=client,
+        model=model_id,
+        guardrail_config={"guardrailIdentifier": GUARDRAIL[0], "guardrailVersion": GUARDRAIL[1], "trace": "enabled"},
+    )
+
+
+def build_everything(region: str, model_id: str):
+    client = server.create_bedrock_client(None, "bedrock-runtime", region)
+    return server.create_react_agent(build_model(client, model_id), server.tools)
+
+
+def measure(fn, runs: int):
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        fn(MODELS[i % len(MODELS)])
+        latencies.append(time.perf_counter() - start)
+    return np.percentile(latencies, [50, 99]) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-request cost of getting the agent for /generate")
+    parser.add_argument("--runs", type=int, default=200, help="Number of requests per measurement")
+    parser.add_argument("--region", type=str, default="us-east-1", help="AWS region of the Bedrock clients")
+    args = parser.parse_args()
+
+    # the first boto3 client loads the service model from disk, keep it out of the measurements
+    client = server.create_bedrock_client(None, "bedrock-runtime", args.region)
+    first_agent = server.create_react_agent(build_model(client, MODELS[0]), server.tools)
+
+    def old_server(model_id):
+        build_model(client, model_id)
+        return first_agent
+
+    pool = AgentPool(max_size=len(MODELS))
+    loop = asyncio.new_event_loop()
+
+    def pooled(model_id):
+        return loop.run_until_complete(pool.get((args.region, model_id, GUARDRAIL[1]),
+                                                lambda: build_everything(args.region, model_id)))
+
+    # fill the pool, these builds are paid once per key
+    for model_id in MODELS:
+        pooled(model_id)
+
+    print(f"{'per request':<40} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, fn in [("client + model + agent", lambda model_id: build_everything(args.region, model_id)),
+                     ("model only, first agent (old server)", old_server),
+                     ("agent pool hit", pooled)]:
+        p50, p99 = measure(fn, args.runs)
+        print(f"{name:<40} {p50:>10.3f} {p99:>10.3f}")
+    print(pool.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Recall/latency benchmark of the FAISS index types selectable with build_index.py --index-spec. The vectors
+come from an existing (flat) index, or are generated with --synthetic. Queries are perturbed copies of
+indexed vectors, and recall@k is measured against exact flat search.
+
+    python benchmarks/bench_ann.py --vector-db-path indexes/fmbench_index
+    python benchmarks/bench_ann.py --synthetic 100000 --dim 1024 --specs flat hnsw "ivf_pq:nprobe=16"
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ann_index import IndexSpec, build_index, reconstruct_all
+
+DEFAULT_SPECS = ["flat", "hnsw", "hnsw:ef_search=128", "ivf_flat", "ivf_pq", "sq8", "sq_fp16"]
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.synthetic:
+        return np.random.default_rng(0).standard_normal((args.synthetic, args.dim), dtype=np.float32)
+    import faiss
+    return reconstruct_all(faiss.read_index(str(Path(args.vector_db_path) / "index.faiss")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall and latency of the selectable ANN index types")
+    parser.add_argument("--vector-db-path", type=str, default="indexes/fmbench_index",
+                        help="Path of the FAISS index to take the vectors from")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Use this many random vectors instead of an existing index")
+    parser.add_argument("--dim", type=int, default=1024, help="Dimension of the synthetic vectors")
+    parser.add_argument("--specs", nargs="+", default=DEFAULT_SPECS, help="Index specs to benchmark")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=10, help="Number of neighbors retrieved per query")
+    args = parser.parse_args()
+
+    import faiss
+    vectors = load_vectors(args)
+    rng = np.random.default_rng(1)
+    sample = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+    queries = (sample + 0.1 * sample.std() * rng.standard_normal(sample.shape)).astype(np.float32)
+    k = min(args.k, len(vectors))
+    _, truth = build_index(IndexSpec(), vectors).search(queries, k)
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, {len(queries)} queries, k={k}")
+
+    print(f"{'spec':<24}{'build s':>9}{'size MB':>9}{'p50 ms':>9}{'p99 ms':>9}{'recall@k':>10}")
+    for spec_str in args.specs:
+        spec = IndexSpec.parse(spec_str)
+        start = time.perf_counter()
+        index = build_index(spec, vectors)
+        build_s = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            _, found = index.search(query[None, :], k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(found[0]) & set(expected))
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+        recall = hits / (len(queries) * k)
+        print(f"{str(spec):<24}{build_s:>9.2f}{size_mb:>9.1f}{p50:>9.3f}{p99:>9.3f}{recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of the content classifier (document_pipeline.classify_content) against the
+previous content type detection logic, on large documents built by concatenating the corpus documents
+of each content type.
+
+    python benchmarks/bench_classifier.py --repeat 20 --scale 20
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+from collections import defaultdict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from document_pipeline import classify_content, iter_json_array
+
+
+def legacy_classify(content: str, source: str = ""):
+    """Content type detection as it was done before classify_content, kept here for comparison"""
+    metadata = {}
+    if content.strip().startswith('---') or '.yaml' in source.lower() or '.yml' in source.lower():
+        metadata['content_type'] = 'yaml'
+        content = '\n'.join(line for line in content.splitlines())
+    elif '```' in content:
+        metadata['content_type'] = 'markdown_with_code'
+        code_blocks = content.count('```')
+        metadata['code_blocks_count'] = code_blocks // 2
+    elif any(heading.startswith('#') for heading in content.splitlines()):
+        metadata['content_type'] = 'markdown_with_headers'
+        max_heading_level = max(
+            (len(line.split()[0]) for line in content.splitlines() if line.startswith('#')),
+            default=0
+        )
+        metadata['max_heading_level'] = max_heading_level
+    else:
+        metadata['content_type'] = 'markdown'
+    return content, metadata
+
+
+def timed(fn, content: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(content)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the content classifier")
+    parser.add_argument("--data-file", type=str, default="data/documents_1.json",
+                        help="Path to the JSON data file containing documents")
+    parser.add_argument("--scale", type=int, default=20,
+                        help="Number of times the documents of each type are repeated to build a large document")
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="Number of timed runs per document")
+    args = parser.parse_args()
+
+    # Check both implementations agree on every document of the corpus
+    by_type = defaultdict(list)
+    mismatches = 0
+    for doc in iter_json_array(args.data_file):
+        legacy_content, legacy_metadata = legacy_classify(doc["content"])
+        content, stats = classify_content(doc["content"])
+        if content != legacy_content or any(stats.get(k) != v for k, v in legacy_metadata.items()):
+            mismatches += 1
+        by_type[legacy_metadata["content_type"]].append(doc["content"])
+    print(f"documents with a different result from the legacy logic: {mismatches}")
+
+    print(f"{'content type':<24}{'size MB':>9}{'legacy ms':>12}{'classifier ms':>16}{'speedup':>9}")
+    for content_type, contents in sorted(by_type.items()):
+        big = "\n".join(contents) * args.scale
+        legacy_s = timed(legacy_classify, big, args.repeat)
+        new_s = timed(classify_content, big, args.repeat)
+        print(f"{content_type:<24}{len(big) / 1e6:>9.1f}{legacy_s * 1e3:>12.1f}{new_s * 1e3:>16.1f}{legacy_s / new_s:>8.2f}x")
+    corpus = [content for contents in by_type.values() for content in contents] * args.scale
+    legacy_s = sum(timed(legacy_classify, content, args.repeat) for content in corpus)
+    new_s = sum(timed(classify_content, content, args.repeat) for content in corpus)
+    size = sum(len(content) for content in corpus)
+    print(f"{'whole corpus (per doc)':<24}{size / 1e6:>9.1f}{legacy_s * 1e3:>12.1f}{new_s * 1e3:>16.1f}{legacy_s / new_s:>8.2f}x")
+    print("note: classify_content also computes the doc_* structure stats, which the legacy logic did not; on "
+          "code documents, where the legacy logic only counted fences, these stats are most of its time")
+
+
+if __name__ == "__main__":
+    main()
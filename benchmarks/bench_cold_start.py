@@ -0,0 +1,76 @@
+"""
+Cold-start benchmark of the FAISS (pickled docstore) index format against the memory-mappable format.
+Every run happens in a fresh Python process, like a Lambda cold start, and measures the time to open
+the index, the time of the first query (search + decoding the text of the hits) and the peak RSS.
+A random query vector is used so no Bedrock call is needed.
+
+    python build_index.py --index-format mmap   # or: python convert_index.py
+    python benchmarks/bench_cold_start.py --runs 5
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = r"""
+import sys, json, time, resource
+sys.path.insert(0, {repo_root!r})
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from mmap_index import MmapVectorStore
+fmt, path, k = {fmt!r}, {path!r}, {k}
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+start = time.perf_counter()
+if fmt == "faiss":
+    store = FAISS.load_local(path, None, allow_dangerous_deserialization=True)
+    dim = store.index.d
+else:
+    store = MmapVectorStore.load(path)
+    dim = store.dimension
+load_s = time.perf_counter() - start
+
+query = np.random.default_rng(0).random(dim, dtype=np.float32).tolist()
+start = time.perf_counter()
+hits = store.similarity_search_with_score_by_vector(query, k=k)
+chars = sum(len(doc.page_content) for doc, _ in hits)
+query_s = time.perf_counter() - start
+
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"load_s": load_s, "query_s": query_s, "hits": len(hits), "chars": chars,
+                  "rss_delta_mb": (rss_after - rss_before) / 1024}}))
+"""
+
+
+def run_once(fmt: str, path: str, k: int) -> dict:
+    code = CHILD.format(repo_root=str(REPO_ROOT), fmt=fmt, path=path, k=k)
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark index cold start: FAISS pickle vs memory-mappable format")
+    parser.add_argument("--faiss-path", type=str, default="indexes/fmbench_index",
+                        help="Path of the index saved with FAISS.save_local")
+    parser.add_argument("--mmap-path", type=str, default=None,
+                        help="Path of the memory-mappable index, defaults to --faiss-path")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh processes per format")
+    parser.add_argument("--k", type=int, default=10, help="Number of hits retrieved by the first query")
+    args = parser.parse_args()
+
+    paths = {"faiss": args.faiss_path, "mmap": args.mmap_path or args.faiss_path}
+    print(f"{'format':<8}{'open ms':>10}{'first query ms':>16}{'total ms':>10}{'RSS delta MB':>14}")
+    for fmt, path in paths.items():
+        runs = [run_once(fmt, path, args.k) for _ in range(args.runs)]
+        load_ms = statistics.median(r["load_s"] for r in runs) * 1e3
+        query_ms = statistics.median(r["query_s"] for r in runs) * 1e3
+        rss_mb = statistics.median(r["rss_delta_mb"] for r in runs)
+        print(f"{fmt:<8}{load_ms:>10.1f}{query_ms:>16.1f}{load_ms + query_ms:>10.1f}{rss_mb:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Load test of the /generate endpoint of a running server: sends concurrent requests and reports how much
+they overlap. With the async path, one uvicorn worker serves several requests at once, so the wall time
+is well below requests x the latency of a request served alone (overlap close to the concurrency).
+
+    python app/server.py
+    python benchmarks/bench_concurrency.py --url http://localhost:8000/generate --requests 16 --concurrency 8
+"""
+import json
+import time
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+QUESTIONS = [
+    "Which instance types does FMBench support?",
+    "How do I benchmark a model deployed on Amazon Bedrock?",
+    "What metrics does FMBench report for latency and cost?",
+    "How do I run FMBench on EKS?",
+]
+
+
+def post(url: str, question: str, thread_id: int, timeout: float):
+    """Send one request, return its start and end times"""
+    payload = json.dumps({"question": question, "thread_id": thread_id}).encode("utf-8")
+    request = urllib.request.Request(url, data=payload, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+    return start, time.perf_counter()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /generate endpoint with concurrent requests")
+    parser.add_argument("--url", type=str, default="http://localhost:8000/generate", help="URL of the /generate endpoint")
+    parser.add_argument("--requests", type=int, default=16, help="Number of requests sent")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of requests in flight at a time")
+    parser.add_argument("--baseline", type=int, default=3, help="Number of requests sent one at a time to measure the latency alone")
+    parser.add_argument("--timeout", type=float, default=300, help="Timeout of a request in seconds")
+    args = parser.parse_args()
+
+    # first request sets the RAG system up, then the latency of requests served alone
+    post(args.url, QUESTIONS[0], 999, args.timeout)
+    alone = np.median([end - begin for begin, end in
+                       (post(args.url, QUESTIONS[i % len(QUESTIONS)], 900 + i, args.timeout) for i in range(args.baseline))])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        # a thread id per request so conversations do not share history
+        futures = [executor.submit(post, args.url, QUESTIONS[i % len(QUESTIONS)], 1000 + i, args.timeout)
+                   for i in range(args.requests)]
+        spans = [future.result() for future in futures]
+    wall = time.perf_counter() - start
+
+    latencies = np.asarray([end - begin for begin, end in spans])
+    print(f"{args.requests} requests, concurrency {args.concurrency}")
+    print(f"latency alone      {alone:8.2f} s")
+    print(f"latency p50 / p99  {np.percentile(latencies, 50):8.2f} / {np.percentile(latencies, 99):.2f} s")
+    print(f"wall time          {wall:8.2f} s ({args.requests * alone:.2f} s if served one at a time)")
+    print(f"overlap            {args.requests * alone / wall:8.2f}x (1.00x means requests were served one at a time)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Latency of hybrid retrieval on a built index: BM25 search, dense search and the whole FMBenchRetriever
+(fusion, reranking, MMR re-selection and decoding the returned chunks). Stored vectors stand in for question embeddings so no Bedrock
+call is made and only the local work is measured.
+
+    python build_index.py
+    python benchmarks/bench_hybrid.py --vector-db-path indexes/fmbench_index
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from langchain_community.vectorstores import FAISS
+from ann_index import reconstruct_all
+from lexical_index import BM25Index
+from reranker import LexicalReranker
+from retrieval import FMBenchRetriever, search_vectors
+
+QUESTIONS = [
+    "which instance types does FMBench support",
+    "g5.2xlarge",
+    "config-llama3-8b-inf2.yml",
+    "how do I benchmark a model deployed on Amazon Bedrock",
+    "what metrics does FMBench report for latency and cost",
+    "how to run FMBench on EKS",
+]
+
+
+class StoredVectorEmbeddings:
+    """Returns a stored vector for every question, in turn"""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors, self.calls = vectors, 0
+
+    def embed_query(self, text: str):
+        self.calls += 1
+        return self.vectors[self.calls % len(self.vectors)].tolist()
+
+
+def percentiles(fn, questions, runs: int):
+    latencies = []
+    for i in range(runs):
+        question = questions[i % len(questions)]
+        start = time.perf_counter()
+        fn(question)
+        latencies.append(time.perf_counter() - start)
+    return np.percentile(latencies, [50, 99]) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the latency of hybrid BM25 + dense retrieval")
+    parser.add_argument("--vector-db-path", type=str, default="indexes/fmbench_index",
+                        help="Path of the index built with build_index.py")
+    parser.add_argument("--runs", type=int, default=500, help="Number of queries per measurement")
+    parser.add_argument("--k", type=int, default=10, help="Number of documents returned")
+    parser.add_argument("--fetch-k", type=int, default=50, help="Number of dense and BM25 hits fused")
+    args = parser.parse_args()
+
+    vectorstore = FAISS.load_local(args.vector_db_path, None, allow_dangerous_deserialization=True)
+    lexical_index = BM25Index.load(args.vector_db_path)
+    if lexical_index is None:
+        raise SystemExit(f"No BM25 index in {args.vector_db_path}, rebuild it with build_index.py")
+    embeddings = StoredVectorEmbeddings(reconstruct_all(vectorstore.index))
+    query_vector = embeddings.embed_query("")
+    print(f"{len(lexical_index)} chunks, {len(lexical_index.terms)} terms, k={args.k}, fetch_k={args.fetch_k}")
+
+    retrievers = {
+        "dense only": FMBenchRetriever(vectorstore=vectorstore, embeddings=embeddings, k=args.k),
+        "hybrid (RRF)": FMBenchRetriever(vectorstore=vectorstore, embeddings=embeddings, lexical_index=lexical_index,
+                                         k=args.k, fetch_k=args.fetch_k),
+        "hybrid + MMR": FMBenchRetriever(vectorstore=vectorstore, embeddings=embeddings, lexical_index=lexical_index,
+                                         k=args.k, fetch_k=args.fetch_k, mmr_lambda=0.7, merge_overlaps=True),
+        "hybrid + rerank": FMBenchRetriever(vectorstore=vectorstore, embeddings=embeddings, lexical_index=lexical_index,
+                                            k=args.k, fetch_k=args.fetch_k, reranker=LexicalReranker(lexical_index=lexical_index),
+                                            rerank_fanout_k=args.fetch_k),
+    }
+    print(f"{'stage':<28}{'p50 ms':>9}{'p99 ms':>9}")
+    for name, fn in [("bm25 search", lambda q: lexical_index.search(q, args.fetch_k)),
+                     ("dense search", lambda q: search_vectors(vectorstore, query_vector, args.fetch_k))]:
+        p50, p99 = percentiles(fn, QUESTIONS, args.runs)
+        print(f"{name:<28}{p50:>9.3f}{p99:>9.3f}")
+    for name, retriever in retrievers.items():
+        p50, p99 = percentiles(retriever.invoke, QUESTIONS, args.runs)
+        print(f"{'retriever, ' + name:<28}{p50:>9.3f}{p99:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
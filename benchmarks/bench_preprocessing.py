@@ -0,0 +1,75 @@
+"""
+Compare serial and process pool throughput of the preprocessing stage (content type tagging and
+splitting) on the documents file and on a synthetic corpus made of N copies of it.
+
+    python benchmarks/bench_preprocessing.py --workers 8 --scale 100
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from document_pipeline import iter_chunks, iter_json_array
+
+
+def write_synthetic_corpus(data_file: str, scale: int, out_path: str):
+    """Write scale copies of the documents file to out_path, paths are made unique per copy"""
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        first = True
+        for i in range(scale):
+            for doc in iter_json_array(data_file):
+                doc = dict(doc, path=f"copy{i}/{doc['path']}")
+                f.write(("" if first else ",") + json.dumps(doc))
+                first = False
+        f.write("]")
+
+
+def run(data_file: str, workers: int, docs_per_task: int):
+    """Return (seconds, chunk count, characters, chunk fingerprints) for one preprocessing run"""
+    start = time.perf_counter()
+    chunks, chars, fingerprint = 0, 0, []
+    for chunk in iter_chunks(data_file, workers=workers, docs_per_task=docs_per_task):
+        chunks += 1
+        chars += len(chunk.page_content)
+        fingerprint.append(hash((chunk.page_content, json.dumps(chunk.metadata, sort_keys=True))))
+    return time.perf_counter() - start, chunks, chars, fingerprint
+
+
+def compare(label: str, data_file: str, workers: int, docs_per_task: int):
+    size_mb = os.path.getsize(data_file) / 1e6
+    serial_s, chunks, chars, serial_fp = run(data_file, 1, docs_per_task)
+    parallel_s, _, _, parallel_fp = run(data_file, workers, docs_per_task)
+    print(f"{label}: {size_mb:.1f} MB, {chunks} chunks, {chars / 1e6:.1f}M characters")
+    print(f"  serial             : {serial_s:8.2f}s  {chunks / serial_s:10.0f} chunks/s  {size_mb / serial_s:8.1f} MB/s")
+    print(f"  parallel ({workers:2d} procs): {parallel_s:8.2f}s  {chunks / parallel_s:10.0f} chunks/s  "
+          f"{size_mb / parallel_s:8.1f} MB/s  speedup {serial_s / parallel_s:.2f}x")
+    print(f"  identical output   : {serial_fp == parallel_fp}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serial vs process pool document preprocessing")
+    parser.add_argument("--data-file", type=str, default="data/documents_1.json",
+                        help="Path to the JSON data file containing documents")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes for the parallel run")
+    parser.add_argument("--docs-per-task", type=int, default=4,
+                        help="Number of documents sent to a worker at a time")
+    parser.add_argument("--scale", type=int, default=100,
+                        help="Number of copies of the documents file in the synthetic corpus")
+    args = parser.parse_args()
+
+    print(f"cpu count={os.cpu_count()}, workers={args.workers}, docs per task={args.docs_per_task}")
+    compare(args.data_file, args.data_file, args.workers, args.docs_per_task)
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic = os.path.join(tmp, f"documents_x{args.scale}.json")
+        write_synthetic_corpus(args.data_file, args.scale, synthetic)
+        compare(f"synthetic {args.scale}x corpus", synthetic, args.workers, args.docs_per_task)
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,31 @@ def main():
     parser.add_argument("--bedrock-role-arn", type=str, 
                         default="arn:aws:iam::605134468121:role/BedrockCrossAccount2",
                         help="ARN of the IAM role to assume for Bedrock cross-account access")
+    parser.add_argument("--index-spec", type=str, default="flat",
+                        help="FAISS index type and parameters: flat, hnsw, ivf_flat, ivf_pq, sq8 or sq_fp16, "
+                             "optionally with parameters e.g. 'hnsw:m=32,ef_search=128' or 'ivf_flat:nlist=64,nprobe=8'")
+    parser.add_argument("--index-format", type=str, default="faiss", choices=["faiss", "mmap"],
+                        help="Also write the memory-mappable index format (mmap) next to the FAISS index")
+    parser.add_argument("--mmap-dtype", type=str, default="float32", choices=["float32", "float16"],
+                        help="Storage dtype of the vectors in the memory-mappable index format")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Maximum number of concurrent embedding calls")
+    parser.add_argument("--embedding-batch-size", type=int, default=16,
+                        help="Number of chunks handed to each embedding worker at a time")
+    parser.add_argument("--preprocess-workers", type=int, default=1,
+                        help="Number of processes used to tag and split documents, only worth it for large corpora")
+    parser.add_argument("--index-batch-size", type=int, default=256,
+                        help="Number of chunks embedded and added to the index per batch, bounds peak memory")
+    parser.add_argument("--embedding-cache-path", type=str, default=".cache/embedding_cache.sqlite3",
+                        help="Path to the on-disk embedding cache, pass an empty string to disable it")
+    parser.add_argument("--embedding-cache-max-mb", type=float, default=512,
+                        help="Maximum size of the on-disk embedding cache in MB")
+    parser.add_argument("--dedup-threshold", type=float, default=None,
+                        help="Collapse chunks whose estimated Jaccard similarity is at least this value (e.g. 0.9) into one vector, disabled by default")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="Ignore the existing index and manifest and embed every chunk again")
+    parser.add_argument("--profile-report", type=str, default=None,
+                        help="Write wall time, CPU time, peak RSS and counters of each build stage to this JSON file")
     
     args = parser.parse_args()
     
@@ -44,6 +69,8 @@ def main():
         logger.info("Starting FAISS index creation process")
         logger.info(f"Data file: {args.data_file}")
         logger.info(f"Vector DB path: {args.vector_db_path}")
+        logger.info(f"Embedding workers: {args.workers}")
+        logger.info(f"Index spec: {args.index_spec}")
         
         # Create the RAG setup object
         rag_setup = FMBenchRagSetup(
@@ -51,12 +78,22 @@ def main():
             data_file_path=Path(args.data_file),
             embedding_model_id=args.embedding_model,
             vector_db_path=args.vector_db_path,
-            bedrock_role_arn=args.bedrock_role_arn
+            bedrock_role_arn=args.bedrock_role_arn,
+            index_spec=args.index_spec,
+            index_format=args.index_format,
+            mmap_dtype=args.mmap_dtype,
+            embedding_workers=args.workers,
+            embedding_batch_size=args.embedding_batch_size,
+            preprocess_workers=args.preprocess_workers,
+            index_batch_size=args.index_batch_size,
+            embedding_cache_path=args.embedding_cache_path or None,
+            embedding_cache_max_mb=args.embedding_cache_max_mb,
+            dedup_threshold=args.dedup_threshold
         )
         
         # Create and save the index
         logger.info("Creating vector index - this may take some time depending on the document count")
-        rag_setup.create_index()
+        rag_setup.create_index(full_rebuild=args.full_rebuild, profile_report=args.profile_report)
         logger.info("🎉 Index creation completed successfully!")
         logger.info(f"Index saved to: {args.vector_db_path}")
         logger.info("You can now use this index for faster RAG queries")
@@ -0,0 +1,142 @@
+import json
+import time
+import logging
+import resource
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Union
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Rough number of characters per token, used to report token totals without a tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class BuildProfiler:
+    """
+    Accumulates wall time, CPU time, peak RSS and counters for the stages of an index build. Stages of
+    the streaming build interleave (a batch is split, then embedded, then added to the index), so each
+    stage is entered many times and its figures are summed over all the times it ran.
+    CPU time is the CPU time of this process, it does not include preprocessing worker processes.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.rss_started_mb = _peak_rss_mb()
+
+    def _stage(self, name: str) -> Dict[str, Any]:
+        return self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "runs": 0, "peak_rss_mb": 0.0,
+                                             "rss_growth_mb": 0.0, "counts": {}})
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as a run of stage name"""
+        stats = self._stage(name)
+        rss_before = _peak_rss_mb()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stats
+        finally:
+            stats["wall_s"] += time.perf_counter() - wall
+            stats["cpu_s"] += time.process_time() - cpu
+            stats["runs"] += 1
+            rss_after = _peak_rss_mb()
+            stats["peak_rss_mb"] = max(stats["peak_rss_mb"], rss_after)
+            # growth of the process high-water mark while this stage ran
+            stats["rss_growth_mb"] += rss_after - rss_before
+
+    def count(self, name: str, **counts: int):
+        """Add to the counters (chunks, chars, tokens, api_calls, ...) of stage name"""
+        totals = self._stage(name)["counts"]
+        for key, value in counts.items():
+            totals[key] = totals.get(key, 0) + value
+
+    def timed_iter(self, name: str, iterable: Iterable[Any]) -> Iterator[Any]:
+        """Yield from iterable, timing the production of each item as a run of stage name"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self) -> Dict[str, Any]:
+        """Per stage figures plus totals, with throughput for every counter of a stage"""
+        total_wall = time.perf_counter() - self.started
+        stages = {}
+        for name, stats in self.stages.items():
+            wall = stats["wall_s"]
+            stages[name] = {
+                "wall_s": round(wall, 4),
+                "cpu_s": round(stats["cpu_s"], 4),
+                "wall_pct": round(100 * wall / total_wall, 1) if total_wall else 0.0,
+                "runs": stats["runs"],
+                "peak_rss_mb": round(stats["peak_rss_mb"], 1),
+                "rss_growth_mb": round(stats["rss_growth_mb"], 1),
+                **stats["counts"],
+                **{f"{key}_per_s": round(value / wall, 1) for key, value in stats["counts"].items() if wall > 0},
+            }
+        accounted = sum(stats["wall_s"] for stats in self.stages.values())
+        return {
+            "total": {
+                "wall_s": round(total_wall, 4),
+                "cpu_s": round(time.process_time() - self.cpu_started, 4),
+                "unaccounted_wall_s": round(max(0.0, total_wall - accounted), 4),
+                "peak_rss_mb": round(_peak_rss_mb(), 1),
+                "rss_growth_mb": round(_peak_rss_mb() - self.rss_started_mb, 1),
+            },
+            "stages": stages,
+        }
+
+    def write(self, path: Union[str, Path]) -> Dict[str, Any]:
+        report = self.report()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps(report, indent=2))
+        logger.info(f"Wrote index build profile to {path}")
+        return report
+
+    def log_summary(self):
+        """Log the report as a table, one line per stage"""
+        report = self.report()
+        lines = [f"{'stage':<14}{'wall s':>9}{'%':>6}{'cpu s':>9}{'runs':>7}{'peak MB':>9}{'+MB':>7}  counts"]
+        for name, stats in report["stages"].items():
+            # raw counters only, plus the embedding call rate, the full set of rates is in the JSON report
+            counts = ", ".join(f"{key}={value}" for key, value in stats.items()
+                               if key in self.stages[name]["counts"] or key == "api_calls_per_s")
+            lines.append(f"{name:<14}{stats['wall_s']:>9.2f}{stats['wall_pct']:>6.1f}{stats['cpu_s']:>9.2f}"
+                         f"{stats['runs']:>7}{stats['peak_rss_mb']:>9.0f}{stats['rss_growth_mb']:>7.0f}  {counts}")
+        total = report["total"]
+        lines.append(f"{'total':<14}{total['wall_s']:>9.2f}{100.0:>6.1f}{total['cpu_s']:>9.2f}{'':>7}"
+                     f"{total['peak_rss_mb']:>9.0f}{total['rss_growth_mb']:>7.0f}  "
+                     f"unaccounted={total['unaccounted_wall_s']:.2f}s")
+        logger.info("Index build profile:\n" + "\n".join(lines))
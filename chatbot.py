@@ -1,5 +1,6 @@
 import re
 import sys
+import json
 import time
 import datetime
 import requests
@@ -91,6 +92,8 @@ def get_args():
     parser = argparse.ArgumentParser(description="Streamlit app with command line arguments")
     parser.add_argument("--api-server-url", type=str, default='http://localhost:8000/generate', 
                        help="API server URL")
+    parser.add_argument("--no-stream", action="store_true",
+                       help="Wait for the whole answer from the API server URL instead of streaming it from <url>/stream")
     
     # Handle argument parsing in a way that works with Streamlit
     try:
@@ -107,6 +110,8 @@ def get_args():
                         args_list.append(arg)
                     elif i < len(sys.argv) - 1:
                         args_list.extend([arg, sys.argv[i+1]])
+                elif arg == "--no-stream":
+                    args_list.append(arg)
         
         return parser.parse_args(args_list)
     except Exception as e:
@@ -117,6 +122,9 @@ def get_args():
 # Get the arguments
 args = get_args()
 API_URL = args.api_server_url
+# server-sent events endpoint streaming the same answer as API_URL
+STREAM_URL = API_URL.rstrip("/") + "/stream"
+STREAM = not args.no_stream
 
 def get_current_timestamp():
     """Get current timestamp in a readable format."""
@@ -145,42 +153,82 @@ def process_response(question):
             # Updated payload to include thread_id for conversation memory
             payload = {
                 "question": question,
-                "thread_id": st.session_state.thread_id
+                "thread_id": st.session_state.thread_id,
+                # only the messages of this turn, the answer is the last ai message
+                "response_mode": "turn"
             }
             
-            with st.spinner("Searching for FMBench information..."):
-                response = requests.post(API_URL, json=payload)
-                if response.status_code == 200:
-                    result = response.json()
-                    # Updated to handle the new response format
-                    outputs = result.get("result", [])
-                    
-                    # Find the AI's response (it will be the last 'ai' message)
-                    ai_messages = [msg for msg in outputs if msg["role"] == "ai"]
-                    if ai_messages:
-                        ai_response = ai_messages[-1]["content"]
-                        
-                        # Get timestamp for the assistant's response
-                        response_timestamp = get_current_timestamp()
-                        
-                        # Update the placeholder with the actual response
-                        message_placeholder.markdown(ai_response)
-                        st.caption(f"{response_timestamp}")
-                        
-                        # Store original with timestamp for session
-                        st.session_state.messages.append({
-                            "role": "assistant", 
-                            "content": ai_response,
-                            "timestamp": response_timestamp
-                        })
-                    else:
-                        message_placeholder.error("No response from the assistant.")
-                else:
-                    message_placeholder.error(f"Error: {response.status_code} - {response.text}")
+            if STREAM:
+                ai_response = stream_response(payload, message_placeholder)
+            else:
+                ai_response = fetch_response(payload, message_placeholder)
+            
+            if ai_response:
+                # Get timestamp for the assistant's response
+                response_timestamp = get_current_timestamp()
+                
+                # Update the placeholder with the actual response
+                message_placeholder.markdown(ai_response)
+                st.caption(f"{response_timestamp}")
+                
+                # Store original with timestamp for session
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": ai_response,
+                    "timestamp": response_timestamp
+                })
             
         except Exception as e:
             message_placeholder.error(f"Error: {str(e)}")
 
+def final_answer(outputs):
+    """The AI's response, it will be the last 'ai' message"""
+    ai_messages = [msg for msg in outputs if msg["role"] == "ai"]
+    return ai_messages[-1]["content"] if ai_messages else None
+
+def fetch_response(payload, message_placeholder):
+    """Wait for the whole answer from the API server, None after showing an error"""
+    with st.spinner("Searching for FMBench information..."):
+        response = requests.post(API_URL, json=payload)
+    if response.status_code != 200:
+        message_placeholder.error(f"Error: {response.status_code} - {response.text}")
+        return None
+    # Updated to handle the new response format
+    ai_response = final_answer(response.json().get("result", []))
+    if ai_response is None:
+        message_placeholder.error("No response from the assistant.")
+    return ai_response
+
+def stream_response(payload, message_placeholder):
+    """Render the answer as the server streams it, None after showing an error"""
+    text = ""
+    event = None
+    with requests.post(STREAM_URL, json=payload, stream=True) as response:
+        if response.status_code != 200:
+            message_placeholder.error(f"Error: {response.status_code} - {response.text}")
+            return None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+                continue
+            if not line.startswith("data:"):
+                continue
+            data = json.loads(line[len("data:"):])
+            if event == "token":
+                text += data["content"]
+                message_placeholder.markdown(text + "▌")
+            elif event == "tool":
+                if data["status"] == "start":
+                    # text before a tool call is the agent thinking, the answer comes after it
+                    text = ""
+                    message_placeholder.markdown("Searching for FMBench information...")
+            elif event == "done":
+                return final_answer(data["result"]) or text
+            elif event == "error":
+                message_placeholder.error(f"Error: {data['detail']}")
+                return None
+    return text or None
+
 def display_chat_history():
     """Display the chat history."""
     for message in st.session_state.messages:
@@ -0,0 +1,98 @@
+import re
+import zlib
+import numpy as np
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# MinHash parameters, 128 permutations estimate a Jaccard similarity to within ~0.05
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN = re.compile(r"\S+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """32-bit hashes of the word size-grams of text, texts shorter than size words give a single shingle"""
+    words = _TOKEN.findall(text.lower())
+    if len(words) <= size:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in set(grams)), dtype=np.uint64)
+
+
+def lsh_params(threshold: float, num_perm: int = NUM_PERM) -> Tuple[int, int]:
+    """
+    Number of bands and rows per band for LSH, picked among the divisors of num_perm so that the
+    similarity at which two texts become candidates, (1/bands)^(1/rows), is closest to threshold
+    """
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+# Config files repeat the same structure with a few values changed (instance type, model id), values
+# that decide the answer, so their chunks are only collapsed into exact copies
+CONFIG_EXTENSIONS = (".yml", ".yaml", ".json", ".toml", ".ini", ".cfg")
+
+
+def is_config_chunk(metadata: Dict) -> bool:
+    """True for chunks of config files, which near-duplicate elimination only collapses when identical"""
+    return metadata.get("content_type") == "yaml" or metadata.get("path", "").lower().endswith(CONFIG_EXTENSIONS)
+
+
+class MinHasher:
+    """Computes MinHash signatures with num_perm universal hash functions (a*x + b) mod (2^61 - 1)"""
+
+    def __init__(self, num_perm: int = NUM_PERM, shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingles(text, self.shingle_size)
+        # a, b and the shingle hashes are below 2^32 so a*x + b does not overflow 64 bits
+        permuted = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    LSH index over the MinHash signatures of representative chunks. A chunk whose estimated Jaccard
+    similarity to an indexed representative is at least threshold is reported as its near-duplicate,
+    any other chunk becomes a representative itself. Results only depend on the order chunks are seen in.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = NUM_PERM, shingle_size: int = SHINGLE_SIZE):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"Near-duplicate threshold must be in (0, 1], got {threshold}")
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(self.bands)]
+        self.signatures: Dict[Hashable, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def find(self, text: str) -> Tuple[Optional[Hashable], np.ndarray]:
+        """Return the most similar representative above threshold (or None) and the signature of text"""
+        signature = self.hasher.signature(text)
+        # dict rather than set so that ties go to the same representative on every run
+        candidates = dict.fromkeys(key for band, bucket_key in zip(self.buckets, self._band_keys(signature))
+                                   for key in band.get(bucket_key, ()))
+        best, best_similarity = None, 0.0
+        for key in candidates:
+            similarity = float(np.mean(self.signatures[key] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best, best_similarity = key, similarity
+        return best, signature
+
+    def add(self, key: Hashable, signature: np.ndarray):
+        """Index a representative under key"""
+        self.signatures[key] = signature
+        for band, bucket_key in zip(self.buckets, self._band_keys(signature)):
+            band.setdefault(bucket_key, []).append(key)
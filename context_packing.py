@@ -0,0 +1,139 @@
+import logging
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from langchain_core.documents import Document
+from build_profile import CHARS_PER_TOKEN, estimate_tokens
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def overlap_length(first: str, second: str, min_overlap: int, max_overlap: int) -> int:
+    """Length of the longest end of first that second starts with, 0 if shorter than min_overlap"""
+    tail = first[-max_overlap:]
+    head = second[:min_overlap]
+    if len(head) < min_overlap:
+        return 0
+    # the earliest match in the tail is the longest overlap
+    start = tail.find(head)
+    while start != -1:
+        if second.startswith(tail[start:]):
+            return len(tail) - start
+        start = tail.find(head, start + 1)
+    return 0
+
+
+def join_overlapping(first: str, second: str, min_overlap: int, max_overlap: int) -> Optional[str]:
+    """Text spanning first and second if one contains or overlaps the other, None if they are apart"""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    overlap = overlap_length(first, second, min_overlap, max_overlap)
+    if overlap:
+        return first + second[overlap:]
+    overlap = overlap_length(second, first, min_overlap, max_overlap)
+    if overlap:
+        return second + first[overlap:]
+    return None
+
+
+def _merge(documents: List[Document], text: str) -> Document:
+    """One document for the span text covering documents, with the metadata of the best ranked one"""
+    best = max(documents, key=lambda doc: doc.metadata.get("score", 0.0))
+    metadata = {**best.metadata, "score": best.metadata.get("score", 0.0),
+                "merged_chunks": sum(doc.metadata.get("merged_chunks", 1) for doc in documents)}
+    if any("paths" in doc.metadata for doc in documents):
+        metadata["paths"] = list(dict.fromkeys(p for doc in documents for p in doc.metadata.get("paths", [doc.metadata["path"]])))
+    return Document(page_content=text, metadata=metadata)
+
+
+def merge_overlapping(documents: List[Document], min_overlap: int = 64, max_overlap: int = 1000) -> List[Document]:
+    """
+    Merge chunks of the same path whose text overlaps (neighbours sharing the splitter's chunk_overlap)
+    or contains one another into one span. A merged span takes the place of its best ranked chunk.
+    """
+    spans: List[Document] = []
+    for doc in documents:
+        slot, text, parts = len(spans), doc.page_content, [doc]
+        merged = True
+        while merged:
+            merged = False
+            for i, span in enumerate(spans):
+                if span.metadata.get("path") != doc.metadata.get("path"):
+                    continue
+                joined = join_overlapping(span.page_content, text, min_overlap, max_overlap)
+                if joined is not None:
+                    # the joined text can now overlap another span of the path, look again
+                    spans.pop(i)
+                    slot = min(slot, i)
+                    text, parts, merged = joined, [span] + parts, True
+                    break
+        spans.insert(slot, _merge(parts, text) if len(parts) > 1 else doc)
+    return spans
+
+
+class ContextPacker(BaseModel):
+    """
+    Packs retrieved chunks into a token budget before they are stuffed into the prompt: chunks are ranked
+    by their retrieval score, overlapping neighbours from the same path are merged so shared text is sent
+    once, and chunks are added until the budget is spent, the first one that does not fit is cut to the
+    remaining budget. Token counts are estimated from the number of characters.
+    """
+    budget_tokens: int = Field(default=6000, description="Maximum number of context tokens sent to the model")
+    min_overlap_chars: int = Field(default=64, description="Minimum number of shared characters for two chunks to be merged")
+    max_overlap_chars: int = Field(default=1000, description="Number of characters at the end of a chunk searched for the start of the next one")
+    min_trim_tokens: int = Field(default=100, description="A chunk that does not fit is cut to the remaining budget only if at least this many tokens remain")
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _trim(self, doc: Document, tokens: int) -> Document:
+        text = doc.page_content[:tokens * CHARS_PER_TOKEN]
+        # end on a line break when that keeps most of the text
+        end = text.rfind("\n")
+        if end > len(text) // 2:
+            text = text[:end]
+        return Document(page_content=text, metadata={**doc.metadata, "truncated": True})
+
+    def pack(self, documents: List[Document]) -> List[Document]:
+        """Chunks to put in the prompt, best first, within the token budget"""
+        if not documents:
+            return documents
+        tokens_before = sum(estimate_tokens(doc.page_content) for doc in documents)
+        # sorted is stable, chunks with equal scores keep the retriever order
+        ranked = sorted(documents, key=lambda doc: -doc.metadata.get("score", 0.0))
+        spans = merge_overlapping(ranked, self.min_overlap_chars, self.max_overlap_chars)
+        packed, used = [], 0
+        for doc in spans:
+            tokens = estimate_tokens(doc.page_content)
+            if used + tokens <= self.budget_tokens:
+                packed.append(doc)
+                used += tokens
+                continue
+            remaining = self.budget_tokens - used
+            if remaining >= self.min_trim_tokens:
+                packed.append(self._trim(doc, remaining))
+                used += estimate_tokens(packed[-1].page_content)
+                break
+        saved = tokens_before - used
+        logger.info(f"Packed {len(documents)} chunks ({len(documents) - len(spans)} merged into overlapping neighbours) "
+                    f"into {len(packed)} with ~{used} of {self.budget_tokens} tokens, saved ~{saved} tokens "
+                    f"({100 * saved / max(tokens_before, 1):.0f}%)")
+        return packed
@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Rough per message overhead of the message objects, on top of their text
+MESSAGE_OVERHEAD_BYTES = 512
+
+
+def message_size(message: BaseMessage) -> int:
+    """Approximate memory held by a message: its content, tool calls and a fixed object overhead"""
+    content = message.content
+    size = len(content.encode("utf-8")) if isinstance(content, str) else len(json.dumps(content, default=str))
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        size += len(json.dumps(tool_calls, default=str))
+    return size + MESSAGE_OVERHEAD_BYTES
+
+
+def serialize_messages(messages: List[BaseMessage]) -> bytes:
+    """
+    Compact encoding of messages for a shared backend: [type, fields] pairs without the fields left at
+    their empty default (ids, names, empty metadata), as compact JSON compressed with zlib
+    """
+    compact = [[message["type"], {key: value for key, value in message["data"].items()
+                                  if key == "content" or (key != "type" and value not in (None, {}, [], False))}]
+               for message in messages_to_dict(messages)]
+    return zlib.compress(json.dumps(compact, separators=(",", ":"), default=str).encode("utf-8"))
+
+
+def deserialize_messages(data: bytes) -> List[BaseMessage]:
+    """Messages encoded with serialize_messages"""
+    compact = json.loads(zlib.decompress(data))
+    return messages_from_dict([{"type": message_type, "data": fields} for message_type, fields in compact])
+
+
+class ConversationStore(ABC):
+    """Message history of each conversation thread, get returns an empty list for an unknown thread"""
+
+    @abstractmethod
+    def get(self, thread_id: Any) -> List[BaseMessage]:
+        ...
+
+    @abstractmethod
+    def put(self, thread_id: Any, messages: List[BaseMessage]):
+        ...
+
+    @abstractmethod
+    def delete(self, thread_id: Any):
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    Bounded store of the message history of each conversation thread. Threads are kept in least recently
+    used order: a thread idle for longer than idle_ttl_seconds expires, and the least recently used
+    threads are evicted when there are more than max_threads or their messages take more than max_bytes
+    (the thread being written is never evicted to make room for itself).
+    """
+
+    def __init__(self, max_threads: int = 1000, idle_ttl_seconds: float = 3600, max_bytes: int = 256 * 1024 * 1024):
+        self.max_threads = max_threads
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_bytes = max_bytes
+        # thread id -> (last access time, messages, size in bytes), least recently used first
+        self._threads: "OrderedDict[Any, Tuple[float, List[BaseMessage], int]]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = {"lru": 0, "idle": 0, "bytes": 0}
+        self._lock = threading.Lock()
+
+    def _pop(self, reason: str):
+        thread_id, (_, _, size) = self._threads.popitem(last=False)
+        self._bytes -= size
+        self.evictions[reason] += 1
+        logger.info(f"Evicted conversation thread {thread_id} ({reason}, {size} bytes)")
+
+    def _expire(self, now: float):
+        # the least recently used thread is first, stop at the first one still fresh
+        while self._threads and now - next(iter(self._threads.values()))[0] > self.idle_ttl_seconds:
+            self._pop("idle")
+
+    def get(self, thread_id: Any) -> List[BaseMessage]:
+        """Messages of a thread, empty for a new or expired thread. The list is a copy."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._threads.get(thread_id)
+            if entry is None:
+                return []
+            self._threads[thread_id] = (now, entry[1], entry[2])
+            self._threads.move_to_end(thread_id)
+            return list(entry[1])
+
+    def put(self, thread_id: Any, messages: List[BaseMessage]):
+        """Replace the messages of a thread, evicting other threads if the store is over its limits"""
+        size = sum(message_size(message) for message in messages)
+        now = time.monotonic()
+        with self._lock:
+            previous = self._threads.pop(thread_id, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._expire(now)
+            while self._threads and len(self._threads) >= self.max_threads:
+                self._pop("lru")
+            while self._threads and self._bytes + size > self.max_bytes:
+                self._pop("bytes")
+            self._threads[thread_id] = (now, list(messages), size)
+            self._bytes += size
+        if size > self.max_bytes:
+            logger.warning(f"Conversation thread {thread_id} alone takes {size} bytes, more than the {self.max_bytes} bytes limit")
+
+    def delete(self, thread_id: Any):
+        with self._lock:
+            entry = self._threads.pop(thread_id, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def stats(self) -> Dict[str, Any]:
+        """Live threads, their approximate size and evictions by reason"""
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "backend": "memory",
+                "threads": len(self._threads),
+                "max_threads": self.max_threads,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "evictions": dict(self.evictions),
+            }
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Conversation threads in a SQLite database, shared by the workers of a host (or by hosts mounting the
+    same file system). Threads idle for longer than idle_ttl_seconds expire and the least recently used
+    threads beyond max_threads are deleted. The deletes run on a put at most once per
+    cleanup_interval_seconds in each process, so between cleanups the table may hold more than max_threads
+    threads, and a read refreshes the last access of a thread only if it is older than that interval.
+    There is no byte cap: the size of the threads is bounded by max_threads only.
+    """
+
+    def __init__(self, path: str = "conversations.db", max_threads: int = 100000, idle_ttl_seconds: float = 3600,
+                 cleanup_interval_seconds: float = 60):
+        self.path = path
+        self.max_threads = max_threads
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.cleanup_interval_seconds = cleanup_interval_seconds
+        self._next_cleanup = 0.0
+        self._cleanup_lock = threading.Lock()
+        # one connection per thread, a sqlite3 connection must not be shared across threads
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS conversations "
+                               "(thread_id TEXT PRIMARY KEY, updated REAL NOT NULL, messages BLOB NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated)")
+        logger.info(f"Conversation threads stored in SQLite database {path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # several worker processes write to the same file: readers do not block the writer in WAL mode
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, thread_id: Any) -> List[BaseMessage]:
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute("SELECT messages, updated FROM conversations WHERE thread_id = ? AND updated >= ?",
+                                 (str(thread_id), now - self.idle_ttl_seconds)).fetchone()
+        if row is None:
+            return []
+        # a write lock on every read would serialize the workers, the last access only needs to be as
+        # precise as the cleanup it orders
+        if now - row[1] >= self.cleanup_interval_seconds:
+            with connection:
+                connection.execute("UPDATE conversations SET updated = ? WHERE thread_id = ?", (now, str(thread_id)))
+        return deserialize_messages(row[0])
+
+    def _cleanup_due(self) -> bool:
+        now = time.monotonic()
+        with self._cleanup_lock:
+            if now < self._next_cleanup:
+                return False
+            self._next_cleanup = now + self.cleanup_interval_seconds
+            return True
+
+    def put(self, thread_id: Any, messages: List[BaseMessage]):
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO conversations (thread_id, updated, messages) VALUES (?, ?, ?)",
+                               (str(thread_id), now, serialize_messages(messages)))
+        if self._cleanup_due():
+            self.cleanup(now)
+
+    def cleanup(self, now: Optional[float] = None):
+        """Delete the expired threads and the least recently used threads beyond max_threads"""
+        now = time.time() if now is None else now
+        with self._connection() as connection:
+            connection.execute("DELETE FROM conversations WHERE updated < ?", (now - self.idle_ttl_seconds,))
+            # steps through up to max_threads index entries, hence only once per cleanup interval
+            connection.execute("DELETE FROM conversations WHERE thread_id IN (SELECT thread_id FROM conversations "
+                               "ORDER BY updated DESC LIMIT -1 OFFSET ?)", (self.max_threads,))
+
+    def delete(self, thread_id: Any):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM conversations WHERE thread_id = ?", (str(thread_id),))
+
+    def stats(self) -> Dict[str, Any]:
+        threads, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(messages)), 0) FROM conversations WHERE updated >= ?",
+            (time.time() - self.idle_ttl_seconds,)).fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "threads": threads,
+            "max_threads": self.max_threads,
+            "bytes": size,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "cleanup_interval_seconds": self.cleanup_interval_seconds,
+        }
+
+
+class RedisConversationStore(ConversationStore):
+    """
+    Conversation threads in Redis (or any server speaking its protocol, e.g. Valkey or ElastiCache), shared
+    by all workers and Lambda containers. A thread is a key expiring idle_ttl_seconds after its last access;
+    memory is bounded by the server's maxmemory policy. client is a redis.Redis or any object with the same
+    getex, set, delete and scan_iter methods; GETEX needs Redis 6.2 or later (or Valkey).
+    """
+
+    def __init__(self, client: Any, idle_ttl_seconds: float = 3600, prefix: str = "fmbench:conversation:"):
+        self.client = client
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisConversationStore":
+        """Store connected to the Redis server at url, e.g. redis://localhost:6379/0"""
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("the redis conversation backend needs the redis package: pip install redis") from e
+        logger.info(f"Conversation threads stored in Redis at {url}")
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _key(self, thread_id: Any) -> str:
+        return f"{self.prefix}{thread_id}"
+
+    def get(self, thread_id: Any) -> List[BaseMessage]:
+        # reads the thread and restarts its idle timer in one round trip
+        data = self.client.getex(self._key(thread_id), ex=int(self.idle_ttl_seconds))
+        if data is None:
+            return []
+        return deserialize_messages(data)
+
+    def put(self, thread_id: Any, messages: List[BaseMessage]):
+        self.client.set(self._key(thread_id), serialize_messages(messages), ex=int(self.idle_ttl_seconds))
+
+    def delete(self, thread_id: Any):
+        self.client.delete(self._key(thread_id))
+
+    def stats(self) -> Dict[str, Any]:
+        # SCAN walks the key space, fine for an operator endpoint but not for the request path
+        return {
+            "backend": "redis",
+            "threads": sum(1 for _ in self.client.scan_iter(match=f"{self.prefix}*")),
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+        }
+
+
+def create_conversation_store(backend: Optional[str] = None, **kwargs) -> ConversationStore:
+    """
+    Conversation store selected by backend, or by the CONVERSATION_BACKEND environment variable:
+    memory (default, one per process), sqlite (CONVERSATION_DB_PATH) or redis (CONVERSATION_REDIS_URL).
+    The limits come from CONVERSATION_MAX_THREADS, CONVERSATION_IDLE_TTL and CONVERSATION_MAX_MB (memory
+    only, the sqlite backend has no byte cap), sqlite cleans up every CONVERSATION_CLEANUP_INTERVAL seconds.
+    """
+    backend = (backend or os.environ.get("CONVERSATION_BACKEND", "memory")).lower()
+    idle_ttl_seconds = float(os.environ.get("CONVERSATION_IDLE_TTL", 3600))
+    if backend == "memory":
+        return InMemoryConversationStore(
+            max_threads=int(os.environ.get("CONVERSATION_MAX_THREADS", 1000)),
+            idle_ttl_seconds=idle_ttl_seconds,
+            max_bytes=int(float(os.environ.get("CONVERSATION_MAX_MB", 256)) * 1024 * 1024),
+            **kwargs)
+    if backend == "sqlite":
+        return SQLiteConversationStore(
+            path=os.environ.get("CONVERSATION_DB_PATH", "conversations.db"),
+            max_threads=int(os.environ.get("CONVERSATION_MAX_THREADS", 100000)),
+            idle_ttl_seconds=idle_ttl_seconds,
+            cleanup_interval_seconds=float(os.environ.get("CONVERSATION_CLEANUP_INTERVAL", 60)),
+            **kwargs)
+    if backend == "redis":
+        return RedisConversationStore.from_url(
+            os.environ.get("CONVERSATION_REDIS_URL", "redis://localhost:6379/0"),
+            idle_ttl_seconds=idle_ttl_seconds,
+            **kwargs)
+    raise ValueError(f"Unknown conversation backend {backend}, expected memory, sqlite or redis")
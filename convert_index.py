@@ -0,0 +1,49 @@
+import logging
+import argparse
+from mmap_index import SUPPORTED_DTYPES, convert_faiss_index
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+def main():
+    """Convert an existing FAISS index (index.faiss + index.pkl) to the memory-mappable index format"""
+    parser = argparse.ArgumentParser(description="Convert a FAISS index to the memory-mappable index format")
+    parser.add_argument("--src", type=str, default="indexes/fmbench_index",
+                        help="Path of the FAISS index saved with FAISS.save_local")
+    parser.add_argument("--dst", type=str, default=None,
+                        help="Path to write the memory-mappable index to, defaults to --src")
+    parser.add_argument("--dtype", type=str, default="float32", choices=SUPPORTED_DTYPES,
+                        help="Storage dtype for the vectors")
+    
+    args = parser.parse_args()
+    
+    try:
+        path = convert_faiss_index(args.src, args.dst, dtype=args.dtype)
+        logger.info(f"Memory-mappable index written to {path}, set index_format='mmap' (INDEX_FORMAT=mmap for the server) to use it")
+    except Exception as e:
+        logger.error(f"❌ Error converting index: {str(e)}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return 1
+    
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
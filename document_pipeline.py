@@ -0,0 +1,233 @@
+import re
+import json
+import itertools
+import multiprocessing
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from build_profile import BuildProfiler, estimate_tokens
+
+# Number of characters read from the documents file at a time
+READ_SIZE = 1 << 20
+
+
+def iter_json_array(path: Union[str, Path], read_size: int = READ_SIZE) -> Iterator[Any]:
+    """
+    Yield the elements of a JSON array file one at a time without loading the whole file.
+    Only the element being decoded (plus at most read_size characters) is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf, pos, eof, started = "", 0, False, False
+        while True:
+            # skip whitespace and element separators
+            while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ",")):
+                pos += 1
+            if pos >= len(buf):
+                if eof:
+                    raise ValueError(f"Unexpected end of file while reading JSON array from {path}")
+                chunk = f.read(read_size)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError(f"Expected a JSON array in {path}")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+                # a number cut by the end of the buffer (12|34, 1.|5) may continue in the next read
+                complete = eof or (end < len(buf) and (buf[end] in ",]" or buf[end].isspace()))
+            except json.JSONDecodeError:
+                # the element continues past the end of the buffer, read more
+                if eof:
+                    raise
+                complete = False
+            if not complete:
+                chunk = f.read(read_size)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield element
+            pos = end
+            # drop the consumed part of the buffer
+            if pos >= read_size:
+                buf, pos = buf[pos:], 0
+
+
+def batched(iterable: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """Group an iterable into lists of at most batch_size elements"""
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+def make_text_splitter() -> RecursiveCharacterTextSplitter:
+    """Create the text splitter used for all documents"""
+    # Create specialized text splitter based on content type
+    return RecursiveCharacterTextSplitter(
+        chunk_size=4000,      # Increased chunk size for better context
+        chunk_overlap=400,    # More overlap to maintain context across chunks
+        separators=[
+            # Headers (preserve full sections)
+            "\n# ", "\n## ", "\n### ", "\n#### ",
+            # Lists and model information
+            "\n- ", "\n* ", "\n1. ",
+            # Tables often containing model data
+            "\n|", "|\n",
+            # YAML and code blocks
+            "\n---\n", "\n```", "```\n",
+            # Paragraphs and other breaks
+            "\n\n", "\n", " ",
+            # Fallback
+            ""
+        ],
+        keep_separator=True,
+        strip_whitespace=False,
+        length_function=len,
+        is_separator_regex=False
+    )
+
+
+# Leading "---" (after optional whitespace) marks a YAML document
+_YAML_START = re.compile(r"\s*---")
+# Heading line, group 1 is its first token without the leading "#" (e.g. "#" of "## Setup"). The searched
+# text starts with the literal "\n#", so the regex engine only stops at heading lines
+_FIRST_HEADING = re.compile(r"#(\S*)")
+_NEXT_HEADING = re.compile(r"\n#(\S*)")
+# List item line, possibly nested ("- ", "* ", "+ ", "1. ", "2) "). The possessive quantifiers (Python 3.11+)
+# stop the engine from backtracking through the indentation of every line that is not a list item
+_FIRST_LIST_ITEM = re.compile(r"[ \t]*+(?:[-*+] |\d++[.)][ \t])")
+_NEXT_LIST_ITEM = re.compile(r"\n[ \t]*+(?:[-*+] |\d++[.)][ \t])")
+
+
+def classify_content(content: str, source: str = "") -> Tuple[str, Dict[str, Any]]:
+    """
+    Detect the content type of a document and collect structure stats of the whole document, without
+    the repeated splitlines() walks of the previous checks. The type checks short-circuit in the same
+    order as before (YAML, code fences, headings); the heading search also gives the heading stats and
+    the other stats take one str.count or findall pass each. Lines end at \n, \r\n or \r.
+    
+    Returns the (possibly normalized) content and a dict of metadata: content_type, code_blocks_count
+    (markdown_with_code only), max_heading_level (markdown_with_headers only) plus doc_line_count,
+    doc_heading_count, doc_table_rows, doc_list_items and doc_list_density. The doc_* stats describe the
+    source document, every chunk split from it carries the same values.
+    """
+    stats = {}
+    source = source.lower()
+    if _YAML_START.match(content) or '.yaml' in source or '.yml' in source:
+        stats['content_type'] = 'yaml'
+        # Preserve indentation for YAML
+        content = '\n'.join(content.splitlines())
+    elif '```' in content:
+        stats['content_type'] = 'markdown_with_code'
+        stats['code_blocks_count'] = content.count('```') // 2  # Divide by 2 since each block has opening and closing
+
+    # scan a copy with \n line ends only, the content itself is returned as it is
+    text = content.replace('\r\n', '\n').replace('\r', '\n') if '\r' in content else content
+    first = _FIRST_HEADING.match(text)
+    headings = _NEXT_HEADING.findall(text)
+    if first:
+        headings.append(first.group(1))
+    if 'content_type' not in stats:
+        if headings:
+            stats['content_type'] = 'markdown_with_headers'
+            stats['max_heading_level'] = 1 + max(map(len, headings))
+        else:
+            stats['content_type'] = 'markdown'
+
+    line_count = text.count('\n') + (1 if text and not text.endswith('\n') else 0)
+    list_items = len(_NEXT_LIST_ITEM.findall(text)) + (1 if _FIRST_LIST_ITEM.match(text) else 0)
+    stats['doc_line_count'] = line_count
+    stats['doc_heading_count'] = len(headings)
+    stats['doc_table_rows'] = text.count('\n|') + text.startswith('|')
+    stats['doc_list_items'] = list_items
+    stats['doc_list_density'] = round(list_items / line_count, 3) if line_count else 0.0
+    return content, stats
+
+
+def to_document(doc: Dict[str, Any]) -> Document:
+    """Convert a record from the documents file to a Document with file and content type metadata"""
+    content = doc["content"]
+    # Initialize metadata with file information
+    metadata = {
+        "filename": doc["filename"],
+        "path": doc["path"],
+        "directory": doc["directory"],
+        "extension": doc["extension"]
+    }
+    # Add any additional metadata if present
+    if "metadata" in doc:
+        metadata.update(doc["metadata"])
+
+    # Detect content type and collect structure stats of the document
+    content, stats = classify_content(content, metadata.get('source', ''))
+    metadata.update(stats)
+
+    return Document(
+        page_content=content,
+        metadata=metadata
+    )
+
+
+# Text splitter of the current (worker) process, created on first use
+_text_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+
+def split_documents(docs: List[Dict[str, Any]]) -> List[Document]:
+    """Tag and split a batch of records from the documents file, runs inside the process pool workers"""
+    global _text_splitter
+    if _text_splitter is None:
+        _text_splitter = make_text_splitter()
+    return _text_splitter.split_documents([to_document(doc) for doc in docs])
+
+
+def iter_chunks(data_file_path: Union[str, Path], workers: int = 1, docs_per_task: int = 4,
+                profiler: Optional[BuildProfiler] = None) -> Iterator[Document]:
+    """
+    Stream chunks from the documents file. With workers > 1 the content type tagging and splitting
+    is fanned out over a process pool, docs_per_task documents are sent to a worker at a time and at
+    most 2 * workers tasks are in flight so memory stays bounded. Chunks are yielded in the same order
+    as with workers=1.
+    
+    Reading the file is recorded as the "load" stage of profiler and splitting as the "split" stage
+    (with workers > 1, the time spent waiting for the pool).
+    """
+    profiler = profiler or BuildProfiler()
+    doc_batches = profiler.timed_iter("load", batched(iter_json_array(data_file_path), docs_per_task))
+
+    def counted(docs: List[Dict[str, Any]], chunks: List[Document]) -> List[Document]:
+        profiler.count("load", documents=len(docs), chars=sum(len(doc["content"]) for doc in docs))
+        profiler.count("split", chunks=len(chunks), chars=sum(len(c.page_content) for c in chunks),
+                       tokens=sum(estimate_tokens(c.page_content) for c in chunks))
+        return chunks
+
+    if workers <= 1:
+        for docs in doc_batches:
+            with profiler.stage("split"):
+                chunks = split_documents(docs)
+            yield from counted(docs, chunks)
+        return
+
+    # spawn rather than fork, the embedding stage may have threads running in this process
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = deque()
+        for docs in doc_batches:
+            pending.append((docs, executor.submit(split_documents, docs)))
+            if len(pending) >= 2 * workers:
+                docs, future = pending.popleft()
+                with profiler.stage("split"):
+                    chunks = future.result()
+                yield from counted(docs, chunks)
+        while pending:
+            docs, future = pending.popleft()
+            with profiler.stage("split"):
+                chunks = future.result()
+            yield from counted(docs, chunks)
@@ -0,0 +1,274 @@
+import os
+import time
+import array
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pydantic import BaseModel, Field
+from typing import List, Any, Callable, Dict, Optional
+from langchain_core.embeddings import Embeddings
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model_id TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model_id, text_hash)
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def text_hash(text: str) -> str:
+    """sha256 of the text, used as the cache key together with the embedding model id"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_query(text: str) -> str:
+    """Case and whitespace insensitive form of a question, used as the query embedding cache key"""
+    return " ".join(text.split()).casefold()
+
+
+def _to_blob(vector: List[float]) -> bytes:
+    return array.array("f", vector).tobytes()
+
+
+def _from_blob(blob: bytes) -> List[float]:
+    vector = array.array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class CachedEmbeddings(BaseModel, Embeddings):
+    """
+    Embeddings wrapper backed by a persistent SQLite cache. Vectors are stored as float32 blobs keyed by
+    (embedding model id, sha256 of the text), so only texts that have never been embedded with the model
+    reach the underlying embeddings. evict(), called once at the end of an index build, removes the least
+    recently used entries until the vectors fit in max_size_mb and compacts the file.
+    """
+    embeddings: Any = Field(..., description="Underlying Embeddings implementation")
+    model_id: str = Field(..., description="Embedding model ID, part of the cache key")
+    cache_path: str = Field(..., description="Path to the SQLite cache file")
+    max_size_mb: float = Field(default=512, description="Maximum size of the cached vectors in MB (vector payload, the file adds keys and SQLite overhead)")
+    hits: int = Field(default=0, description="Number of texts served from the cache")
+    misses: int = Field(default=0, description="Number of texts sent to the underlying embeddings")
+    evictions: int = Field(default=0, description="Number of cache entries evicted")
+    total_bytes: int = Field(default=0, description="Size of the cached vectors in bytes, kept up to date as vectors are added")
+
+    # Initialized in __init__
+    conn: Optional[Any] = Field(default=None, exclude=True)
+    lock: Optional[Any] = Field(default=None, exclude=True)
+
+    class Config:
+        arbitrary_types_allowed = True
+        protected_namespaces = ()
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.lock = threading.Lock()
+        # summed once, then counted as vectors are added and evicted
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Fetch cached vectors for the given text hashes"""
+        found = {}
+        # stay well below SQLite's limit on the number of bound parameters
+        for i in range(0, len(hashes), 500):
+            batch = hashes[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model_id = ? AND text_hash IN ({placeholders})",
+                [self.model_id, *batch]
+            ).fetchall()
+            found.update({h: _from_blob(blob) for h, blob in rows})
+        return found
+
+    def evict(self):
+        """Evict least recently used entries until the vectors fit in max_size_mb, then reclaim the freed space"""
+        max_bytes = int(self.max_size_mb * 1024 * 1024)
+        with self.lock:
+            if self.total_bytes <= max_bytes:
+                return
+            excess = self.total_bytes - max_bytes
+            evict, freed = [], 0
+            # walks the last_used index from the oldest entry, stops as soon as enough is freed
+            for rowid, size in self.conn.execute("SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_used"):
+                if freed >= excess:
+                    break
+                evict.append((rowid,))
+                freed += size
+            self.conn.executemany("DELETE FROM embeddings WHERE rowid = ?", evict)
+            self.conn.commit()
+            self.total_bytes -= freed
+            self.evictions += len(evict)
+            # deleted rows only go to the free list, VACUUM shrinks the file (once checkpointed in WAL mode)
+            self.conn.execute("VACUUM")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logger.info(f"Evicted {len(evict)} entries ({freed} bytes) from the embedding cache at {self.cache_path}")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, serving the ones already embedded with this model from the cache"""
+        texts = list(texts)
+        hashes = [text_hash(t) for t in texts]
+        with self.lock:
+            cached = self._lookup(list(set(hashes)))
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+        self.hits += len(texts) - sum(1 for h in hashes if h in missing)
+        self.misses += sum(1 for h in hashes if h in missing)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            cached.update(zip(missing.keys(), vectors))
+        now = time.time()
+        with self.lock:
+            blobs = [(self.model_id, h, _to_blob(cached[h]), now) for h in missing]
+            # another thread may have added the same text meanwhile, only count the rows inserted
+            inserted = self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model_id, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                blobs
+            ).rowcount
+            if blobs:
+                self.total_bytes += inserted * len(blobs[0][2])
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model_id = ? AND text_hash = ?",
+                [(now, self.model_id, h) for h in set(hashes) if h not in missing]
+            )
+            self.conn.commit()
+        return [cached[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Queries are not cached here, delegate straight to the underlying embeddings"""
+        return self.embeddings.embed_query(text)
+
+    def log_stats(self):
+        """Log cache hits and misses, called once per index build"""
+        total = self.hits + self.misses
+        hit_rate = 100 * self.hits / total if total else 0
+        logger.info(f"Embedding cache {self.cache_path}: hits={self.hits}, misses={self.misses}, "
+                    f"hit rate={hit_rate:.1f}%, evictions={self.evictions}")
+
+
+class QueryEmbeddingCache(BaseModel, Embeddings):
+    """
+    In-memory LRU cache with a TTL in front of embed_query, keyed by (embedding model id, normalized
+    question), so repeated questions are not sent to Bedrock again. Entries older than ttl_seconds are
+    embedded again, at most max_size entries are kept. embed_documents is not cached here.
+    """
+    embeddings: Any = Field(..., description="Underlying Embeddings implementation")
+    model_id: str = Field(..., description="Embedding model ID, part of the cache key")
+    max_size: int = Field(default=1024, description="Maximum number of cached query embeddings")
+    ttl_seconds: float = Field(default=3600, description="Seconds after which a cached query embedding expires")
+    hits: int = Field(default=0, description="Number of queries served from the cache")
+    misses: int = Field(default=0, description="Number of queries sent to the underlying embeddings")
+    clock: Callable[[], float] = Field(default=time.monotonic, exclude=True, description="Clock the age of entries is measured with, in seconds")
+
+    # Initialized in __init__
+    entries: Optional[Any] = Field(default=None, exclude=True)
+    lock: Optional[Any] = Field(default=None, exclude=True)
+
+    class Config:
+        arbitrary_types_allowed = True
+        protected_namespaces = ()
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        # (model id, normalized question) -> (time embedded, vector), least recently used first
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def embed_query(self, text: str) -> List[float]:
+        key = (self.model_id, normalize_query(text))
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        # embed outside the lock so concurrent requests for other questions are not serialized
+        vector = self.embeddings.embed_query(text)
+        with self.lock:
+            self.entries[key] = (now, vector)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many questions in one pass, in input order. Cached questions are served from the cache,
+        the others are embedded once each (through embed_queries of the underlying embeddings if it has it).
+        """
+        keys = [(self.model_id, normalize_query(text)) for text in texts]
+        now = self.clock()
+        vectors, missing = {}, {}
+        with self.lock:
+            for key, text in zip(keys, texts):
+                if key in vectors or key in missing:
+                    continue
+                entry = self.entries.get(key)
+                if entry is not None and now - entry[0] <= self.ttl_seconds:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    vectors[key] = entry[1]
+                else:
+                    self.misses += 1
+                    missing[key] = text
+        if missing:
+            embed_queries = getattr(self.embeddings, "embed_queries", None)
+            embedded = embed_queries(list(missing.values())) if embed_queries else \
+                [self.embeddings.embed_query(text) for text in missing.values()]
+            with self.lock:
+                for key, vector in zip(missing, embedded):
+                    vectors[key] = vector
+                    self.entries[key] = (now, vector)
+                    self.entries.move_to_end(key)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Documents are not cached here, delegate straight to the underlying embeddings"""
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters of the cache"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+        }
@@ -0,0 +1,172 @@
+import time
+import random
+import logging
+import threading
+from pydantic import BaseModel, Field
+from typing import List, Any, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from langchain_core.embeddings import Embeddings
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Error codes/messages returned by Bedrock (and most other providers) when requests are throttled
+THROTTLING_MARKERS = (
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "Too many requests",
+    "Rate exceeded",
+)
+
+
+def is_throttling_error(e: Exception) -> bool:
+    """Check if an exception raised by an embeddings call is due to throttling"""
+    # botocore ClientError carries the error code, BedrockEmbeddings wraps it in a ValueError
+    # so we also look at the message
+    response = getattr(e, "response", None)
+    code = response.get("Error", {}).get("Code", "") if isinstance(response, dict) else ""
+    message = f"{code} {e}"
+    return any(marker in message for marker in THROTTLING_MARKERS)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Additive-increase/multiplicative-decrease limit on the number of in-flight embedding calls.
+    The limit is halved whenever a call is throttled and grows by one after a run of successful calls.
+    """
+
+    def __init__(self, max_concurrency: int, increase_after: int = 10):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.increase_after = increase_after
+        self.in_flight = 0
+        self.throttled = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self._successes = 0
+                self.limit = max(1, self.limit // 2)
+            else:
+                self._successes += 1
+                if self._successes >= self.increase_after and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+class ConcurrentEmbeddings(BaseModel, Embeddings):
+    """
+    Embeddings wrapper that splits embed_documents calls into batches and embeds them on a
+    pool of worker threads. Works with BedrockEmbeddings or any other Embeddings implementation.
+    Concurrency adapts to throttling, results are returned in the same order as the input texts.
+    """
+    embeddings: Any = Field(..., description="Underlying Embeddings implementation")
+    max_workers: int = Field(default=8, description="Maximum number of concurrent embedding calls")
+    batch_size: int = Field(default=16, description="Number of texts sent to the underlying embeddings per call")
+    max_retries: int = Field(default=8, description="Maximum number of retries for a throttled batch")
+    backoff_base: float = Field(default=0.5, description="Base delay in seconds for exponential backoff on throttling")
+    progress_interval: float = Field(default=5.0, description="Minimum number of seconds between progress log lines")
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _embed_batch(self, limiter: AdaptiveConcurrencyLimiter, texts: List[str],
+                     embed: Optional[Callable[[List[str]], List[List[float]]]] = None) -> List[List[float]]:
+        """Embed one batch, backing off and retrying if the call is throttled"""
+        embed = embed or self.embeddings.embed_documents
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            try:
+                result = embed(texts)
+            except Exception as e:
+                if not is_throttling_error(e) or attempt == self.max_retries:
+                    limiter.release()
+                    raise
+                limiter.release(throttled=True)
+                delay = self.backoff_base * (2 ** attempt) * (1 + random.random())
+                logger.warning(f"Embedding batch throttled (attempt {attempt + 1}), concurrency limit now "
+                               f"{limiter.limit}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            limiter.release()
+            return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts concurrently, preserving input order"""
+        return self._embed_concurrently(texts, self.batch_size, self.embeddings.embed_documents)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many questions concurrently with embed_query (models such as Cohere embed questions and
+        documents differently), preserving input order
+        """
+        return self._embed_concurrently(texts, 1, lambda batch: [self.embeddings.embed_query(text) for text in batch])
+
+    def _embed_concurrently(self, texts: List[str], batch_size: int,
+                            embed: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        texts = list(texts)
+        if not texts:
+            return []
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        if self.max_workers <= 1 or len(batches) == 1:
+            workers = 1
+        else:
+            workers = min(self.max_workers, len(batches))
+        limiter = AdaptiveConcurrencyLimiter(workers)
+
+        logger.info(f"Embedding {len(texts)} texts in {len(batches)} batches with {workers} workers")
+        results: List[Optional[List[List[float]]]] = [None] * len(batches)
+        start = last_log = time.perf_counter()
+        done = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._embed_batch, limiter, batch, embed): i for i, batch in enumerate(batches)}
+            try:
+                for future in as_completed(futures):
+                    i = futures[future]
+                    results[i] = future.result()
+                    done += len(batches[i])
+                    now = time.perf_counter()
+                    if now - last_log >= self.progress_interval or done == len(texts):
+                        last_log = now
+                        elapsed = now - start
+                        logger.info(f"Embedded {done}/{len(texts)} texts in {elapsed:.1f}s "
+                                    f"({done / elapsed if elapsed else 0:.1f} texts/s, concurrency limit={limiter.limit}, "
+                                    f"throttled={limiter.throttled})")
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        return [vector for batch in results for vector in batch]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Queries are single calls, delegate straight to the underlying embeddings"""
+        return self.embeddings.embed_query(text)
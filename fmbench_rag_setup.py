@@ -1,23 +1,38 @@
 import os
 import json
+import asyncio
+import uuid
+import hashlib
 import boto3
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
 from botocore.config import Config
 from pydantic import BaseModel, Field
-from langchain.schema import Document
 from colorama import init, Fore, Style
-from typing import List, Dict, Any, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Union
 from langchain_aws import ChatBedrockConverse
 from langchain_community.vectorstores import FAISS
 from langchain.chains import create_retrieval_chain
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
 from langchain_aws.embeddings.bedrock import BedrockEmbeddings
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from botocore.session import get_session
 from botocore.credentials import RefreshableCredentials
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from document_pipeline import batched, iter_chunks
+from embedding_cache import CachedEmbeddings, QueryEmbeddingCache
+from embedding_engine import ConcurrentEmbeddings
+from chunk_dedup import NearDuplicateIndex, is_config_chunk
+from lexical_index import BM25Index
+from partition_index import Filters, PartitionIndex, filters_key
+from retrieval import FMBenchRetriever
+from context_packing import ContextPacker
+from reranker import LexicalReranker
+from answer_cache import SemanticAnswerCache, index_fingerprint
+from build_profile import BuildProfiler, estimate_tokens
+from ann_index import IndexSpec, apply_index_spec, apply_search_params, load_index_spec, save_index_spec, to_flat_index
+from mmap_index import MmapVectorStore, mmap_index_exists, remove_mmap_index, write_mmap_index_from_faiss
 
 # ----------------------------
 # Setup Logging with Colorama
@@ -71,6 +86,10 @@ try:
 except Exception as e:
     logging.error("Error loading .env file: " + str(e))
 
+# Manifest stored next to the FAISS index, maps path -> chunk hash -> vector ids
+MANIFEST_FILE_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
 class FMBenchRagSetup(BaseModel):
     """
     Pydantic model for FMBench RAG Setup that encapsulates the entire configuration and setup process
@@ -80,16 +99,47 @@ class FMBenchRagSetup(BaseModel):
     response_model_id: str = Field(default="us.anthropic.claude-3-5-haiku-20241022-v1:0", description="Bedrock model ID to use") #us.amazon.nova-pro-v1:0" us.anthropic.claude-3-5-haiku-20241022-v1:0
     embedding_model_id: str = Field(default="amazon.titan-embed-text-v1", description="Amazon Bedrock embedding model to use")
     retriever_k: int = Field(default=10, description="Number of documents to retrieve")
+    hybrid_search: bool = Field(default=False, description="Fuse BM25 hits with dense hits (reciprocal rank fusion) when the index has a BM25 index")
+    retriever_fetch_k: int = Field(default=50, description="Number of dense and of BM25 hits fused into the retriever_k documents in hybrid search")
+    rerank_fanout_k: int = Field(default=0, description="Number of fused candidates reranked locally (CPU only, no model call), 0 disables reranking")
+    rerank_final_k: int = Field(default=5, description="Number of reranked chunks passed to the model when reranking, instead of retriever_k")
+    diversify_retrieval: bool = Field(default=False, description="Merge overlapping retrieved chunks of the same path and re-select the retriever_k chunks from retriever_fetch_k candidates by maximal marginal relevance")
+    mmr_lambda: float = Field(default=0.7, description="Weight of relevance against redundancy (1 - mmr_lambda) in maximal marginal relevance re-selection")
+    batch_max_concurrency: int = Field(default=4, description="Default maximum number of concurrent answer generations in query_batch")
+    context_budget_tokens: int = Field(default=0, description="Estimated number of tokens of retrieved context put in the prompt, overlapping chunks are merged and the rest cut to fit, 0 (default) stuffs all retrieved chunks")
     vector_db_path: Optional[str] = Field(default=os.path.join("indexes", "fmbench_index"), description="Path to load/save FAISS vector database")
     bedrock_role_arn: Optional[str] = Field(default=None, description="ARN of the IAM role to assume for Bedrock cross-account access")
+    index_format: str = Field(default="faiss", description="On-disk index format to load at setup: 'faiss' (pickled docstore) or 'mmap' (memory-mapped vectors and lazily decoded chunks)")
+    index_spec: str = Field(default="flat", description="FAISS index type and parameters, e.g. 'flat', 'hnsw:ef_search=128', 'ivf_flat:nprobe=8', 'ivf_pq', 'sq8' or 'sq_fp16'")
+    mmap_dtype: str = Field(default="float32", description="Storage dtype of the vectors in the 'mmap' index format: float32 or float16")
+    embedding_workers: int = Field(default=8, description="Maximum number of concurrent embedding calls when building an index")
+    embedding_batch_size: int = Field(default=16, description="Number of chunks handed to each embedding worker at a time")
+    embedding_cache_path: Optional[str] = Field(default=os.path.join(".cache", "embedding_cache.sqlite3"), description="Path to the on-disk embedding cache used when building an index, None to disable it")
+    preprocess_workers: int = Field(default=1, description="Number of processes used to tag and split documents when building an index, 1 runs in-process")
+    index_batch_size: int = Field(default=256, description="Number of chunks embedded and added to the index per batch when building an index")
+    embedding_cache_max_mb: float = Field(default=512, description="Maximum size of the on-disk embedding cache in MB")
+    query_embedding_cache_size: int = Field(default=1024, description="Maximum number of question embeddings kept in memory for retrieval, 0 disables the cache")
+    query_embedding_cache_ttl: float = Field(default=3600, description="Seconds after which a cached question embedding expires")
+    answer_cache_size: int = Field(default=0, description="Maximum number of answers kept for semantically similar questions, 0 (default) disables the answer cache. It is invalidated when this object loads or builds an index, not when the index on disk is rewritten")
+    answer_cache_threshold: float = Field(default=0.95, description="Minimum cosine similarity between a question and an earlier one to reuse its answer")
+    answer_cache_ttl: float = Field(default=3600, description="Seconds after which a cached answer expires")
+    dedup_threshold: Optional[float] = Field(default=None, description="Estimated Jaccard similarity above which chunks are collapsed into one vector when building an index, None disables near-duplicate elimination")
     
     # These will be initialized in the setup method
     bedrock_client: Optional[Any] = Field(default=None, exclude=True)
     llm: Optional[Any] = Field(default=None, exclude=True)
-    documents: List[Document] = Field(default_factory=list, exclude=True)
     vectorstore: Optional[Any] = Field(default=None, exclude=True)
+    query_embeddings: Optional[Any] = Field(default=None, exclude=True)
+    lexical_index: Optional[Any] = Field(default=None, exclude=True)
+    partition_index: Optional[Any] = Field(default=None, exclude=True)
+    qa_chain: Optional[Any] = Field(default=None, exclude=True)
+    answer_cache: Optional[SemanticAnswerCache] = Field(default=None, exclude=True)
     retriever: Optional[Any] = Field(default=None, exclude=True)
+    context_packer: Optional[ContextPacker] = Field(default=None, exclude=True)
+    reranker: Optional[Any] = Field(default=None, exclude=True, description="Reranker with a score(query, documents, positions) method, defaults to a LexicalReranker when rerank_fanout_k > 0")
     rag_chain: Optional[Any] = Field(default=None, exclude=True)
+    manifest: Dict[str, Dict[str, List[str]]] = Field(default_factory=dict, exclude=True)
+    profiler: BuildProfiler = Field(default_factory=BuildProfiler, exclude=True)
     
     # Configure logger
     logger: logging.Logger = Field(default_factory=lambda: logging.getLogger(__name__), exclude=True)
@@ -112,7 +162,9 @@ class FMBenchRagSetup(BaseModel):
             retries = {
                 'max_attempts': 10,
                 'mode': 'adaptive'
-            }
+            },
+            # Leave room for one connection per embedding worker
+            max_pool_connections=max(10, self.embedding_workers)
         )
         
         # If a role ARN is provided, use cross-account access
@@ -149,6 +201,69 @@ class FMBenchRagSetup(BaseModel):
             self.logger.info(f"Initializing Bedrock client for region: {self.region}")
             return boto3.client("bedrock-runtime", region_name=self.region, config=config)
     
+    def _create_embeddings_model(self, use_cache: bool = False):
+        """
+        Create the Bedrock embeddings model, wrapped so that documents are embedded concurrently.
+        When building an index (use_cache=True) the on-disk embedding cache is put in front of it
+        so that chunks embedded by a previous build are not sent to Bedrock again.
+        """
+        embeddings_model = ConcurrentEmbeddings(
+            embeddings=BedrockEmbeddings(
+                client=self.bedrock_client, 
+                model_id=self.embedding_model_id
+            ),
+            max_workers=self.embedding_workers,
+            batch_size=self.embedding_batch_size
+        )
+        if use_cache and self.embedding_cache_path:
+            embeddings_model = CachedEmbeddings(
+                embeddings=embeddings_model,
+                model_id=self.embedding_model_id,
+                cache_path=self.embedding_cache_path,
+                max_size_mb=self.embedding_cache_max_mb
+            )
+        return embeddings_model
+    
+    def _create_query_embeddings(self):
+        """Embeddings model used for retrieval, with the in-memory query embedding cache in front of it"""
+        embeddings_model = self._create_embeddings_model()
+        if self.query_embedding_cache_size > 0:
+            embeddings_model = QueryEmbeddingCache(
+                embeddings=embeddings_model,
+                model_id=self.embedding_model_id,
+                max_size=self.query_embedding_cache_size,
+                ttl_seconds=self.query_embedding_cache_ttl
+            )
+        self.query_embeddings = embeddings_model
+        return embeddings_model
+    
+    def _update_answer_cache(self):
+        """Create the answer cache, and drop its answers if they were generated from another index"""
+        if self.answer_cache_size <= 0:
+            self.answer_cache = None
+            return
+        if self.answer_cache is None:
+            self.answer_cache = SemanticAnswerCache(
+                threshold=self.answer_cache_threshold,
+                max_size=self.answer_cache_size,
+                ttl_seconds=self.answer_cache_ttl
+            )
+        # answers also depend on the models and on how much context is retrieved
+        self.answer_cache.set_fingerprint(index_fingerprint(
+            self.vectorstore, self.embedding_model_id, self.response_model_id, self.retriever_k, self.context_budget_tokens,
+            self.mmr_lambda if self.diversify_retrieval else None,
+            (self.rerank_fanout_k, self.rerank_final_k) if self.rerank_fanout_k > 0 else None
+        ))
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit and miss counters of the retrieval caches"""
+        stats = {}
+        if isinstance(self.query_embeddings, QueryEmbeddingCache):
+            stats["query_embeddings"] = self.query_embeddings.stats()
+        if self.answer_cache is not None:
+            stats["answers"] = self.answer_cache.stats()
+        return stats
+    
     def setup_logger(self):
         """Set up the logger with proper formatting"""
         # Clear existing handlers to avoid duplicates
@@ -177,108 +292,67 @@ class FMBenchRagSetup(BaseModel):
             model=self.response_model_id
         )
         
-        # Initialize embeddings model
-        embeddings_model = BedrockEmbeddings(
-            client=self.bedrock_client, 
-            model_id=self.embedding_model_id
-        )
+        # Initialize embeddings model, questions are embedded through the query embedding cache
+        embeddings_model = self._create_query_embeddings()
         
         # Check if we should load an existing vector store
-        if self.vector_db_path and os.path.exists(self.vector_db_path):
+        if self.vector_db_path and self.index_format == "mmap" and mmap_index_exists(self.vector_db_path):
+            # Vectors are memory mapped and chunks decoded on retrieval, nothing is unpickled
+            self.logger.info(f"Opening memory-mapped vector store at {self.vector_db_path}")
+            self.vectorstore = MmapVectorStore.load(self.vector_db_path, embeddings_model)
+            self.lexical_index = self._load_lexical_index()
+            self.partition_index = self._load_partition_index()
+            self.logger.info(f"Successfully opened memory-mapped vector store with {len(self.vectorstore)} vectors")
+        elif self.vector_db_path and os.path.exists(self.vector_db_path):
             self.logger.info(f"Loading vector store from {self.vector_db_path}")
             self.vectorstore = FAISS.load_local(self.vector_db_path, embeddings_model, allow_dangerous_deserialization=True)
+            self._configure_index_search()
+            self.lexical_index = self._load_lexical_index()
+            self.partition_index = self._load_partition_index()
             self.logger.info(f"Successfully loaded vector store from {self.vector_db_path}")
         else:
             self.logger.info(f"vector store path {self.vector_db_path} does not exist")
-            # Load documents and create vector store from scratch
-            documents_data = json.loads(self.data_file_path.read_text())
-            self.logger.info(f"Loaded {len(documents_data)} documents from {self.data_file_path}")
-            
-            # Create text splitter
-            # Create specialized text splitter based on content type
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=4000,      # Increased chunk size for better context
-                chunk_overlap=400,    # More overlap to maintain context across chunks
-                separators=[
-                    # Headers (preserve full sections)
-                    "\n# ", "\n## ", "\n### ", "\n#### ",
-                    # Lists and model information
-                    "\n- ", "\n* ", "\n1. ",
-                    # Tables often containing model data
-                    "\n|", "|\n",
-                    # YAML and code blocks
-                    "\n---\n", "\n```", "```\n",
-                    # Paragraphs and other breaks
-                    "\n\n", "\n", " ",
-                    # Fallback
-                    ""
-                ],
-                keep_separator=True,
-                strip_whitespace=False,
-                length_function=len,
-                is_separator_regex=False
-            )
-            
-            # Convert to Document objects and split into chunks
-            docs = []
-            for doc in documents_data:
-                content = doc["content"]
-                # Initialize metadata with file information
-                metadata = {
-                    "filename": doc["filename"],
-                    "path": doc["path"],
-                    "directory": doc["directory"],
-                    "extension": doc["extension"]
-                }
-                # Add any additional metadata if present
-                if "metadata" in doc:
-                    metadata.update(doc["metadata"])
-                
-                # Add content type detection
-                # Detect content type
-                if content.strip().startswith('---') or '.yaml' in metadata.get('source', '').lower() or '.yml' in metadata.get('source', '').lower():
-                    metadata['content_type'] = 'yaml'
-                    # Preserve indentation for YAML
-                    content = '\n'.join(line for line in content.splitlines())
-                elif '```' in content:
-                    metadata['content_type'] = 'markdown_with_code'
-                    # Count code blocks
-                    code_blocks = content.count('```')
-                    metadata['code_blocks_count'] = code_blocks // 2  # Divide by 2 since each block has opening and closing
-                elif any(heading.startswith('#') for heading in content.splitlines()):
-                    metadata['content_type'] = 'markdown_with_headers'
-                    # Extract heading level information
-                    max_heading_level = max(
-                        (len(line.split()[0]) for line in content.splitlines() if line.startswith('#')),
-                        default=0
-                    )
-                    metadata['max_heading_level'] = max_heading_level
-                else:
-                    metadata['content_type'] = 'markdown'
-                
-                docs.append(Document(
-                    page_content=content,
-                    metadata=metadata
-                ))
-            self.documents = text_splitter.split_documents(docs)
-            
-            # Create vector store
-            self.logger.info(f"Creating new vector store with {len(self.documents)} documents")
-            self.vectorstore = FAISS.from_documents(
-                documents=self.documents, 
-                embedding=embeddings_model
-            )
+            embeddings_model = self._create_embeddings_model(use_cache=True)
+            self.profiler = BuildProfiler()
+            # Stream documents and create vector store from scratch
+            self._update_vectorstore(embeddings_model, full_rebuild=True)
+            if isinstance(embeddings_model, CachedEmbeddings):
+                embeddings_model.evict()
+                embeddings_model.log_stats()
             
             # Save vector store if path is specified
             if self.vector_db_path:
-                os.makedirs(os.path.dirname(os.path.abspath(self.vector_db_path)), exist_ok=True)
-                self.logger.info(f"Saving vector store to {self.vector_db_path}")
-                self.vectorstore.save_local(self.vector_db_path)
+                self._save_index()
+            else:
+                with self.profiler.stage("bm25_build"):
+                    self.lexical_index = BM25Index.from_vectorstore(self.vectorstore)
+                with self.profiler.stage("partitions"):
+                    self.partition_index = PartitionIndex.from_vectorstore(self.vectorstore)
+                with self.profiler.stage("ann_build"):
+                    apply_index_spec(self.vectorstore, IndexSpec.parse(self.index_spec))
+            self.profiler.log_summary()
+            # the store was built with the document embedding cache, retrieval goes through the query cache
+            self.vectorstore.embedding_function = self.query_embeddings
         
-        # Create retriever
-        self.retriever = self.vectorstore.as_retriever(
-            search_kwargs={'k': self.retriever_k}
+        self._update_answer_cache()
+        
+        # Create retriever, dense hits are fused with BM25 hits when the index has a BM25 index,
+        # candidates are reranked locally when rerank_fanout_k > 0, with diversify_retrieval the hits
+        # are re-selected by MMR on their stored vectors
+        self.retriever = FMBenchRetriever(
+            vectorstore=self.vectorstore,
+            embeddings=self.query_embeddings,
+            lexical_index=self.lexical_index if self.hybrid_search else None,
+            partition_index=self.partition_index,
+            k=self.rerank_final_k if self.rerank_fanout_k > 0 else self.retriever_k,
+            fetch_k=self.retriever_fetch_k,
+            mmr_lambda=self.mmr_lambda if self.diversify_retrieval else None,
+            merge_overlaps=self.diversify_retrieval,
+            reranker=self._create_reranker(),
+            rerank_fanout_k=self.rerank_fanout_k
         )
+        # Retrieved chunks are packed into the context token budget before they reach the prompt
+        self.context_packer = ContextPacker(budget_tokens=self.context_budget_tokens) if self.context_budget_tokens > 0 else None
         
         # Create prompt template
         system_prompt = (
@@ -316,122 +390,477 @@ class FMBenchRagSetup(BaseModel):
         ])
         
         # Create the chain
-        qa_chain = create_stuff_documents_chain(self.llm, prompt)
-        self.rag_chain = create_retrieval_chain(self.retriever, qa_chain)
+        self.qa_chain = create_stuff_documents_chain(self.llm, prompt)
+        self.rag_chain = self._create_rag_chain(self.retriever)
         
         self.logger.info("RAG setup complete")
         return self
     
-    def create_index(self):
-        """Create a vector index from documents and save it to the specified path"""
+    def _create_reranker(self):
+        """Reranker of the retriever, None when reranking is disabled"""
+        if self.rerank_fanout_k <= 0:
+            return None
+        if self.reranker is None:
+            # idf weights and term presence come from the BM25 index when the index has one
+            self.reranker = LexicalReranker(lexical_index=self.lexical_index)
+        return self.reranker
+    
+    def _create_rag_chain(self, retriever):
+        """Retrieval chain answering from the documents of retriever, packed into the context budget"""
+        if self.context_packer is not None:
+            retriever = RunnableLambda(lambda inputs: inputs["input"]) | retriever | RunnableLambda(self.context_packer.pack)
+        return create_retrieval_chain(retriever, self.qa_chain)
+    
+    def create_index(self, full_rebuild: bool = False, profile_report: Optional[str] = None):
+        """
+        Create a vector index from documents and save it to the specified path.
+        
+        If an index and its manifest from a previous build exist, only new or changed chunks are
+        embedded and vectors belonging to deleted or changed chunks are removed. Pass full_rebuild=True
+        to ignore the existing index and embed everything again.
+        
+        Wall time, CPU time, peak RSS and counters of every stage of the build are logged as a summary
+        at the end, and written as JSON to profile_report if it is set.
+        """
         if not self.vector_db_path:
             raise ValueError("vector_db_path must be set to create and save an index")
         
+        self.profiler = BuildProfiler()
         # Initialize embeddings model
-        embeddings_model = BedrockEmbeddings(
-            client=self.bedrock_client, 
-            model_id=self.embedding_model_id
-        )
+        embeddings_model = self._create_embeddings_model(use_cache=True)
         
-        # Load documents
-        documents_data = json.loads(self.data_file_path.read_text())
-        self.logger.info(f"Loaded {len(documents_data)} documents from {self.data_file_path}")
-        
-        # Create text splitter
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=4000,      # Increased chunk size for better context
-            chunk_overlap=400,    # More overlap to maintain context across chunks
-            separators=[
-                # Headers (preserve full sections)
-                "\n# ", "\n## ", "\n### ", "\n#### ",
-                # Lists and model information
-                "\n- ", "\n* ", "\n1. ",
-                # Tables often containing model data
-                "\n|", "|\n",
-                # YAML and code blocks
-                "\n---\n", "\n```", "```\n",
-                # Paragraphs and other breaks
-                "\n\n", "\n", " ",
-                # Fallback
-                ""
-            ],
-            keep_separator=True,
-            strip_whitespace=False,
-            length_function=len,
-            is_separator_regex=False
-        )
-        
-        # Convert to Document objects with content type detection
-        docs = []
-        for doc in documents_data:
-            content = doc["content"]
-            # Initialize metadata with file information
-            metadata = {
-                "filename": doc["filename"],
-                "path": doc["path"],
-                "directory": doc["directory"],
-                "extension": doc["extension"]
-            }
-            # Add any additional metadata if present
-            if "metadata" in doc:
-                metadata.update(doc["metadata"])
-            
-            # Add content type detection
-            # Detect content type
-            if content.strip().startswith('---') or '.yaml' in metadata.get('source', '').lower() or '.yml' in metadata.get('source', '').lower():
-                metadata['content_type'] = 'yaml'
-                # Preserve indentation for YAML
-                content = '\n'.join(line for line in content.splitlines())
-            elif '```' in content:
-                metadata['content_type'] = 'markdown_with_code'
-                # Count code blocks
-                code_blocks = content.count('```')
-                metadata['code_blocks_count'] = code_blocks // 2  # Divide by 2 since each block has opening and closing
-            elif any(heading.startswith('#') for heading in content.splitlines()):
-                metadata['content_type'] = 'markdown_with_headers'
-                # Extract heading level information
-                max_heading_level = max(
-                    (len(line.split()[0]) for line in content.splitlines() if line.startswith('#')),
-                    default=0
-                )
-                metadata['max_heading_level'] = max_heading_level
-            else:
-                metadata['content_type'] = 'markdown'
-            
-            docs.append(Document(
-                page_content=content,
-                metadata=metadata
-            ))
-        self.documents = text_splitter.split_documents(docs)
-        
-        # Create vector store and save it
-        self.logger.info(f"Creating vector store with {len(self.documents)} documents")
-        self.vectorstore = FAISS.from_documents(
-            documents=self.documents, 
-            embedding=embeddings_model
-        )
+        # Stream, split and embed the documents, only chunks that are new or changed since the
+        # last build are embedded
+        self._update_vectorstore(embeddings_model, full_rebuild=full_rebuild)
+        if isinstance(embeddings_model, CachedEmbeddings):
+            embeddings_model.evict()
+            embeddings_model.log_stats()
         
+        self._save_index()
+        self._update_answer_cache()
+        self.logger.info(f"Vector index created and saved to {self.vector_db_path}")
+        self.profiler.log_summary()
+        if profile_report:
+            self.profiler.write(profile_report)
+        return self
+    
+    def _configure_index_search(self):
+        """Apply the query time parameters of the index spec to a loaded FAISS index"""
+        built = load_index_spec(self.vector_db_path)
+        configured = IndexSpec.parse(self.index_spec)
+        if configured.kind != built.kind:
+            self.logger.warning(f"Index at {self.vector_db_path} was built as '{built}', not '{configured}', "
+                                f"rebuild it with build_index.py --index-spec to change the index type")
+            configured = built
+        apply_search_params(self.vectorstore.index, configured)
+        self.logger.info(f"Using {configured} index for retrieval")
+    
+    def _load_lexical_index(self) -> Optional[BM25Index]:
+        """
+        Load the BM25 index saved next to the vector store, if it matches the vectors of the store and
+        hybrid search or the reranker (idf weights) uses it
+        """
+        if not self.hybrid_search and self.rerank_fanout_k <= 0:
+            return None
+        lexical_index = BM25Index.load(self.vector_db_path)
+        if lexical_index is None:
+            self.logger.info(f"No BM25 index at {self.vector_db_path}, rebuild the index with build_index.py "
+                             f"to enable hybrid search, using dense retrieval only")
+            return None
+        ids = self.vectorstore.index_to_docstore_id
+        if lexical_index.ids != [ids[i] for i in range(len(ids))]:
+            self.logger.warning(f"BM25 index at {self.vector_db_path} does not match the vector store, using dense retrieval only")
+            return None
+        self.logger.info(f"Loaded BM25 index over {len(lexical_index)} chunks")
+        return lexical_index
+    
+    def _load_partition_index(self) -> Optional[PartitionIndex]:
+        """Load the metadata partitions saved next to the vector store, FAISS stores can rebuild them in memory"""
+        partition_index = PartitionIndex.load(self.vector_db_path)
+        if partition_index is not None and partition_index.count == len(self.vectorstore.index_to_docstore_id):
+            return partition_index
+        if isinstance(self.vectorstore, MmapVectorStore):
+            self.logger.info(f"No metadata partitions at {self.vector_db_path}, rebuild the index with build_index.py "
+                             f"to filter retrieval by content_type, directory or extension")
+            return None
+        return PartitionIndex.from_vectorstore(self.vectorstore)
+    
+    @staticmethod
+    def _chunk_hash(text: str) -> str:
+        """Content hash used to recognise a chunk across index builds"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    def _manifest_path(self) -> Path:
+        """Location of the manifest file that lives next to the FAISS index"""
+        return Path(self.vector_db_path) / MANIFEST_FILE_NAME
+    
+    def _load_manifest(self) -> Optional[Dict[str, Any]]:
+        """Load the manifest of a previous build, if it can be reused for this one"""
+        manifest_path = self._manifest_path()
+        if not manifest_path.exists():
+            self.logger.info(f"No manifest found at {manifest_path}, building the index from scratch")
+            return None
+        manifest = json.loads(manifest_path.read_text())
+        if manifest.get("embedding_model_id") != self.embedding_model_id:
+            self.logger.info(f"Manifest was built with embedding model {manifest.get('embedding_model_id')}, "
+                             f"building the index from scratch for {self.embedding_model_id}")
+            return None
+        built = load_index_spec(self.vector_db_path)
+        if not built.lossless:
+            # quantized indexes do not keep the original vectors, re-embedding is served by the embedding cache
+            self.logger.info(f"Existing index is a lossy '{built}' index, building the index from scratch")
+            return None
+        return manifest
+    
+    def _save_manifest(self):
+        """Write the path -> chunk hash -> vector id manifest next to the FAISS index"""
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "embedding_model_id": self.embedding_model_id,
+            "files": self.manifest,
+        }
+        self._manifest_path().write_text(json.dumps(manifest, indent=2, sort_keys=True))
+        self.logger.info(f"Saved manifest for {len(self.manifest)} files to {self._manifest_path()}")
+    
+    def _save_index(self):
+        """
+        Save the vector store and its manifest to vector_db_path. The FAISS files are always written since
+        incremental rebuilds start from them, with index_format='mmap' the memory-mappable files are
+        written next to them. The flat index built by _update_vectorstore is converted to index_spec
+        right before it is saved.
+        """
         # Create directory if it doesn't exist
         os.makedirs(os.path.dirname(os.path.abspath(self.vector_db_path)), exist_ok=True)
         
-        self.logger.info(f"Saving vector store to {self.vector_db_path}")
-        self.vectorstore.save_local(self.vector_db_path)
+        # The memory-mapped format is written from the flat index, it always does exact search
+        if self.index_format == "mmap":
+            with self.profiler.stage("mmap_write"):
+                write_mmap_index_from_faiss(self.vectorstore, self.vector_db_path, dtype=self.mmap_dtype)
+        elif mmap_index_exists(self.vector_db_path):
+            # Do not leave a memory-mapped copy behind that no longer matches the FAISS index
+            self.logger.info(f"Removing stale memory-mapped index from {self.vector_db_path}")
+            remove_mmap_index(self.vector_db_path)
         
-        self.logger.info(f"Vector index created and saved to {self.vector_db_path}")
-        return self
+        # BM25 rows follow the order of the vectors, which apply_index_spec keeps
+        with self.profiler.stage("bm25_build"):
+            self.lexical_index = BM25Index.from_vectorstore(self.vectorstore)
+            self.lexical_index.save(self.vector_db_path)
+        with self.profiler.stage("partitions"):
+            self.partition_index = PartitionIndex.from_vectorstore(self.vectorstore)
+            self.partition_index.save(self.vector_db_path)
+        
+        spec = IndexSpec.parse(self.index_spec)
+        with self.profiler.stage("ann_build"):
+            apply_index_spec(self.vectorstore, spec)
+        self.logger.info(f"Saving {spec} vector store to {self.vector_db_path}")
+        with self.profiler.stage("save_local"):
+            self.vectorstore.save_local(self.vector_db_path)
+            save_index_spec(self.vector_db_path, spec)
+        self.profiler.count("save_local", vectors=self.vectorstore.index.ntotal)
+        with self.profiler.stage("manifest"):
+            self._save_manifest()
+    
+    def _update_vectorstore(self, embeddings_model, full_rebuild: bool = False):
+        """
+        Bring the vector store in line with the documents file, embedding only the chunks that are
+        not already present in the index of a previous build (as recorded in its manifest).
+        Vectors for chunks that no longer exist (deleted or changed files) are removed.
+        
+        Documents are streamed from the data file and their chunks are embedded and added to the
+        index in batches of index_batch_size, so peak memory is bounded by the batch size rather
+        than by the size of the corpus.
+        
+        With dedup_threshold set, a chunk that is a near-duplicate (MinHash estimate of the Jaccard
+        similarity of word shingles) of a chunk seen earlier in the build is not embedded, it shares
+        the vector of that chunk whose "paths" metadata lists the paths of all the chunks it stands for.
+        Config chunks (YAML and other config files) are only collapsed into identical chunks, near-identical
+        configs differ in values such as the instance type that the answer must cite from the right file.
+        """
+        previous = None
+        if not full_rebuild and os.path.exists(self.vector_db_path):
+            previous = self._load_manifest()
+        
+        self.vectorstore = None
+        if previous is not None:
+            self.logger.info(f"Loading existing vector store from {self.vector_db_path} for an incremental update")
+            with self.profiler.stage("index_load"):
+                self.vectorstore = FAISS.load_local(self.vector_db_path, embeddings_model, allow_dangerous_deserialization=True)
+                # updates (deletes in particular) are applied to a flat index, the index spec is applied again on save
+                if load_index_spec(self.vector_db_path).kind != "flat":
+                    self.vectorstore.index = to_flat_index(self.vectorstore.index)
+        previous_files = previous["files"] if previous is not None else {}
+        existing_ids = set(self.vectorstore.index_to_docstore_id.values()) if self.vectorstore is not None else set()
+        
+        self.manifest = {}
+        reused_ids, added, chunks = set(), 0, 0
+        dedup = NearDuplicateIndex(self.dedup_threshold) if self.dedup_threshold else None
+        # chunk hash -> vector id of the first copy of each config chunk, exact matches only
+        config_representatives: Dict[str, str] = {}
+        # representative vector id -> paths of the chunks collapsed into it, its own path first
+        collapsed_paths: Dict[str, List[str]] = {}
+        self.logger.info(f"Streaming documents from {self.data_file_path} in batches of {self.index_batch_size} chunks")
+        chunk_stream = iter_chunks(self.data_file_path, workers=self.preprocess_workers, profiler=self.profiler)
+        for batch in batched(chunk_stream, self.index_batch_size):
+            reused, new_docs, new_ids = {}, [], []
+            for doc in batch:
+                chunks += 1
+                path = doc.metadata["path"]
+                chunk_hash = self._chunk_hash(doc.page_content)
+                ids = self.manifest.setdefault(path, {}).setdefault(chunk_hash, [])
+                if dedup is not None:
+                    if is_config_chunk(doc.metadata):
+                        representative, signature = config_representatives.get(chunk_hash), None
+                    else:
+                        with self.profiler.stage("dedup"):
+                            representative, signature = dedup.find(doc.page_content)
+                    if representative is not None:
+                        ids.append(representative)
+                        if path not in collapsed_paths[representative]:
+                            collapsed_paths[representative].append(path)
+                        continue
+                # A file can contain the same chunk more than once, consume previous ids in order
+                candidates = previous_files.get(path, {}).get(chunk_hash, [])
+                candidate = candidates[len(ids)] if len(ids) < len(candidates) else None
+                if self._can_reuse(candidate, chunk_hash, existing_ids, reused_ids, reused):
+                    vector_id = candidate
+                    reused[candidate] = doc
+                else:
+                    vector_id = str(uuid.uuid4())
+                    new_docs.append(doc)
+                    new_ids.append(vector_id)
+                ids.append(vector_id)
+                if dedup is not None:
+                    if signature is None:
+                        config_representatives[chunk_hash] = vector_id
+                    else:
+                        dedup.add(vector_id, signature)
+                    collapsed_paths[vector_id] = [path]
+            
+            if reused:
+                # Refresh the stored documents so metadata changes are picked up without re-embedding
+                with self.profiler.stage("docstore"):
+                    self.vectorstore.docstore.delete(list(reused))
+                    self.vectorstore.docstore.add(reused)
+                self.profiler.count("docstore", chunks=len(reused))
+                reused_ids.update(reused)
+            if new_docs:
+                self.logger.info(f"Embedding {len(new_docs)} new or changed chunks")
+                self._embed_and_add(embeddings_model, new_docs, new_ids)
+                added += len(new_docs)
+        
+        dropped = list(existing_ids - reused_ids)
+        if dropped:
+            with self.profiler.stage("delete"):
+                self.vectorstore.delete(dropped)
+            self.profiler.count("delete", vectors=len(dropped))
+        if self.vectorstore is None:
+            raise ValueError(f"No chunks found in {self.data_file_path}, cannot create an index")
+        if dedup is not None:
+            with self.profiler.stage("dedup"):
+                self._record_collapsed_paths(collapsed_paths, chunks)
+        
+        self.logger.info(f"Index update complete: reused={len(reused_ids)}, added={added}, dropped={len(dropped)} chunks")
+        return self.vectorstore
+    
+    def _embed_and_add(self, embeddings_model, docs: List[Any], ids: List[str]):
+        """Embed a batch of chunks and add them to the vector store, profiled as separate stages"""
+        texts = [doc.page_content for doc in docs]
+        # texts served by the embedding cache do not reach Bedrock
+        misses = getattr(embeddings_model, "misses", 0)
+        with self.profiler.stage("embed"):
+            vectors = embeddings_model.embed_documents(texts)
+        api_calls = embeddings_model.misses - misses if isinstance(embeddings_model, CachedEmbeddings) else len(texts)
+        self.profiler.count("embed", chunks=len(texts), chars=sum(len(t) for t in texts),
+                            tokens=sum(estimate_tokens(t) for t in texts), api_calls=api_calls)
+        
+        with self.profiler.stage("faiss_add"):
+            text_embeddings = list(zip(texts, vectors))
+            metadatas = [doc.metadata for doc in docs]
+            if self.vectorstore is None:
+                self.vectorstore = FAISS.from_embeddings(text_embeddings, embeddings_model, metadatas=metadatas, ids=ids)
+            else:
+                self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        self.profiler.count("faiss_add", vectors=len(ids))
+    
+    def _can_reuse(self, candidate: Optional[str], chunk_hash: str, existing_ids: set, reused_ids: set, reused: Dict) -> bool:
+        """
+        A vector id from the previous manifest can be reused if it is still in the index, has not been
+        taken by another chunk of this build and was embedded from this very chunk. With near-duplicate
+        elimination the manifest maps collapsed chunks to the id of another chunk, whose vector only
+        belongs to them while that chunk is around.
+        """
+        if candidate is None or candidate not in existing_ids or candidate in reused_ids or candidate in reused:
+            return False
+        stored = self.vectorstore.docstore.search(candidate)
+        return getattr(stored, "page_content", None) is not None and self._chunk_hash(stored.page_content) == chunk_hash
+    
+    def _record_collapsed_paths(self, collapsed_paths: Dict[str, List[str]], chunks: int):
+        """Store the paths of collapsed near-duplicates on their representative and report the savings"""
+        for vector_id, paths in collapsed_paths.items():
+            if len(paths) > 1:
+                self.vectorstore.docstore.search(vector_id).metadata["paths"] = paths
+        vectors = len(collapsed_paths)
+        collapsed = chunks - vectors
+        saved_mb = collapsed * self.vectorstore.index.d * 4 / (1024 * 1024)
+        self.logger.info(f"Near-duplicate elimination (threshold={self.dedup_threshold}): {chunks} chunks stored as "
+                         f"{vectors} vectors, {collapsed} collapsed, index {100 * collapsed / chunks:.1f}% smaller "
+                         f"(~{saved_mb:.1f} MB of float32 vectors saved)")
     
-    def query(self, question: str) -> Dict[str, Any]:
-        """Run a query through the RAG system"""
+    def query(self, question: str, filters: Optional[Filters] = None) -> Dict[str, Any]:
+        """
+        Run a query through the RAG system. filters restricts retrieval to chunks with the given
+        content_type, directory (including subdirectories) and/or extension, e.g.
+        {"content_type": "yaml", "directory": "fmbench/configs"}, a list of values matches any of them.
+        """
         if not self.rag_chain:
             self.logger.warning("RAG chain not initialized, running setup first")
             self.setup()
             
-        self.logger.info(f"Processing query: {question}")
-        result = self.rag_chain.invoke({"input": question})
+        self.logger.info(f"Processing query: {question}" + (f" with filters {filters}" if filters else ""))
+        rag_chain = self._rag_chain_for(filters)
+        question_vector = None
+        if self.answer_cache is not None:
+            # goes through the query embedding cache, so the retriever does not embed the question again
+            question_vector = self.query_embeddings.embed_query(question)
+            cached = self.answer_cache.lookup(question_vector, scope=filters_key(filters))
+            if cached is not None:
+                self.logger.info(f"answer={cached.answer}")
+                self.logger.info(f"cache stats={self.cache_stats()}")
+                return cached.answer
+        
+        result = rag_chain.invoke({"input": question})
         self.logger.info(f"\n\nresult={result}\n\n")
-        # Build citations from document paths instead of URLs
-        citations = "Source(s): " + "\n".join([d.metadata['path'] for d in result['context']])
-        self.logger.info(f"citations={citations}")
-        answer = f"{result['answer']}\n\n{citations}"
+        answer, paths = self._cite(result['answer'], result['context'])
         self.logger.info(f"answer={answer}")
+        if self.answer_cache is not None:
+            self.answer_cache.add(question, question_vector, answer, paths, scope=filters_key(filters))
+        self.logger.info(f"cache stats={self.cache_stats()}")
         return answer
+    
+    async def aquery(self, question: str, filters: Optional[Filters] = None) -> str:
+        """
+        Async version of query, for use from an event loop: embedding, retrieval and generation are awaited
+        (blocking calls run in the default executor) so concurrent questions overlap.
+        """
+        if not self.rag_chain:
+            self.logger.warning("RAG chain not initialized, running setup first")
+            await asyncio.to_thread(self.setup)
+        
+        self.logger.info(f"Processing async query: {question}" + (f" with filters {filters}" if filters else ""))
+        rag_chain = self._rag_chain_for(filters)
+        question_vector = None
+        if self.answer_cache is not None:
+            # goes through the query embedding cache, so the retriever does not embed the question again
+            question_vector = await self.query_embeddings.aembed_query(question)
+            cached = self.answer_cache.lookup(question_vector, scope=filters_key(filters))
+            if cached is not None:
+                self.logger.info(f"answer={cached.answer}")
+                self.logger.info(f"cache stats={self.cache_stats()}")
+                return cached.answer
+        
+        result = await rag_chain.ainvoke({"input": question})
+        self.logger.info(f"\n\nresult={result}\n\n")
+        answer, paths = self._cite(result['answer'], result['context'])
+        self.logger.info(f"answer={answer}")
+        if self.answer_cache is not None:
+            self.answer_cache.add(question, question_vector, answer, paths, scope=filters_key(filters))
+        self.logger.info(f"cache stats={self.cache_stats()}")
+        return answer
+    
+    def _rag_chain_for(self, filters: Optional[Filters]):
+        """The RAG chain, restricted to the chunks matching filters if any"""
+        if not filters:
+            return self.rag_chain
+        return self._create_rag_chain(self.retriever.model_copy(update={"filters": filters}))
+    
+    def _cite(self, answer: str, context: List[Any]):
+        """Answer followed by the citations of the context documents, and the cited paths"""
+        # Build citations from document paths instead of URLs
+        # near-duplicate chunks collapsed at index build time carry the paths of all their sources
+        paths = list(dict.fromkeys(p for d in context for p in d.metadata.get('paths', [d.metadata['path']])))
+        citations = "Source(s): " + "\n".join(paths)
+        self.logger.info(f"citations={citations}")
+        return f"{answer}\n\n{citations}", paths
+    
+    def _batch_stage(self, stage: str, items: List[Any], run_all: Callable[[List[Any]], List[Any]],
+                     run_one: Callable[[Any], Any]) -> List[Any]:
+        """
+        Results of run_all over items. If it raises, run_one is tried on each item so one bad question does
+        not fail the whole batch, the exception of an item that still fails takes its place in the results.
+        """
+        if not items:
+            return []
+        try:
+            return run_all(items)
+        except Exception as e:
+            self.logger.warning(f"Batch {stage} of {len(items)} queries failed ({type(e).__name__}: {e}), retrying one query at a time")
+        outputs = []
+        for item in items:
+            try:
+                outputs.append(run_one(item))
+            except Exception as e:
+                outputs.append(e)
+        return outputs
+    
+    def _failed(self, i: int, question: str, error: Exception) -> Dict[str, Any]:
+        self.logger.error(f"Query {i} failed: {question}: {error}")
+        return {"question": question, "answer": None, "citations": [], "error": f"{type(error).__name__}: {error}"}
+    
+    def query_batch(self, questions: List[str], filters: Optional[Filters] = None,
+                    max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Run many questions through the RAG system, e.g. for offline evaluation. All questions are embedded
+        in one pass and searched as one matrix search, answers are generated concurrently by up to
+        max_concurrency (default batch_max_concurrency) threads. Returns one dict per question in input
+        order with the question, answer, citations and error (None unless that question failed). If the
+        shared embedding pass or matrix search raises, questions are embedded and searched one at a time.
+        """
+        if not self.rag_chain:
+            self.logger.warning("RAG chain not initialized, running setup first")
+            self.setup()
+        
+        max_concurrency = max_concurrency or self.batch_max_concurrency
+        self.logger.info(f"Processing batch of {len(questions)} queries with up to {max_concurrency} concurrent generations"
+                         + (f" with filters {filters}" if filters else ""))
+        retriever = self.retriever.model_copy(update={"filters": filters}) if filters else self.retriever
+        scope = filters_key(filters)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+        vectors = self._batch_stage("embedding", questions, self.query_embeddings.embed_queries,
+                                    self.query_embeddings.embed_query)
+        pending, from_cache = [], 0
+        for i, (question, vector) in enumerate(zip(questions, vectors)):
+            if isinstance(vector, Exception):
+                results[i] = self._failed(i, question, vector)
+                continue
+            cached = self.answer_cache.lookup(vector, scope=scope) if self.answer_cache is not None else None
+            if cached is not None:
+                results[i] = {"question": question, "answer": cached.answer, "citations": cached.citations, "error": None}
+                from_cache += 1
+            else:
+                pending.append(i)
+        
+        contexts = self._batch_stage(
+            "retrieval", [(questions[i], vectors[i]) for i in pending],
+            lambda items: retriever.batch_documents([q for q, _ in items], [v for _, v in items]),
+            lambda item: retriever.batch_documents([item[0]], [item[1]])[0])
+        retrieved = []
+        for i, docs in zip(pending, contexts):
+            if isinstance(docs, Exception):
+                results[i] = self._failed(i, questions[i], docs)
+            else:
+                retrieved.append((i, self.context_packer.pack(docs) if self.context_packer is not None else docs))
+        outputs = self.qa_chain.batch([{"input": questions[i], "context": docs} for i, docs in retrieved],
+                                      config={"max_concurrency": max_concurrency}, return_exceptions=True)
+        for (i, docs), output in zip(retrieved, outputs):
+            if isinstance(output, Exception):
+                results[i] = self._failed(i, questions[i], output)
+                continue
+            answer, paths = self._cite(output, docs)
+            if self.answer_cache is not None:
+                self.answer_cache.add(questions[i], vectors[i], answer, paths, scope=scope)
+            results[i] = {"question": questions[i], "answer": answer, "citations": paths, "error": None}
+        
+        failed = sum(result["error"] is not None for result in results)
+        self.logger.info(f"Batch of {len(questions)} queries done, {from_cache} from the answer cache, "
+                         f"{failed} failed, cache stats={self.cache_stats()}")
+        return results
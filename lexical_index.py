@@ -0,0 +1,149 @@
+import re
+import logging
+import numpy as np
+from pathlib import Path
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# BM25 index stored next to index.faiss, rows are in the same order as the vectors of the index
+LEXICAL_INDEX_FILE = "bm25.npz"
+
+# Identifiers such as g5.2xlarge, config-llama3-8b-inf2.yml or fmbench/configs are kept as one token
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+_SEPARATOR = re.compile(r"[._\-/]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, compound identifiers are indexed both whole and as their parts"""
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if _SEPARATOR.search(token):
+            tokens.extend(_SEPARATOR.split(token))
+    return tokens
+
+
+class BM25Index:
+    """
+    Inverted index with Okapi BM25 scoring over the chunks of the vector store. Postings are stored as
+    flat numpy arrays (document row and term frequency, grouped by term), rows are the positions of the
+    chunks in the FAISS index, so lexical hits can be fused with dense hits without any lookups.
+    """
+
+    def __init__(self, terms: Sequence[str], offsets: np.ndarray, postings: np.ndarray, frequencies: np.ndarray,
+                 doc_lengths: np.ndarray, ids: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.terms = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.doc_lengths = doc_lengths
+        self.ids = list(ids)
+        self.k1, self.b = k1, b
+        count = len(doc_lengths)
+        document_frequency = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((count - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        average_length = float(doc_lengths.mean()) if count else 0.0
+        # per document part of the BM25 denominator
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / average_length)).astype(np.float32) if count else doc_lengths
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, texts: Sequence[str], ids: Sequence[str]) -> "BM25Index":
+        """Build the index over texts, ids are the vector store ids of the texts in index order"""
+        vocabulary: Dict[str, int] = {}
+        rows, term_ids, counts, doc_lengths = [], [], [], []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                rows.append(row)
+                counts.append(count)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=offsets[1:])
+        index = cls(
+            terms=list(vocabulary),
+            offsets=offsets,
+            postings=np.asarray(rows, dtype=np.int32)[order],
+            frequencies=np.asarray(counts, dtype=np.float32)[order],
+            doc_lengths=np.asarray(doc_lengths, dtype=np.float32),
+            ids=ids,
+        )
+        logger.info(f"Built BM25 index over {len(texts)} chunks with {len(vocabulary)} terms")
+        return index
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "BM25Index":
+        """Build the index over the chunks of a FAISS vector store, in index order"""
+        ids = [vectorstore.index_to_docstore_id[i] for i in range(len(vectorstore.index_to_docstore_id))]
+        return cls.build([vectorstore.docstore.search(doc_id).page_content for doc_id in ids], ids)
+
+    def save(self, path: Union[str, Path]):
+        terms = sorted(self.terms, key=self.terms.get)
+        Path(path).mkdir(parents=True, exist_ok=True)
+        np.savez(Path(path) / LEXICAL_INDEX_FILE, terms=np.asarray(terms, dtype=str), offsets=self.offsets,
+                 postings=self.postings, frequencies=self.frequencies, doc_lengths=self.doc_lengths,
+                 ids=np.asarray(self.ids, dtype=str))
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> Optional["BM25Index"]:
+        """Load the index saved at path, None if the index was built before BM25 indexes were saved"""
+        index_path = Path(path) / LEXICAL_INDEX_FILE
+        if not index_path.exists():
+            return None
+        with np.load(index_path, allow_pickle=False) as data:
+            return cls(terms=data["terms"].tolist(), offsets=data["offsets"], postings=data["postings"],
+                       frequencies=data["frequencies"], doc_lengths=data["doc_lengths"], ids=data["ids"].tolist())
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for query"""
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows, tf = self.postings[start:end], self.frequencies[start:end]
+            # every row appears once in the postings of a term, so fancy-index += is safe
+            scores[rows] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.length_norm[rows])
+        return scores
+
+    def search(self, query: str, k: int, positions: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows and scores of the k best matching chunks, best first, only chunks matching a query term.
+        If positions is given only those rows are considered.
+        """
+        scores = self.scores(query)
+        if positions is not None:
+            mask = np.zeros(len(scores), dtype=bool)
+            mask[positions] = True
+            scores[~mask] = 0
+        matching = np.flatnonzero(scores)
+        if len(matching) > k:
+            matching = matching[np.argpartition(-scores[matching], k - 1)[:k]]
+        order = matching[np.argsort(-scores[matching], kind="stable")]
+        return order, scores[order]
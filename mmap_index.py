@@ -0,0 +1,242 @@
+import os
+import json
+import mmap
+import logging
+import numpy as np
+from pathlib import Path
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Union
+from ann_index import load_index_spec, reconstruct_all
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+# Files making up the memory-mappable index, written next to the FAISS files in the index directory
+MMAP_META_FILE = "mmap_index.json"
+MMAP_VECTORS_FILE = "vectors.bin"
+MMAP_NORMS_FILE = "norms.bin"
+MMAP_DOCS_FILE = "docs.bin"
+MMAP_OFFSETS_FILE = "offsets.bin"
+MMAP_FORMAT_VERSION = 1
+SUPPORTED_DTYPES = ("float32", "float16")
+
+# Number of vectors scored at a time, bounds the temporary memory used by a search
+SEARCH_BLOCK_ROWS = 65536
+
+
+def mmap_index_exists(path: Union[str, Path]) -> bool:
+    """Check if a memory-mappable index has been written to path"""
+    return (Path(path) / MMAP_META_FILE).exists()
+
+
+def remove_mmap_index(path: Union[str, Path]):
+    """Delete the memory-mappable index files from path"""
+    for name in (MMAP_META_FILE, MMAP_VECTORS_FILE, MMAP_NORMS_FILE, MMAP_DOCS_FILE, MMAP_OFFSETS_FILE):
+        (Path(path) / name).unlink(missing_ok=True)
+
+
+def write_mmap_index(path: Union[str, Path], vectors: np.ndarray, documents: List[Document], ids: List[str],
+                     dtype: str = "float32") -> Path:
+    """
+    Write vectors and documents in the memory-mappable format:
+
+    - vectors.bin: raw row-major float32/float16 matrix, one row per chunk
+    - norms.bin: float32 squared L2 norm of every row, so searches need no pass over the vectors at load time
+    - docs.bin: the chunks as UTF-8 JSON records ({"page_content", "metadata"}) one after the other
+    - offsets.bin: uint64 byte offsets of each record in docs.bin (count + 1 entries)
+    - mmap_index.json: count, dimension, dtype and the docstore ids
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported dtype {dtype}, expected one of {SUPPORTED_DTYPES}")
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if len(vectors) != len(documents) or len(documents) != len(ids):
+        raise ValueError(f"Got {len(vectors)} vectors, {len(documents)} documents and {len(ids)} ids")
+
+    vectors.astype(dtype).tofile(path / MMAP_VECTORS_FILE)
+    # norms of the stored (possibly float16) vectors so that distances are consistent with them
+    stored = vectors.astype(dtype).astype(np.float32)
+    np.einsum("ij,ij->i", stored, stored).astype(np.float32).tofile(path / MMAP_NORMS_FILE)
+
+    offsets = np.zeros(len(documents) + 1, dtype=np.uint64)
+    with open(path / MMAP_DOCS_FILE, "wb") as f:
+        for i, doc in enumerate(documents):
+            record = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata},
+                                ensure_ascii=False).encode("utf-8")
+            f.write(record)
+            offsets[i + 1] = offsets[i] + len(record)
+    offsets.tofile(path / MMAP_OFFSETS_FILE)
+
+    meta = {
+        "format_version": MMAP_FORMAT_VERSION,
+        "count": int(vectors.shape[0]),
+        "dimension": int(vectors.shape[1]) if vectors.ndim == 2 and len(vectors) else 0,
+        "dtype": dtype,
+        "distance": "l2",
+        "ids": list(ids),
+    }
+    (path / MMAP_META_FILE).write_text(json.dumps(meta))
+    logger.info(f"Wrote memory-mappable index with {meta['count']} {dtype} vectors to {path}")
+    return path
+
+
+def write_mmap_index_from_faiss(vectorstore, path: Union[str, Path], dtype: str = "float32") -> Path:
+    """Write the contents of a LangChain FAISS vector store in the memory-mappable format"""
+    count = vectorstore.index.ntotal
+    # builds the direct map an IVF index loaded from disk lacks
+    vectors = reconstruct_all(vectorstore.index)
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(count)]
+    documents = [vectorstore.docstore.search(doc_id) for doc_id in ids]
+    return write_mmap_index(path, vectors, documents, ids, dtype=dtype)
+
+
+def convert_faiss_index(src: Union[str, Path], dst: Optional[Union[str, Path]] = None, dtype: str = "float32") -> Path:
+    """Convert an index saved with FAISS.save_local (index.faiss + index.pkl) to the memory-mappable format"""
+    from langchain_community.vectorstores import FAISS
+    dst = dst or src
+    logger.info(f"Converting FAISS index at {src} to the memory-mappable format at {dst}")
+    # the embeddings are not needed to read vectors and documents back
+    vectorstore = FAISS.load_local(str(src), None, allow_dangerous_deserialization=True)
+    spec = load_index_spec(src)
+    if not spec.lossless:
+        logger.warning(f"Index at {src} is {spec}, the memory-mappable index gets its decoded (approximate) vectors")
+    return write_mmap_index_from_faiss(vectorstore, dst, dtype=dtype)
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Read-only vector store over the memory-mappable index format. Vectors are memory mapped and
+    scored with exact (squared) L2 distance, the same metric as the default FAISS flat index.
+    Chunk text and metadata are only decoded for the hits that are returned, so opening the
+    store costs a couple of small file reads regardless of the size of the corpus.
+    """
+
+    def __init__(self, path: Union[str, Path], embedding: Optional[Embeddings] = None):
+        self.path = Path(path)
+        self.embedding = embedding
+        meta = json.loads((self.path / MMAP_META_FILE).read_text())
+        if meta.get("format_version") != MMAP_FORMAT_VERSION:
+            raise ValueError(f"Unsupported memory-mappable index version {meta.get('format_version')} in {self.path}")
+        self.count = meta["count"]
+        self.dimension = meta["dimension"]
+        self.dtype = meta["dtype"]
+        self.index_to_docstore_id = meta["ids"]
+        self._id_to_index = None
+
+        if self.count:
+            self.vectors = np.memmap(self.path / MMAP_VECTORS_FILE, dtype=self.dtype, mode="r",
+                                     shape=(self.count, self.dimension))
+            self.norms = np.memmap(self.path / MMAP_NORMS_FILE, dtype=np.float32, mode="r", shape=(self.count,))
+        else:
+            self.vectors = np.zeros((0, self.dimension), dtype=self.dtype)
+            self.norms = np.zeros(0, dtype=np.float32)
+        self.offsets = np.fromfile(self.path / MMAP_OFFSETS_FILE, dtype=np.uint64)
+        with open(self.path / MMAP_DOCS_FILE, "rb") as f:
+            self._docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    @classmethod
+    def load(cls, path: Union[str, Path], embedding: Optional[Embeddings] = None) -> "MmapVectorStore":
+        return cls(path, embedding)
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get_document(self, i: int) -> Document:
+        """Decode the chunk stored at position i"""
+        record = json.loads(self._docs[int(self.offsets[i]):int(self.offsets[i + 1])])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        if self._id_to_index is None:
+            self._id_to_index = {doc_id: i for i, doc_id in enumerate(self.index_to_docstore_id)}
+        return [self.get_document(self._id_to_index[doc_id]) for doc_id in ids if doc_id in self._id_to_index]
+
+    def reconstruct(self, positions: Iterable[int]) -> np.ndarray:
+        """Return the stored vectors at the given positions as float32"""
+        return np.asarray(self.vectors[np.asarray(list(positions), dtype=np.int64)], dtype=np.float32)
+
+    def search(self, query_vectors: np.ndarray, k: int, positions: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact squared L2 search, same return convention as faiss.Index.search: (distances, indices)
+        arrays of shape (len(query_vectors), k), padded with inf / -1 when fewer than k vectors exist.
+        If positions is given only those rows are searched.
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        rows = np.arange(self.count) if positions is None else np.asarray(positions, dtype=np.int64)
+        n_queries = len(queries)
+        k_eff = min(k, len(rows))
+        distances = np.full((n_queries, k), np.inf, dtype=np.float32)
+        indices = np.full((n_queries, k), -1, dtype=np.int64)
+        if k_eff == 0:
+            return distances, indices
+
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        best_d = np.full((n_queries, 0), np.inf, dtype=np.float32)
+        best_i = np.zeros((n_queries, 0), dtype=np.int64)
+        for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+            block_rows = rows[start:start + SEARCH_BLOCK_ROWS]
+            if positions is None:
+                block = np.asarray(self.vectors[start:start + len(block_rows)], dtype=np.float32)
+                block_norms = np.asarray(self.norms[start:start + len(block_rows)])
+            else:
+                block = np.asarray(self.vectors[block_rows], dtype=np.float32)
+                block_norms = np.asarray(self.norms[block_rows])
+            # ||v - q||^2 = ||v||^2 - 2 v.q + ||q||^2
+            block_d = block_norms[None, :] - 2 * queries @ block.T + query_norms[:, None]
+            cand_d = np.concatenate([best_d, block_d], axis=1)
+            cand_i = np.concatenate([best_i, np.broadcast_to(block_rows, block_d.shape)], axis=1)
+            keep = min(k_eff, cand_d.shape[1])
+            top = np.argpartition(cand_d, keep - 1, axis=1)[:, :keep]
+            best_d = np.take_along_axis(cand_d, top, axis=1)
+            best_i = np.take_along_axis(cand_i, top, axis=1)
+
+        order = np.argsort(best_d, axis=1, kind="stable")
+        distances[:, :k_eff] = np.maximum(np.take_along_axis(best_d, order, axis=1), 0)
+        indices[:, :k_eff] = np.take_along_axis(best_i, order, axis=1)
+        return distances, indices
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        distances, indices = self.search(np.asarray([embedding], dtype=np.float32), k)
+        return [(self.get_document(i), float(d)) for d, i in zip(distances[0], indices[0]) if i >= 0]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return self._euclidean_relevance_score_fn
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("MmapVectorStore is read-only, rebuild the index with build_index.py")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any) -> "MmapVectorStore":
+        raise NotImplementedError("MmapVectorStore is read-only, write it with write_mmap_index or convert_faiss_index")
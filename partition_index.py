@@ -0,0 +1,126 @@
+import os
+import json
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+# Partitions stored next to index.faiss, positions are rows of the index
+PARTITION_INDEX_FILE = "partitions.npz"
+# Chunk metadata fields that retrieval can be restricted to
+PARTITION_FIELDS = ("content_type", "directory", "extension")
+# Number of distinct filters whose selected positions are remembered
+SELECTION_CACHE_SIZE = 256
+
+Filters = Dict[str, Union[str, Sequence[str]]]
+
+
+def _normalize_extension(extension: str) -> str:
+    """Extensions are compared without case and leading dot, so yml, .yml and .YML are the same"""
+    return extension.lower().lstrip(".")
+
+
+def _partition_values(metadata: Dict) -> Iterable[Tuple[str, str]]:
+    """(field, value) pairs a chunk belongs to, near-duplicates collapsed into it add their own paths"""
+    for field in PARTITION_FIELDS:
+        if field in metadata:
+            value = str(metadata[field])
+            yield field, _normalize_extension(value) if field == "extension" else value
+    for path in metadata.get("paths", []):
+        yield "directory", os.path.dirname(path)
+        _, dot, extension = os.path.basename(path).rpartition(".")
+        if dot:
+            yield "extension", _normalize_extension(extension)
+
+
+class PartitionIndex:
+    """
+    Sorted index positions of the chunks of every (field, value) partition of the content_type, directory
+    and extension metadata, stored as one CSR array. select() turns query filters into the positions to
+    search: values of a field are OR-ed, fields are AND-ed, and a directory also matches its subdirectories.
+    """
+
+    def __init__(self, keys: Sequence[str], offsets: np.ndarray, positions: np.ndarray, count: int):
+        self.partitions = {tuple(key.split("\t", 1)): i for i, key in enumerate(keys)}
+        self.offsets = offsets
+        self.positions = positions
+        self.count = count
+        self._selections: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def build(cls, metadatas: Sequence[Dict]) -> "PartitionIndex":
+        """Build the partitions of chunks given by their metadata, in index order"""
+        members: Dict[Tuple[str, str], List[int]] = {}
+        for position, metadata in enumerate(metadatas):
+            for key in dict.fromkeys(_partition_values(metadata)):
+                members.setdefault(key, []).append(position)
+        keys = sorted(members)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(members[key]) for key in keys], out=offsets[1:])
+        positions = np.concatenate([np.asarray(members[key], dtype=np.int64) for key in keys]) if keys else np.zeros(0, dtype=np.int64)
+        return cls(["\t".join(key) for key in keys], offsets, positions, len(metadatas))
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore) -> "PartitionIndex":
+        """Build the partitions of the chunks of a FAISS vector store, in index order"""
+        ids = [vectorstore.index_to_docstore_id[i] for i in range(len(vectorstore.index_to_docstore_id))]
+        return cls.build([vectorstore.docstore.search(doc_id).metadata for doc_id in ids])
+
+    def save(self, path: Union[str, Path]):
+        keys = sorted(self.partitions, key=self.partitions.get)
+        Path(path).mkdir(parents=True, exist_ok=True)
+        np.savez(Path(path) / PARTITION_INDEX_FILE, keys=np.asarray(["\t".join(key) for key in keys], dtype=str),
+                 offsets=self.offsets, positions=self.positions, count=np.asarray(self.count))
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> Optional["PartitionIndex"]:
+        """Load the partitions saved at path, None if the index was built before partitions were saved"""
+        index_path = Path(path) / PARTITION_INDEX_FILE
+        if not index_path.exists():
+            return None
+        with np.load(index_path, allow_pickle=False) as data:
+            return cls(data["keys"].tolist(), data["offsets"], data["positions"], int(data["count"]))
+
+    def values(self, field: str) -> Dict[str, int]:
+        """Values of a field with their number of chunks"""
+        return {value: int(self.offsets[i + 1] - self.offsets[i])
+                for (f, value), i in self.partitions.items() if f == field}
+
+    def _members(self, field: str, value: str) -> np.ndarray:
+        if field == "directory":
+            # a directory matches its subdirectories too, "" (the repository root) matches everything
+            value = value.strip("/")
+            keys = [key for key in self.partitions if key[0] == field and
+                    (not value or key[1] == value or key[1].startswith(value + "/"))]
+        else:
+            keys = [(field, _normalize_extension(value) if field == "extension" else value)]
+        parts = [self.positions[self.offsets[i]:self.offsets[i + 1]]
+                 for i in (self.partitions.get(key) for key in keys) if i is not None]
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def select(self, filters: Filters) -> np.ndarray:
+        """Sorted positions of the chunks matching all filters"""
+        key = filters_key(filters)
+        if key not in self._selections:
+            if len(self._selections) >= SELECTION_CACHE_SIZE:
+                self._selections.pop(next(iter(self._selections)))
+            self._selections[key] = self._select(filters)
+        return self._selections[key]
+
+    def _select(self, filters: Filters) -> np.ndarray:
+        selected = None
+        for field, values in filters.items():
+            if field not in PARTITION_FIELDS:
+                raise ValueError(f"Cannot filter on '{field}', filters are supported on {', '.join(PARTITION_FIELDS)}")
+            values = [values] if isinstance(values, str) else list(values)
+            members = np.unique(np.concatenate([self._members(field, value) for value in values])) if values \
+                else np.zeros(0, dtype=np.int64)
+            selected = members if selected is None else np.intersect1d(selected, members, assume_unique=True)
+        return np.arange(self.count) if selected is None else selected
+
+
+def filters_key(filters: Optional[Filters]) -> str:
+    """Canonical string form of filters, used to tell apart answers cached for different filters"""
+    if not filters:
+        return ""
+    return json.dumps({field: sorted([values] if isinstance(values, str) else values)
+                       for field, values in filters.items()}, sort_keys=True)
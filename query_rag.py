@@ -0,0 +1,116 @@
+import sys
+import json
+import logging
+import argparse
+from pathlib import Path
+from fmbench_rag_setup import FMBenchRagSetup
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def read_questions(path: str):
+    """Questions of a batch file: one JSON object with a "question" key per line (.jsonl) or one question per line"""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            questions.append(json.loads(line)["question"] if path.endswith(".jsonl") else line)
+    return questions
+
+
+def main():
+    """Answer one question, or every question of a batch file, with the FMBench RAG system"""
+    parser = argparse.ArgumentParser(description="Query the FMBench RAG system from the command line")
+    parser.add_argument("--question", type=str, default=None,
+                        help="Question to answer")
+    parser.add_argument("--batch-file", type=str, default=None,
+                        help="Answer every question of this file (one per line, or JSON Lines with a \"question\" key) with query_batch")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the batch results as JSON Lines to this file instead of stdout")
+    parser.add_argument("--max-concurrency", type=int, default=4,
+                        help="Maximum number of concurrent answer generations in batch mode")
+    parser.add_argument("--vector-db-path", type=str, default="indexes/fmbench_index",
+                        help="Path of the index built with build_index.py")
+    parser.add_argument("--index-format", type=str, default="faiss", choices=["faiss", "mmap"],
+                        help="On-disk index format to load")
+    parser.add_argument("--region", type=str, default="us-east-1",
+                        help="AWS region for Bedrock services")
+    parser.add_argument("--response-model", type=str, default="us.anthropic.claude-3-5-haiku-20241022-v1:0",
+                        help="Amazon Bedrock model ID used to answer")
+    parser.add_argument("--embedding-model", type=str, default="amazon.titan-embed-text-v1",
+                        help="Amazon Bedrock embedding model ID, must be the one the index was built with")
+    parser.add_argument("--bedrock-role-arn", type=str, default=None,
+                        help="ARN of the IAM role to assume for Bedrock cross-account access")
+    parser.add_argument("--content-type", type=str, default=None,
+                        help="Only retrieve chunks of this content type")
+    parser.add_argument("--directory", type=str, default=None,
+                        help="Only retrieve chunks of files under this directory")
+    parser.add_argument("--extension", type=str, default=None,
+                        help="Only retrieve chunks of files with this extension")
+
+    args = parser.parse_args()
+    if (args.question is None) == (args.batch_file is None):
+        parser.error("pass exactly one of --question and --batch-file")
+    filters = {field: value for field, value in
+               (("content_type", args.content_type), ("directory", args.directory), ("extension", args.extension)) if value}
+
+    try:
+        rag_setup = FMBenchRagSetup(
+            region=args.region,
+            response_model_id=args.response_model,
+            embedding_model_id=args.embedding_model,
+            vector_db_path=args.vector_db_path,
+            index_format=args.index_format,
+            bedrock_role_arn=args.bedrock_role_arn
+        ).setup()
+
+        if args.question is not None:
+            print(rag_setup.query(args.question, filters=filters or None))
+            return 0
+
+        questions = read_questions(args.batch_file)
+        logger.info(f"Answering {len(questions)} questions from {args.batch_file}")
+        results = rag_setup.query_batch(questions, filters=filters or None, max_concurrency=args.max_concurrency)
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            for result in results:
+                out.write(json.dumps(result) + "\n")
+        finally:
+            if args.output:
+                out.close()
+        failed = sum(result["error"] is not None for result in results)
+        if args.output:
+            logger.info(f"Results written to {Path(args.output)}")
+        if failed:
+            logger.error(f"❌ {failed} of {len(results)} questions failed")
+            return 1
+    except Exception as e:
+        logger.error(f"❌ Error querying: {str(e)}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
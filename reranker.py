@@ -0,0 +1,99 @@
+import re
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+from pydantic import BaseModel, Field
+from langchain_core.documents import Document
+from lexical_index import BM25Index, tokenize
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+_HEADING = re.compile(r"^#{1,6}[ \t]+(.+)$", re.MULTILINE)
+
+
+def _min_max(values: np.ndarray) -> np.ndarray:
+    spread = float(values.max() - values.min()) if len(values) else 0.0
+    return (values - values.min()) / spread if spread > 0 else np.ones_like(values)
+
+
+class LexicalReranker(BaseModel):
+    """
+    CPU-only reranker of retrieved chunks, no model call. A chunk's score mixes its retrieval score with
+    how much of the question it covers (query terms weighted by their BM25 idf), whether its path or
+    markdown headings name query terms (instance types, config files, model ids usually do) and whether
+    it contains pairs of consecutive query words. Any object with the same score() method can be used
+    instead, e.g. a wrapper around a small cross-encoder.
+    """
+    lexical_index: Optional[BM25Index] = Field(default=None, description="BM25 index of the vector store, gives term weights and term presence without tokenizing the chunks")
+    retrieval_weight: float = Field(default=0.4, description="Weight of the (min-max scaled) retrieval score")
+    coverage_weight: float = Field(default=0.3, description="Weight of the idf-weighted share of query terms found in the chunk")
+    field_weight: float = Field(default=0.2, description="Weight of the idf-weighted share of query terms found in the path and headings")
+    phrase_weight: float = Field(default=0.1, description="Weight of the share of consecutive query word pairs found in the chunk")
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _term_weights(self, terms: Sequence[str]) -> Dict[str, float]:
+        if self.lexical_index is None or not len(self.lexical_index.idf):
+            return {term: 1.0 for term in terms}
+        # a term no chunk contains is rare, weigh it like the rarest indexed term
+        rarest = float(self.lexical_index.idf.max())
+        return {term: float(self.lexical_index.idf[self.lexical_index.terms[term]]) if term in self.lexical_index.terms
+                else rarest for term in terms}
+
+    def _coverage(self, weights: Dict[str, float], documents: List[Document],
+                  positions: Optional[Sequence[int]]) -> np.ndarray:
+        """idf-weighted share of the query terms each chunk contains"""
+        total = sum(weights.values()) or 1.0
+        if self.lexical_index is not None and positions is not None:
+            # term presence from the postings of the BM25 index, the chunks are not tokenized again
+            positions = np.asarray(positions, dtype=np.int64)
+            covered = np.zeros(len(documents), dtype=np.float32)
+            for term, weight in weights.items():
+                term_id = self.lexical_index.terms.get(term)
+                if term_id is not None:
+                    rows = self.lexical_index.postings[self.lexical_index.offsets[term_id]:self.lexical_index.offsets[term_id + 1]]
+                    covered += weight * np.isin(positions, rows)
+            return covered / total
+        return np.asarray([sum(weight for term, weight in weights.items() if term in tokens) / total
+                           for tokens in (set(tokenize(doc.page_content)) for doc in documents)], dtype=np.float32)
+
+    def score(self, query: str, documents: List[Document], positions: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Score of each document for query (higher is better), positions are the documents' rows in the index"""
+        if not documents:
+            return np.zeros(0, dtype=np.float32)
+        terms = list(dict.fromkeys(tokenize(query)))
+        weights = self._term_weights(terms)
+        total = sum(weights.values()) or 1.0
+        words = query.lower().split()
+        pairs = [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+        retrieval = _min_max(np.asarray([doc.metadata.get("score", 0.0) for doc in documents], dtype=np.float32))
+        coverage = self._coverage(weights, documents, positions)
+        field = np.zeros(len(documents), dtype=np.float32)
+        phrase = np.zeros(len(documents), dtype=np.float32)
+        for i, doc in enumerate(documents):
+            fields = set(tokenize(" ".join([doc.metadata.get("path", "")] + _HEADING.findall(doc.page_content))))
+            field[i] = sum(weight for term, weight in weights.items() if term in fields) / total
+            if pairs:
+                text = doc.page_content.lower()
+                phrase[i] = sum(pair in text for pair in pairs) / len(pairs)
+        return (self.retrieval_weight * retrieval + self.coverage_weight * coverage +
+                self.field_weight * field + self.phrase_weight * phrase)
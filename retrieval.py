@@ -0,0 +1,218 @@
+import time
+import logging
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from ann_index import reconstruct_positions, selector_search_params
+from context_packing import merge_overlapping
+from lexical_index import BM25Index
+from mmap_index import MmapVectorStore
+from partition_index import Filters, PartitionIndex
+
+# Create logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clear existing handlers to avoid duplicates
+if logger.handlers:
+    logger.handlers.clear()
+
+# Custom formatter with all requested fields separated by commas
+formatter = logging.Formatter(
+    "%(asctime)s.%(msecs)03d,%(levelname)s,p%(process)d,%(filename)s,%(lineno)d,%(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S"
+)
+
+# Add handler with the custom formatter
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def search_vectors_batch(vectorstore, query_vectors: List[List[float]], k: int,
+                         positions: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Positions (rows of the index) and distances of the k nearest chunks of every query vector, searched
+    as one matrix search, for FAISS and mmap stores. If positions is given only those rows are searched.
+    """
+    vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+    if isinstance(vectorstore, MmapVectorStore):
+        distances, indices = vectorstore.search(vectors, k, positions)
+    else:
+        if getattr(vectorstore, "_normalize_L2", False):
+            import faiss
+            faiss.normalize_L2(vectors)
+        params = selector_search_params(vectorstore.index, positions) if positions is not None else None
+        distances, indices = vectorstore.index.search(vectors, k, params=params)
+    found = indices >= 0
+    return [(indices[i][found[i]], distances[i][found[i]]) for i in range(len(vectors))]
+
+
+def search_vectors(vectorstore, query_vector: List[float], k: int,
+                   positions: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Positions (rows of the index) and distances of the k nearest chunks, for FAISS and mmap stores.
+    If positions is given only those rows are searched.
+    """
+    return search_vectors_batch(vectorstore, [query_vector], k, positions)[0]
+
+
+def get_document(vectorstore, position: int) -> Document:
+    """Chunk stored at a position of the index"""
+    if isinstance(vectorstore, MmapVectorStore):
+        return vectorstore.get_document(position)
+    return vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+
+
+def get_vectors(vectorstore, positions: List[int]) -> np.ndarray:
+    """Stored vectors of the chunks at positions of the index, no embedding call is made"""
+    if isinstance(vectorstore, MmapVectorStore):
+        return vectorstore.reconstruct(positions)
+    return reconstruct_positions(vectorstore.index, positions)
+
+
+def maximal_marginal_relevance(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """
+    Indices of k items picked greedily by lambda_mult * relevance - (1 - lambda_mult) * the highest
+    cosine similarity to an item already picked, relevance is scaled to [0, 1] first.
+    """
+    if len(relevance) == 0:
+        return []
+    relevance = relevance / max(float(relevance.max()), 1e-12)
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = unit @ unit.T
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(relevance)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> Dict[int, float]:
+    """Fuse ranked lists of positions, each list contributes 1 / (k + rank) to the score of a position"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking, start=1):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+class FMBenchRetriever(BaseRetriever):
+    """
+    Retriever over the FAISS (or memory-mapped) index. Dense hits are fused with BM25 hits by reciprocal
+    rank fusion when a lexical index is available, so questions naming exact identifiers (instance types,
+    config file names, model ids) find them even when the embedding misses. With filters, only the
+    chunks of the matching content_type / directory / extension partitions are searched. Returned
+    documents are copies of the stored chunks with their fused score in the "score" metadata.
+
+    With mmr_lambda set, the k documents are re-selected from the fetch_k best candidates by maximal
+    marginal relevance, redundancy is measured on the vectors stored in the index so the question is not
+    embedded again. With merge_overlaps, chunks of the same path sharing their overlap are merged.
+
+    With a reranker, the rerank_fanout_k best candidates are scored again locally (reranker.score(query,
+    documents, positions)) and the k best by that score are kept, so fewer chunks reach the prompt.
+    """
+    vectorstore: Any
+    embeddings: Any
+    lexical_index: Optional[BM25Index] = None
+    partition_index: Optional[PartitionIndex] = None
+    filters: Optional[Filters] = None
+    k: int = 10
+    fetch_k: int = 50
+    rrf_k: int = 60
+    mmr_lambda: Optional[float] = None
+    merge_overlaps: bool = False
+    reranker: Optional[Any] = None
+    rerank_fanout_k: int = 50
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _allowed(self) -> Optional[np.ndarray]:
+        """Positions matching the filters, None to search the whole index"""
+        if not self.filters:
+            return None
+        if self.partition_index is None:
+            raise ValueError("This index has no metadata partitions, rebuild it with build_index.py to use filters")
+        allowed = self.partition_index.select(self.filters)
+        logger.info(f"Searching {len(allowed)} of {self.partition_index.count} chunks matching {self.filters}")
+        return allowed
+
+    @property
+    def _dense_k(self) -> int:
+        # fusion, reranking and MMR choose among more candidates than they return
+        if self.reranker is not None:
+            return max(self.fetch_k, self.rerank_fanout_k)
+        return self.k if self.lexical_index is None and self.mmr_lambda is None else self.fetch_k
+
+    def _fuse(self, query: str, dense: np.ndarray, allowed: Optional[np.ndarray]) -> List[Tuple[int, float]]:
+        """(position, score) of the candidate chunks, best first, more than k for fusion and MMR"""
+        if self.lexical_index is None:
+            return list(reciprocal_rank_fusion([dense.tolist()], self.rrf_k).items())
+        lexical, _ = self.lexical_index.search(query, self.fetch_k, allowed)
+        fused = reciprocal_rank_fusion([dense.tolist(), lexical.tolist()], self.rrf_k)
+        # ties keep the dense order
+        return sorted(fused.items(), key=lambda item: -item[1])
+
+    def _candidates(self, query: str) -> List[Tuple[int, float]]:
+        allowed = self._allowed()
+        if allowed is not None and len(allowed) == 0:
+            return []
+        query_vector = self.embeddings.embed_query(query)
+        dense, _ = search_vectors(self.vectorstore, query_vector, self._dense_k, allowed)
+        return self._fuse(query, dense, allowed)
+
+    def _diversify(self, candidates: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+        """k of the candidates re-selected by maximal marginal relevance on their stored vectors"""
+        positions = [position for position, _ in candidates]
+        relevance = np.asarray([score for _, score in candidates], dtype=np.float32)
+        selected = maximal_marginal_relevance(relevance, get_vectors(self.vectorstore, positions), self.k, self.mmr_lambda)
+        return [candidates[i] for i in selected]
+
+    def _rerank(self, query: str, candidates: List[Tuple[int, float]],
+                stored: Dict[int, Document]) -> List[Tuple[int, float]]:
+        """The rerank_fanout_k best candidates scored by the reranker, best first"""
+        candidates = candidates[:self.rerank_fanout_k]
+        start = time.perf_counter()
+        positions = [position for position, _ in candidates]
+        documents = []
+        for position, score in candidates:
+            stored[position] = get_document(self.vectorstore, position)
+            documents.append(Document(page_content=stored[position].page_content,
+                                      metadata={**stored[position].metadata, "score": score}))
+        scores = np.asarray(self.reranker.score(query, documents, positions), dtype=np.float64)
+        order = np.argsort(-scores, kind="stable")
+        logger.info(f"Reranked {len(candidates)} candidates in {(time.perf_counter() - start) * 1e3:.2f} ms, "
+                    f"keeping {min(self.k, len(candidates))}")
+        return [(positions[i], float(scores[i])) for i in order]
+
+    def _documents(self, query: str, candidates: List[Tuple[int, float]]) -> List[Document]:
+        stored: Dict[int, Document] = {}
+        if self.reranker is not None:
+            candidates = self._rerank(query, candidates, stored)
+        candidates = self._diversify(candidates) if self.mmr_lambda is not None else candidates[:self.k]
+        documents = []
+        for position, score in candidates:
+            doc = stored[position] if position in stored else get_document(self.vectorstore, position)
+            # copy, the stored chunk must not pick up per-query metadata
+            documents.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "score": round(score, 6)}))
+        if self.merge_overlaps:
+            documents = merge_overlapping(documents)
+        return documents
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._documents(query, self._candidates(query))
+
+    def batch_documents(self, queries: List[str], query_vectors: List[List[float]]) -> List[List[Document]]:
+        """Documents for many queries whose vectors are already computed, the dense searches run as one matrix search"""
+        allowed = self._allowed()
+        if not queries or (allowed is not None and len(allowed) == 0):
+            return [[] for _ in queries]
+        hits = search_vectors_batch(self.vectorstore, query_vectors, self._dense_k, allowed)
+        return [self._documents(query, self._fuse(query, dense, allowed)) for query, (dense, _) in zip(queries, hits)]
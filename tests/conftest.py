@@ -0,0 +1,89 @@
+import sys
+import json
+import hashlib
+from pathlib import Path
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import BaseMessage
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(REPO_ROOT / "app"))
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic embeddings seeded by the text, no model call. Texts passed to embed_documents are recorded in embedded"""
+
+    def __init__(self, dimension: int = 16):
+        self.dimension = dimension
+        self.embedded: List[str] = []
+
+    def embed_query(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        return np.random.default_rng(seed).random(self.dimension, dtype=np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [self.embed_query(text) for text in texts]
+
+
+class EchoChat(SimpleChatModel):
+    """Answers "answer" to any prompt, fails on prompts containing "generation fails" """
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> str:
+        if "generation fails" in messages[-1].content:
+            raise RuntimeError("throttled")
+        return "answer"
+
+
+@pytest.fixture
+def embeddings():
+    return HashEmbeddings()
+
+
+def write_documents(path: Path, documents: Sequence[Tuple[str, str]]) -> Path:
+    """Documents file in the format of data/documents_1.json from (path, content) pairs"""
+    path.write_text(json.dumps([{"filename": doc_path.rsplit("/", 1)[-1], "path": doc_path,
+                                 "directory": doc_path.rsplit("/", 1)[0] if "/" in doc_path else "",
+                                 "extension": doc_path.rsplit(".", 1)[-1], "content": content}
+                                for doc_path, content in documents]))
+    return path
+
+
+def _rag_setup(tmp_path: Path, monkeypatch, documents, embeddings: Optional[Embeddings], **fields):
+    import fmbench_rag_setup
+    monkeypatch.setattr(fmbench_rag_setup, "BedrockEmbeddings", lambda **kwargs: embeddings or HashEmbeddings())
+    monkeypatch.setattr(fmbench_rag_setup, "ChatBedrockConverse", lambda **kwargs: EchoChat())
+    data_file = write_documents(tmp_path / "documents.json", documents)
+    return fmbench_rag_setup.FMBenchRagSetup(data_file_path=data_file, vector_db_path=str(tmp_path / "index"),
+                                             bedrock_client=object(), embedding_cache_path=None, **fields)
+
+
+@pytest.fixture
+def build_rag(tmp_path, monkeypatch):
+    """Builds an FMBenchRagSetup index over (path, content) pairs with HashEmbeddings and EchoChat instead of Bedrock"""
+
+    def build(documents, embeddings=None, **fields):
+        return _rag_setup(tmp_path, monkeypatch, documents, embeddings, **fields).setup()
+    return build
+
+
+@pytest.fixture
+def build_index(tmp_path, monkeypatch):
+    """Runs create_index (what build_index.py does) over (path, content) pairs into the index directory of build_rag"""
+
+    def build(documents, embeddings=None, full_rebuild=False, **fields):
+        return _rag_setup(tmp_path, monkeypatch, documents, embeddings, **fields).create_index(full_rebuild=full_rebuild)
+    return build
+
+
+DOCUMENTS = [(f"docs/page{i}.md", f"# Page {i}\n\nFMBench page {i} explains how to benchmark model {i} on instance g5.{i}xlarge.")
+             for i in range(12)]
@@ -0,0 +1,84 @@
+import time
+import asyncio
+
+import pytest
+
+from agent_pool import AgentPool
+
+
+class Builder:
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay, self.fail, self.builds = delay, fail, 0
+
+    def __call__(self, key):
+        def build():
+            self.builds += 1
+            time.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("no access to the model")
+            return {"agent": key}
+        return build
+
+
+def test_agents_are_built_once_per_key_and_reused():
+    pool, builder = AgentPool(max_size=4), Builder()
+
+    async def run():
+        first = await pool.get(("us-east-1", "haiku", "1"), builder(("us-east-1", "haiku", "1")))
+        again = await pool.get(("us-east-1", "haiku", "1"), builder(("us-east-1", "haiku", "1")))
+        other = await pool.get(("us-west-2", "haiku", "1"), builder(("us-west-2", "haiku", "1")))
+        return first, again, other
+
+    first, again, other = asyncio.run(run())
+    assert first is again and other is not first
+    stats = pool.stats()
+    assert builder.builds == 2 and stats["hits"] == 1 and stats["misses"] == 2 and stats["size"] == 2
+
+
+def test_concurrent_requests_share_one_build():
+    pool, builder = AgentPool(), Builder(delay=0.2)
+
+    async def run():
+        return await asyncio.gather(*[pool.get("key", builder("key")) for _ in range(5)])
+
+    agents = asyncio.run(run())
+    assert builder.builds == 1 and all(agent is agents[0] for agent in agents)
+    assert pool.stats()["waits"] == 4
+
+
+def test_least_recently_used_agent_is_evicted():
+    pool, builder = AgentPool(max_size=2), Builder()
+
+    async def run():
+        for key in ["a", "b", "a", "c"]:
+            await pool.get(key, builder(key))
+
+    asyncio.run(run())
+    stats = pool.stats()
+    assert stats["keys"] == ["a", "c"] and stats["evictions"] == 1
+
+
+def test_failed_build_is_retried_by_the_next_request():
+    pool, failing = AgentPool(), Builder(fail=True)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await pool.get("key", failing("key"))
+        return await pool.get("key", Builder()("key"))
+
+    assert asyncio.run(run()) == {"agent": "key"}
+    assert pool.stats()["size"] == 1 and pool.stats()["misses"] == 2
+
+
+def test_cancelled_request_does_not_cancel_the_build():
+    pool, builder = AgentPool(), Builder(delay=0.2)
+
+    async def run():
+        first = asyncio.ensure_future(pool.get("key", builder("key")))
+        second = asyncio.ensure_future(pool.get("key", builder("key")))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == {"agent": "key"}
+    assert builder.builds == 1
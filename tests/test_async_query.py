@@ -0,0 +1,17 @@
+import asyncio
+
+from conftest import DOCUMENTS
+
+
+def test_aquery_matches_query(build_rag):
+    rag = build_rag(DOCUMENTS)
+    question = "how to benchmark model 3"
+    assert asyncio.run(rag.aquery(question)) == rag.query(question)
+
+
+def test_aquery_from_the_answer_cache(build_rag):
+    rag = build_rag(DOCUMENTS, answer_cache_size=8)
+    question = "how to benchmark model 3"
+    answer = asyncio.run(rag.aquery(question))
+    assert asyncio.run(rag.aquery(question)) == answer
+    assert rag.cache_stats()["answers"]["hits"] == 1
@@ -0,0 +1,69 @@
+from chunk_dedup import is_config_chunk
+
+CONFIG = """general:
+  name: "llama3-8b-benchmark"
+  model_name: "Llama3-8b-instruct"
+experiments:
+  - name: llama3-8b
+    model_id: meta-llama/Meta-Llama-3-8B-Instruct
+    instance_type: "ml.{instance}"
+    image_uri: 763104351884.dkr.ecr.us-east-1.amazonaws.com/djl-inference:0.26.0-deepspeed0.12.6-cu121
+    deploy: yes
+    instance_count: 1
+    deployment_script: jumpstart.py
+    inference_script: sagemaker_predictor.py
+    payload_files:
+      - payload_en_1-500.jsonl
+      - payload_en_500-1000.jsonl
+      - payload_en_1000-2000.jsonl
+      - payload_en_2000-3000.jsonl
+      - payload_en_3000-4000.jsonl
+    concurrency_levels:
+      - 1
+      - 2
+      - 4
+      - 8
+    accept_eula: true
+    env:
+      TENSOR_PARALLEL_DEGREE: 1
+      MAX_BATCH_SIZE: 4
+      MAX_INPUT_LENGTH: 4000
+      MAX_TOTAL_TOKENS: 8000
+      SAGEMAKER_PROGRAM: inference.py
+report:
+  latency_budget: 2
+  cost_per_10k_txn_budget: 20
+  error_rate_budget: 0
+  per_inference_request_file: per_inference_request_results.csv
+  all_metrics_file: all_metrics.csv
+"""
+DOC = ("FMBench benchmarks foundation models deployed on SageMaker, Bedrock, EKS and EC2. It measures latency, "
+       "throughput and cost per transaction for every payload size and concurrency level of an experiment, "
+       "then writes a report with charts and tables comparing the instance types that were tested. {suffix}")
+
+
+def test_is_config_chunk():
+    assert is_config_chunk({"content_type": "yaml", "path": "configs/a.txt"})
+    assert is_config_chunk({"content_type": "markdown", "path": "configs/config.JSON"})
+    assert not is_config_chunk({"content_type": "markdown", "path": "docs/index.md"})
+
+
+def test_near_identical_configs_are_not_collapsed(build_rag):
+    rag = build_rag([
+        ("configs/config-g5.2xlarge.yml", CONFIG.format(instance="g5.2xlarge")),
+        ("configs/config-g5.12xlarge.yml", CONFIG.format(instance="g5.12xlarge")),
+        ("configs/copy/config-g5.2xlarge.yml", CONFIG.format(instance="g5.2xlarge")),
+        ("docs/index.md", DOC.format(suffix="See the results folder.")),
+        ("docs/mirror/index.md", DOC.format(suffix="See the results directory.")),
+    ], dedup_threshold=0.8)
+    docs = list(rag.vectorstore.docstore._dict.values())
+    by_path = {doc.metadata["path"]: doc for doc in docs}
+    # one vector per distinct config, the exact copy shares the vector of the first one
+    assert "configs/config-g5.12xlarge.yml" in by_path
+    assert "g5.12xlarge" in by_path["configs/config-g5.12xlarge.yml"].page_content
+    assert by_path["configs/config-g5.2xlarge.yml"].metadata["paths"] == [
+        "configs/config-g5.2xlarge.yml", "configs/copy/config-g5.2xlarge.yml"]
+    assert "paths" not in by_path["configs/config-g5.12xlarge.yml"].metadata
+    # prose near-duplicates are still collapsed
+    assert by_path["docs/index.md"].metadata["paths"] == ["docs/index.md", "docs/mirror/index.md"]
+    assert len(docs) == 3
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+import pytest
+
+from benchmarks.bench_classifier import legacy_classify
+from document_pipeline import classify_content, iter_json_array, to_document
+
+CORPUS = Path(__file__).resolve().parent.parent / "data" / "documents_1.json"
+
+CASES = [
+    "plain text\nwithout structure",
+    "# Title\ntext\n### Deep heading\nmore",
+    "intro\n1.\n# Heading\ntext",
+    "a\r# h\r",
+    "a\r\n## h\r\nb\r\n",
+    "#tag-like first line\nbody",
+    "text\n```python\nprint(1)\n```\n# heading after code",
+    "---\nkey: value\n  nested: 1\n",
+    "  --- indented yaml start\nx: 1",
+    "",
+    "\n",
+]
+
+
+def agrees_with_legacy(content: str, source: str = "") -> bool:
+    legacy_content, legacy_metadata = legacy_classify(content, source)
+    new_content, stats = classify_content(content, source)
+    return new_content == legacy_content and all(stats.get(k) == v for k, v in legacy_metadata.items())
+
+
+@pytest.mark.parametrize("content", CASES)
+def test_content_type_matches_the_legacy_detection(content):
+    assert agrees_with_legacy(content)
+    assert agrees_with_legacy(content, source="configs/llama3.yml")
+
+
+def test_content_type_matches_the_legacy_detection_on_the_corpus():
+    assert all(agrees_with_legacy(doc["content"]) for doc in iter_json_array(CORPUS))
+
+
+@pytest.mark.parametrize("content", ["a\nb\nc", "a\nb\n", "a\r\nb\r\nc\r\n", "a\rb\rc", "", "\n\n"])
+def test_line_count_matches_splitlines(content):
+    assert classify_content(content)[1]["doc_line_count"] == len(content.splitlines())
+
+
+def test_structure_stats():
+    content = ("# Title\n"
+               "| a | b |\n"
+               "| - | - |\n"
+               "- item\n"
+               "  * nested item\n"
+               "1. first\n"
+               "2) second\n"
+               "3.not a list item\n"
+               "1.\n"
+               "- \n"
+               "#### Deep\n")
+    stats = classify_content(content)[1]
+    assert stats == {"content_type": "markdown_with_headers", "max_heading_level": 4, "doc_line_count": 11,
+                     "doc_heading_count": 2, "doc_table_rows": 2, "doc_list_items": 5, "doc_list_density": 0.455}
+
+
+def test_document_stats_are_prefixed_in_chunk_metadata():
+    document = to_document({"filename": "a.md", "path": "docs/a.md", "directory": "docs", "extension": ".md",
+                            "content": "# A\n- x\n"})
+    assert document.metadata["doc_heading_count"] == 1 and document.metadata["doc_list_items"] == 1
+    assert "heading_count" not in document.metadata
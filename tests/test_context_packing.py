@@ -0,0 +1,64 @@
+from langchain_core.documents import Document
+
+from context_packing import ContextPacker, join_overlapping, merge_overlapping
+
+# 600 characters of distinct words, split like the text splitter does: neighbours share 100 characters
+TEXT = " ".join(f"w{i:03d}" for i in range(120))
+FIRST, SECOND, THIRD = TEXT[:300], TEXT[200:500], TEXT[400:]
+
+
+def chunk(text: str, path: str = "docs/a.md", score: float = 0.0, **metadata) -> Document:
+    return Document(page_content=text, metadata={"path": path, "score": score, **metadata})
+
+
+def test_join_overlapping():
+    assert join_overlapping(FIRST, SECOND, 64, 1000) == TEXT[:500]
+    # either order
+    assert join_overlapping(SECOND, FIRST, 64, 1000) == TEXT[:500]
+    assert join_overlapping(TEXT[:500], SECOND, 64, 1000) == TEXT[:500]
+    assert join_overlapping(FIRST, THIRD, 64, 1000) is None
+    # a shared end shorter than min_overlap is not an overlap
+    assert join_overlapping(FIRST, TEXT[260:500], 64, 1000) is None
+
+
+def test_neighbours_of_the_same_path_are_merged_in_place_of_the_best_ranked():
+    documents = [chunk("other", path="docs/b.md", score=0.5), chunk(SECOND, score=0.3), chunk(THIRD, score=0.2),
+                 chunk(FIRST, score=0.4)]
+    merged = merge_overlapping(documents)
+    assert [doc.page_content for doc in merged] == ["other", TEXT]
+    assert merged[1].metadata["score"] == 0.4 and merged[1].metadata["merged_chunks"] == 3
+
+
+def test_overlapping_chunks_of_different_paths_are_not_merged():
+    documents = [chunk(FIRST), chunk(SECOND, path="docs/b.md")]
+    assert merge_overlapping(documents) == documents
+
+
+def test_collapsed_paths_are_kept_on_merge():
+    merged = merge_overlapping([chunk(FIRST, paths=["docs/a.md", "docs/copy.md"]), chunk(SECOND)])
+    assert merged[0].metadata["paths"] == ["docs/a.md", "docs/copy.md"]
+
+
+def test_pack_ranks_by_score_and_stays_within_the_budget():
+    documents = [chunk("x" * 400, path="docs/low.md", score=0.1), chunk("y" * 400, path="docs/high.md", score=0.9),
+                 chunk("z" * 400, path="docs/mid.md", score=0.5)]
+    packed = ContextPacker(budget_tokens=200, min_trim_tokens=10).pack(documents)
+    assert [doc.metadata["path"] for doc in packed] == ["docs/high.md", "docs/mid.md"]
+    assert not any(doc.metadata.get("truncated") for doc in packed)
+
+
+def test_pack_cuts_the_first_chunk_that_does_not_fit():
+    documents = [chunk("y" * 400, path="docs/high.md", score=0.9), chunk("line\n" * 100, path="docs/mid.md", score=0.5)]
+    packed = ContextPacker(budget_tokens=150, min_trim_tokens=10).pack(documents)
+    assert [doc.metadata["path"] for doc in packed] == ["docs/high.md", "docs/mid.md"]
+    assert packed[1].metadata["truncated"] and len(packed[1].page_content) <= 50 * 4
+    # the cut ends on a line break
+    assert packed[1].page_content.endswith("line")
+    # below min_trim_tokens the chunk is left out
+    assert len(ContextPacker(budget_tokens=150, min_trim_tokens=100).pack(documents)) == 1
+
+
+def test_pack_merges_before_counting():
+    documents = [chunk(FIRST, score=0.9), chunk(SECOND, score=0.8), chunk(THIRD, score=0.7)]
+    packed = ContextPacker(budget_tokens=150).pack(documents)
+    assert [doc.page_content for doc in packed] == [TEXT]
@@ -0,0 +1,201 @@
+import types
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+import conversation_store
+from conversation_store import (MESSAGE_OVERHEAD_BYTES, InMemoryConversationStore, RedisConversationStore,
+                                SQLiteConversationStore, create_conversation_store, deserialize_messages,
+                                message_size, serialize_messages)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(conversation_store, "time", types.SimpleNamespace(monotonic=clock.monotonic, time=clock.time))
+    return clock
+
+
+def turn(text: str):
+    return [SystemMessage(content="system"), HumanMessage(content=text), AIMessage(content=f"answer to {text}")]
+
+
+def test_least_recently_used_thread_is_evicted(clock):
+    store = InMemoryConversationStore(max_threads=2)
+    store.put(1, turn("a"))
+    store.put(2, turn("b"))
+    store.get(1)
+    store.put(3, turn("c"))
+    assert store.get(2) == [] and store.get(1) and store.get(3)
+    assert store.stats()["evictions"]["lru"] == 1
+
+
+def test_idle_threads_expire(clock):
+    store = InMemoryConversationStore(idle_ttl_seconds=60)
+    store.put(1, turn("a"))
+    clock.now += 30
+    store.put(2, turn("b"))
+    clock.now += 40
+    # thread 1 was idle 70 s, thread 2 only 40 s
+    assert store.get(1) == [] and len(store.get(2)) == 3
+    assert store.stats()["evictions"]["idle"] == 1
+
+
+def test_byte_cap_evicts_other_threads_but_not_the_one_written(clock):
+    size = sum(message_size(message) for message in turn("a"))
+    store = InMemoryConversationStore(max_bytes=2 * size)
+    store.put(1, turn("a"))
+    store.put(2, turn("b"))
+    store.put(3, turn("c"))
+    stats = store.stats()
+    assert stats["threads"] == 2 and stats["bytes"] <= 2 * size and stats["evictions"]["bytes"] == 1
+    # a thread over the cap on its own is kept, with a warning
+    store.put(4, turn("x" * 4 * size))
+    assert len(store.get(4)) == 3 and store.stats()["threads"] == 1
+
+
+def test_get_returns_a_copy_and_put_replaces(clock):
+    store = InMemoryConversationStore()
+    store.put(1, turn("a"))
+    messages = store.get(1)
+    messages.append(HumanMessage(content="not stored"))
+    assert len(store.get(1)) == 3
+    store.put(1, messages)
+    assert len(store.get(1)) == 4 and store.stats()["bytes"] == sum(message_size(m) for m in messages)
+    store.delete(1)
+    assert store.get(1) == [] and store.stats()["bytes"] == 0
+
+
+def test_message_size_counts_tool_calls():
+    plain = AIMessage(content="")
+    with_call = AIMessage(content="", tool_calls=[{"name": "get_fmbench_info", "args": {"question": "q"}, "id": "1"}])
+    assert message_size(plain) == MESSAGE_OVERHEAD_BYTES
+    assert message_size(with_call) > message_size(plain)
+
+
+def tool_turn():
+    return [SystemMessage(content="system"), HumanMessage(content="which instances?"),
+            AIMessage(content="", tool_calls=[{"name": "get_fmbench_info", "args": {"question": "which instances?"}, "id": "call1"}]),
+            ToolMessage(content="g5.2xlarge, p4d.24xlarge", tool_call_id="call1"),
+            AIMessage(content="g5.2xlarge and p4d.24xlarge", response_metadata={"stopReason": "end_turn"})]
+
+
+def test_serialization_round_trip():
+    messages = tool_turn()
+    restored = deserialize_messages(serialize_messages(messages))
+    assert [type(message) for message in restored] == [type(message) for message in messages]
+    assert [message.content for message in restored] == [message.content for message in messages]
+    assert restored[2].tool_calls[0]["args"] == {"question": "which instances?"}
+    assert restored[3].tool_call_id == "call1"
+    assert restored[4].response_metadata == {"stopReason": "end_turn"}
+
+
+class FakeRedis:
+    """Dict backed stand-in for the redis.Redis methods the store uses, with expiry on a fake clock"""
+
+    def __init__(self, clock: Clock):
+        self.clock, self.data, self.calls = clock, {}, 0
+
+    def _live(self, key):
+        value = self.data.get(key)
+        if value is not None and value[1] <= self.clock.now:
+            del self.data[key]
+            return None
+        return value
+
+    def getex(self, key, ex=None):
+        self.calls += 1
+        value = self._live(key)
+        if value is None:
+            return None
+        self.data[key] = (value[0], self.clock.now + ex)
+        return value[0]
+
+    def set(self, key, value, ex=None):
+        self.calls += 1
+        self.data[key] = (value, self.clock.now + ex)
+
+    def delete(self, key):
+        self.calls += 1
+        self.data.pop(key, None)
+
+    def scan_iter(self, match=None):
+        prefix = match.rstrip("*")
+        return [key for key in list(self.data) if key.startswith(prefix) and self._live(key) is not None]
+
+
+def test_redis_store_get_put_expiry_and_delete(clock):
+    redis = FakeRedis(clock)
+    store = RedisConversationStore(redis, idle_ttl_seconds=60)
+    store.put(1, tool_turn())
+    redis.calls = 0
+    assert len(store.get(1)) == 5
+    # one round trip per read
+    assert redis.calls == 1
+    clock.now += 50
+    store.get(1)
+    clock.now += 50
+    # the read 50 s ago restarted the 60 s idle timer
+    assert len(store.get(1)) == 5 and store.stats()["threads"] == 1
+    clock.now += 61
+    assert store.get(1) == [] and store.stats()["threads"] == 0
+    store.put(2, tool_turn())
+    store.delete(2)
+    assert store.get(2) == []
+
+
+def test_sqlite_store_is_shared_and_bounded(tmp_path, clock):
+    path = str(tmp_path / "conversations.db")
+    store = SQLiteConversationStore(path, max_threads=2, idle_ttl_seconds=60, cleanup_interval_seconds=0)
+    for thread_id in range(3):
+        clock.now += 1
+        store.put(thread_id, tool_turn())
+    # another worker opening the same file sees the same threads
+    other = SQLiteConversationStore(path, max_threads=2, idle_ttl_seconds=60)
+    assert other.get(0) == [] and len(other.get(2)) == 5
+    clock.now += 61
+    assert store.get(1) == [] and store.stats()["threads"] == 0
+    store.put(3, tool_turn())
+    store.delete(3)
+    assert other.get(3) == []
+
+
+def test_sqlite_cleanup_runs_once_per_interval_and_reads_rarely_write(tmp_path, clock):
+    store = SQLiteConversationStore(str(tmp_path / "conversations.db"), max_threads=2, idle_ttl_seconds=600,
+                                    cleanup_interval_seconds=60)
+
+    def updated():
+        return dict(store._connection().execute("SELECT thread_id, updated FROM conversations").fetchall())
+
+    for thread_id in range(4):
+        clock.now += 1
+        store.put(thread_id, turn(str(thread_id)))
+    # only the first put cleaned up, the table is over max_threads until the next cleanup
+    assert store.stats()["threads"] == 4
+    # a read within the interval does not write the last access
+    clock.now += 30
+    assert len(store.get(0)) == 3 and updated()["0"] == 1001
+    clock.now += 30
+    assert len(store.get(0)) == 3 and updated()["0"] == 1064
+    store.put(4, turn("4"))
+    assert sorted(updated()) == ["0", "4"]
+
+
+def test_backend_is_selected_by_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("CONVERSATION_BACKEND", "sqlite")
+    monkeypatch.setenv("CONVERSATION_DB_PATH", str(tmp_path / "conversations.db"))
+    assert isinstance(create_conversation_store(), SQLiteConversationStore)
+    assert isinstance(create_conversation_store("memory"), InMemoryConversationStore)
+    with pytest.raises(ValueError):
+        create_conversation_store("dynamodb")
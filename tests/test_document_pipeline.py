@@ -0,0 +1,66 @@
+import itertools
+import json
+from pathlib import Path
+
+import pytest
+
+from build_profile import BuildProfiler
+from document_pipeline import batched, iter_chunks, iter_json_array
+
+RECORDS = [
+    {"filename": "a.md", "content": "# Title\n" + "text, with [brackets] and {braces}\n" * 20},
+    {"filename": "b.yml", "content": "key: \"quoted ] value\"\n", "metadata": {"tags": [1, 2, {"nested": "}"}]}},
+    12345,
+    1.5e10,
+    "é" * 50,
+    True,
+    None,
+    [],
+]
+
+
+def write(tmp_path, text: str):
+    path = tmp_path / "documents.json"
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 7, 16, 1 << 20])
+def test_elements_larger_than_read_size_are_decoded(tmp_path, read_size):
+    for text in (json.dumps(RECORDS, indent=2, ensure_ascii=False), json.dumps(RECORDS, separators=(",", ":"))):
+        assert list(iter_json_array(write(tmp_path, text), read_size=read_size)) == RECORDS
+
+
+def test_empty_array(tmp_path):
+    assert list(iter_json_array(write(tmp_path, " [ ]\n"), read_size=1)) == []
+
+
+def test_invalid_files_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Expected a JSON array"):
+        list(iter_json_array(write(tmp_path, '{"content": "x"}')))
+    with pytest.raises(ValueError, match="Unexpected end of file"):
+        list(iter_json_array(write(tmp_path, '[{"content": "x"}, '), read_size=4))
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(write(tmp_path, '[{"content": "x'), read_size=4))
+
+
+def test_batched():
+    assert list(batched(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(batched([], 3)) == []
+
+
+def test_process_pool_yields_the_chunks_of_the_serial_path_in_order(tmp_path):
+    corpus = Path(__file__).resolve().parent.parent / "data" / "documents_1.json"
+    # large documents first so later, smaller tasks finish before them in the pool
+    records = sorted(itertools.islice(iter_json_array(corpus), 40), key=lambda doc: -len(doc["content"]))
+    path = write(tmp_path, json.dumps(records))
+
+    def run(workers: int):
+        profiler = BuildProfiler()
+        chunks = [(chunk.page_content, chunk.metadata)
+                  for chunk in iter_chunks(path, workers=workers, docs_per_task=1, profiler=profiler)]
+        return chunks, {name: stats["counts"] for name, stats in profiler.stages.items()}
+
+    serial, serial_counts = run(workers=1)
+    assert len(serial) > len(records)
+    assert run(workers=2) == (serial, serial_counts)
@@ -0,0 +1,144 @@
+import os
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from fastapi.testclient import TestClient
+
+import embedding_cache
+from conftest import DOCUMENTS, HashEmbeddings
+from embedding_cache import CachedEmbeddings, QueryEmbeddingCache
+
+# bytes of a float32 HashEmbeddings vector
+VECTOR_BYTES = 16 * 4
+
+
+class CountingEmbeddings(HashEmbeddings):
+    """HashEmbeddings recording the questions passed to embed_query"""
+
+    def __init__(self):
+        super().__init__()
+        self.queries: List[str] = []
+
+    def embed_query(self, text: str) -> List[float]:
+        self.queries.append(text)
+        return super().embed_query(text)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def query_cache(clock, **fields) -> QueryEmbeddingCache:
+    return QueryEmbeddingCache(embeddings=CountingEmbeddings(), model_id="titan", clock=clock, **fields)
+
+
+def test_questions_differing_in_case_and_whitespace_share_an_entry(clock):
+    cache = query_cache(clock)
+    vector = cache.embed_query("What is FMBench?")
+    assert cache.embed_query("  what IS\tfmbench? ") == vector
+    assert cache.embeddings.queries == ["What is FMBench?"]
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1, "max_size": 1024}
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = query_cache(clock, max_size=2)
+    cache.embed_query("a")
+    cache.embed_query("b")
+    cache.embed_query("a")
+    cache.embed_query("c")
+    assert list(key for _, key in cache.entries) == ["a", "c"]
+    cache.embed_query("b")
+    assert cache.embeddings.queries == ["a", "b", "c", "b"]
+    assert cache.stats()["size"] == 2
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = query_cache(clock, ttl_seconds=60)
+    cache.embed_query("a")
+    clock.now += 60
+    cache.embed_query("a")
+    clock.now += 61
+    cache.embed_query("a")
+    assert cache.embeddings.queries == ["a", "a"]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_embed_queries_uses_and_fills_the_cache(clock):
+    cache = query_cache(clock, ttl_seconds=60)
+    cache.embed_query("a")
+    vectors = cache.embed_queries(["A", "b", "b ", "c"])
+    assert cache.embeddings.queries == ["a", "b", "c"]
+    assert vectors[1] == vectors[2] == cache.embed_query("B")
+    assert (cache.hits, cache.misses) == (2, 3)
+    clock.now += 61
+    cache.embed_queries(["a", "b"])
+    assert cache.embeddings.queries == ["a", "b", "c", "a", "b"]
+
+
+def test_cache_stats_endpoint_reports_the_query_cache(build_rag, monkeypatch):
+    import server
+    rag = build_rag(DOCUMENTS, query_embedding_cache_size=8)
+    rag.retriever.invoke("what is FMBench")
+    rag.retriever.invoke("What is FMBench")
+    monkeypatch.setattr(server, "_rag_system", rag)
+    stats = TestClient(server.app).get("/cache-stats").json()
+    assert stats["query_embeddings"] == {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1, "max_size": 8}
+
+
+@pytest.fixture
+def cached(tmp_path, clock, monkeypatch):
+    """CachedEmbeddings over HashEmbeddings in tmp_path, last_used taken from clock"""
+    monkeypatch.setattr(embedding_cache, "time", SimpleNamespace(time=clock))
+
+    def create(max_vectors: float = 100, model_id: str = "titan") -> CachedEmbeddings:
+        return CachedEmbeddings(embeddings=HashEmbeddings(), model_id=model_id, cache_path=str(tmp_path / "cache.db"),
+                                max_size_mb=max_vectors * VECTOR_BYTES / (1024 * 1024))
+    return create
+
+
+def test_cached_vectors_survive_a_restart_and_are_keyed_by_model(cached):
+    first = cached()
+    vectors = first.embed_documents(["a", "b", "a"])
+    assert first.embeddings.embedded == ["a", "b"] and (first.hits, first.misses) == (0, 3)
+    second = cached()
+    assert second.embed_documents(["b", "a"]) == [vectors[1], vectors[0]]
+    assert second.embeddings.embedded == [] and second.total_bytes == 2 * VECTOR_BYTES
+    other_model = cached(model_id="cohere")
+    other_model.embed_documents(["a"])
+    assert other_model.embeddings.embedded == ["a"]
+
+
+def test_evict_drops_least_recently_used_vectors_down_to_the_cap(cached, clock):
+    cache = cached(max_vectors=3)
+    for text in ["a", "b", "c", "d", "e"]:
+        cache.embed_documents([text])
+        clock.now += 1
+    # a hit refreshes last_used
+    cache.embed_documents(["a"])
+    # nothing is evicted until the end of the build
+    assert cache.total_bytes == 5 * VECTOR_BYTES and cache.evictions == 0
+    cache.evict()
+    assert cache.evictions == 2 and cache.total_bytes == 3 * VECTOR_BYTES
+    reopened = cached(max_vectors=3)
+    reopened.embed_documents(["a", "d", "e", "b", "c"])
+    assert reopened.embeddings.embedded == ["b", "c"]
+
+
+def test_evict_shrinks_the_file(cached, tmp_path):
+    cache = cached(max_vectors=10)
+    cache.embed_documents([f"text {i}" for i in range(2000)])
+    cache.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size = os.path.getsize(tmp_path / "cache.db")
+    cache.evict()
+    assert os.path.getsize(tmp_path / "cache.db") < size / 4
+    assert cache.total_bytes == 10 * VECTOR_BYTES
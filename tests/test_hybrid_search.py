@@ -0,0 +1,30 @@
+import fmbench_rag_setup
+from conftest import DOCUMENTS
+
+CONFIG = ("configs/config-llama3-8b-inf2.yml", "deploys Llama 3 8B on inf2.48xlarge with the Neuron SDK")
+DOCUMENTS_WITH_CONFIG = DOCUMENTS[:6] + [CONFIG] + DOCUMENTS[6:]
+
+
+def paths(documents) -> list:
+    return [doc.metadata["path"] for doc in documents]
+
+
+def test_hybrid_search_is_off_by_default():
+    assert fmbench_rag_setup.FMBenchRagSetup.model_fields["hybrid_search"].default is False
+
+
+def test_exact_identifier_missed_by_dense_search_is_recovered_by_fusion(build_rag):
+    file_question, instance_question = "What does config-llama3-8b-inf2.yml deploy?", "inf2.48xlarge"
+    dense = build_rag(DOCUMENTS_WITH_CONFIG, retriever_k=3)
+    assert dense.retriever.lexical_index is None
+    assert CONFIG[0] not in paths(dense.retriever.invoke(file_question))
+    assert CONFIG[0] not in paths(dense.retriever.invoke(instance_question))
+
+    hybrid = build_rag(DOCUMENTS_WITH_CONFIG, retriever_k=3, hybrid_search=True)
+    assert hybrid.retriever.lexical_index is not None
+    # no other chunk shares a term with the file name or the instance type, their BM25 rank puts the config first
+    for question in (file_question, instance_question):
+        documents = hybrid.retriever.invoke(question)
+        assert paths(documents)[0] == CONFIG[0]
+        # fused score of the dense rank and the BM25 rank, higher is better
+        assert documents[0].metadata["score"] > documents[1].metadata["score"]
@@ -0,0 +1,104 @@
+import json
+
+from conftest import DOCUMENTS, HashEmbeddings
+
+
+def section(title: str, words: int = 350) -> str:
+    """A markdown section of ~2500 characters, so each section of a file becomes its own chunk"""
+    return f"## {title}\n\n" + " ".join(f"{title.lower()[:4]}{i % 50:02d}" for i in range(words))
+
+
+GUIDE = ("docs/guide.md", "\n".join([section("Install"), section("Configure"), section("Run")]))
+
+
+def manifest_files(rag) -> dict:
+    return json.loads(rag._manifest_path().read_text())["files"]
+
+
+def vector_ids(rag) -> set:
+    return set(rag.vectorstore.index_to_docstore_id.values())
+
+
+def test_unchanged_rebuild_embeds_nothing(build_index):
+    first = build_index(DOCUMENTS + [GUIDE])
+    embeddings = HashEmbeddings()
+    second = build_index(DOCUMENTS + [GUIDE], embeddings=embeddings)
+    assert embeddings.embedded == []
+    assert vector_ids(second) == vector_ids(first)
+    assert manifest_files(second) == manifest_files(first)
+
+
+def test_only_changed_chunks_of_a_modified_file_are_embedded(build_index):
+    first = build_index(DOCUMENTS + [GUIDE])
+    assert sum(len(ids) for ids in manifest_files(first)["docs/guide.md"].values()) == 3
+    changed = "\n".join([section("Install"), section("Configure", words=300), section("Run")])
+    embeddings = HashEmbeddings()
+    second = build_index(DOCUMENTS + [("docs/guide.md", changed)], embeddings=embeddings)
+    assert len(embeddings.embedded) == 1 and embeddings.embedded[0].startswith("\n## Configure")
+    assert second.vectorstore.index.ntotal == first.vectorstore.index.ntotal
+    # the vector of the old version of the chunk is gone, the two unchanged chunks kept theirs
+    assert len(vector_ids(first) - vector_ids(second)) == 1
+
+
+def test_deleted_file_vectors_are_removed(build_index):
+    first = build_index(DOCUMENTS)
+    deleted = [ids[0] for ids in manifest_files(first)["docs/page5.md"].values()]
+    embeddings = HashEmbeddings()
+    second = build_index([doc for doc in DOCUMENTS if doc[0] != "docs/page5.md"], embeddings=embeddings)
+    assert embeddings.embedded == []
+    assert "docs/page5.md" not in manifest_files(second)
+    assert vector_ids(second) == vector_ids(first) - set(deleted)
+    assert second.vectorstore.index.ntotal == len(DOCUMENTS) - 1
+    assert not any(vector_id in second.vectorstore.docstore._dict for vector_id in deleted)
+
+
+def test_duplicate_chunks_of_a_file_keep_their_own_vectors(build_index):
+    repeated = ("docs/faq.md", "\n".join([section("Intro"), section("Same"), section("Same")]))
+    first = build_index(DOCUMENTS + [repeated])
+    duplicate_ids = next(ids for ids in manifest_files(first)["docs/faq.md"].values() if len(ids) == 2)
+    assert len(set(duplicate_ids)) == 2
+
+    embeddings = HashEmbeddings()
+    second = build_index(DOCUMENTS + [repeated], embeddings=embeddings)
+    assert embeddings.embedded == []
+    assert manifest_files(second)["docs/faq.md"] == manifest_files(first)["docs/faq.md"]
+
+    # dropping one copy drops one of the two vectors and embeds nothing
+    third = build_index(DOCUMENTS + [("docs/faq.md", "\n".join([section("Intro"), section("Same")]))], embeddings=embeddings)
+    assert embeddings.embedded == []
+    assert third.vectorstore.index.ntotal == second.vectorstore.index.ntotal - 1
+
+
+def test_full_rebuild_embeds_everything(build_index):
+    first = build_index(DOCUMENTS)
+    embeddings = HashEmbeddings()
+    second = build_index(DOCUMENTS, embeddings=embeddings, full_rebuild=True)
+    assert len(embeddings.embedded) == len(DOCUMENTS)
+    assert vector_ids(second).isdisjoint(vector_ids(first))
+
+
+def test_collapsed_paths_follow_incremental_rebuilds(build_index):
+    shared = section("Shared")
+    near = shared.replace("shar07 ", "sharxx ", 1)
+    documents = [("docs/a.md", shared), ("docs/b.md", shared), ("docs/c.md", near)]
+    first = build_index(documents, dedup_threshold=0.8)
+    assert first.vectorstore.index.ntotal == 1
+    representative = next(iter(vector_ids(first)))
+    assert first.vectorstore.docstore.search(representative).metadata["paths"] == ["docs/a.md", "docs/b.md", "docs/c.md"]
+
+    embeddings = HashEmbeddings()
+    second = build_index(documents, embeddings=embeddings, dedup_threshold=0.8)
+    assert embeddings.embedded == [] and vector_ids(second) == {representative}
+    assert second.vectorstore.docstore.search(representative).metadata["paths"] == ["docs/a.md", "docs/b.md", "docs/c.md"]
+
+    # without a.md the identical chunk of b.md takes over its vector, the near-duplicate in c.md still shares it
+    third = build_index(documents[1:], embeddings=embeddings, dedup_threshold=0.8)
+    assert embeddings.embedded == [] and vector_ids(third) == {representative}
+    stored = third.vectorstore.docstore.search(representative)
+    assert stored.metadata["path"] == "docs/b.md" and stored.metadata["paths"] == ["docs/b.md", "docs/c.md"]
+
+    # with only the near-duplicate left its own text is embedded and the old vector dropped
+    fourth = build_index(documents[2:], embeddings=embeddings, dedup_threshold=0.8)
+    assert embeddings.embedded == [near]
+    assert len(vector_ids(fourth)) == 1 and representative not in vector_ids(fourth)
+    assert "paths" not in fourth.vectorstore.docstore.search(next(iter(vector_ids(fourth)))).metadata
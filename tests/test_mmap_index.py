@@ -0,0 +1,27 @@
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from ann_index import IndexSpec, apply_index_spec, save_index_spec
+from mmap_index import MmapVectorStore, convert_faiss_index
+
+
+def test_convert_ivf_index_loaded_from_disk(tmp_path, embeddings):
+    texts = [f"chunk {i} about instance type g5.{i}xlarge" for i in range(200)]
+    vectorstore = FAISS.from_texts(texts, embeddings, metadatas=[{"path": f"doc{i}.md"} for i in range(200)])
+    expected = vectorstore.index.reconstruct_n(0, len(texts))
+    spec = IndexSpec.parse("ivf_flat:nlist=4,nprobe=4")
+    apply_index_spec(vectorstore, spec)
+    vectorstore.save_local(str(tmp_path / "src"))
+    save_index_spec(tmp_path / "src", spec)
+
+    # an IVF index read back from disk has no direct map
+    loaded = FAISS.load_local(str(tmp_path / "src"), embeddings, allow_dangerous_deserialization=True)
+    assert faiss.extract_index_ivf(loaded.index).direct_map.no()
+
+    convert_faiss_index(tmp_path / "src", tmp_path / "dst")
+    store = MmapVectorStore.load(tmp_path / "dst", embeddings)
+    assert len(store) == len(texts)
+    np.testing.assert_allclose(np.asarray(store.vectors, dtype=np.float32), expected, rtol=1e-6)
+    doc, _ = store.similarity_search_with_score(texts[7], k=1)[0]
+    assert doc.page_content == texts[7] and doc.metadata["path"] == "doc7.md"
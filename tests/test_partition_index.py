@@ -0,0 +1,80 @@
+import pytest
+
+from conftest import DOCUMENTS
+from partition_index import PartitionIndex, filters_key
+
+METADATAS = [
+    {"content_type": "markdown_with_headers", "directory": "docs", "extension": "md"},
+    {"content_type": "yaml", "directory": "fmbench/configs/llama3/8b", "extension": "yml"},
+    {"content_type": "yaml", "directory": "fmbench/configs/bedrock", "extension": ".YML"},
+    {"content_type": "yaml", "directory": "fmbench/configs2", "extension": "yaml"},
+    {"content_type": "markdown", "directory": "fmbench/configs", "extension": "md"},
+    # near-duplicate in docs/ collapsed into a chunk of another directory
+    {"content_type": "markdown", "directory": "misc", "extension": "txt", "paths": ["misc/notes.txt", "docs/notes.md"]},
+]
+
+CONFIGS = [("fmbench/configs/llama3/8b/config-llama3-8b-g5.yml", "instance_type: g5.2xlarge for llama3 8b"),
+           ("fmbench/configs/llama3/70b/config-llama3-70b-p4d.yml", "instance_type: p4d.24xlarge for llama3 70b"),
+           ("fmbench/configs/bedrock/config-bedrock-claude.yaml", "model_id: anthropic.claude-3-haiku on bedrock")]
+
+
+@pytest.fixture
+def partitions():
+    return PartitionIndex.build(METADATAS)
+
+
+def test_directory_matches_itself_and_subdirectories(partitions):
+    assert partitions.select({"directory": "fmbench/configs"}).tolist() == [1, 2, 4]
+    assert partitions.select({"directory": "/fmbench/configs/"}).tolist() == [1, 2, 4]
+    assert partitions.select({"directory": "fmbench/configs/llama3"}).tolist() == [1]
+    assert partitions.select({"directory": ""}).tolist() == [0, 1, 2, 3, 4, 5]
+
+
+def test_extensions_are_normalized(partitions):
+    for extension in ("yml", ".yml", "YML", ".YML"):
+        assert partitions.select({"extension": extension}).tolist() == [1, 2]
+    # the collapsed docs/notes.md counts as md too
+    assert partitions.values("extension") == {"md": 3, "yml": 2, "yaml": 1, "txt": 1}
+
+
+def test_values_are_ored_and_fields_anded(partitions):
+    assert partitions.select({"extension": ["yml", "yaml"]}).tolist() == [1, 2, 3]
+    assert partitions.select({"content_type": "yaml", "directory": "fmbench/configs"}).tolist() == [1, 2]
+    assert partitions.select({"extension": "md", "directory": "docs"}).tolist() == [0, 5]
+    assert partitions.select({"content_type": "yaml", "extension": "md"}).tolist() == []
+
+
+def test_unknown_field_is_rejected(partitions):
+    with pytest.raises(ValueError, match="Cannot filter on 'filename'"):
+        partitions.select({"filename": "config.yml"})
+
+
+def test_filters_key_ignores_order():
+    assert filters_key({"extension": ["yml", "md"], "directory": "docs"}) == \
+        filters_key({"directory": "docs", "extension": ["md", "yml"]})
+    assert filters_key(None) == filters_key({}) == ""
+
+
+@pytest.mark.parametrize("index_spec", ["flat", "hnsw", "ivf_flat:nlist=2,nprobe=2"])
+def test_retriever_only_returns_matching_chunks(build_rag, index_spec):
+    rag = build_rag(DOCUMENTS + CONFIGS, retriever_k=10, index_spec=index_spec)
+    retriever = rag.retriever.model_copy(update={"filters": {"directory": "fmbench/configs/llama3", "extension": ".yml"}})
+    assert sorted(doc.metadata["path"] for doc in retriever.invoke("llama3 instance type")) == sorted(path for path, _ in CONFIGS[:2])
+    retriever = rag.retriever.model_copy(update={"filters": {"extension": "yaml"}})
+    assert [doc.metadata["path"] for doc in retriever.invoke("bedrock models")] == [CONFIGS[2][0]]
+
+
+def test_filter_matching_nothing_skips_the_search(build_rag):
+    rag = build_rag(DOCUMENTS + CONFIGS)
+    # no embeddings: the question would fail to embed if the empty selection did not short-circuit
+    retriever = rag.retriever.model_copy(update={"filters": {"directory": "fmbench/configs", "extension": "md"},
+                                                 "embeddings": None})
+    assert retriever.invoke("anything") == []
+    assert retriever.batch_documents(["anything", "else"], [[0.0] * 16, [0.0] * 16]) == [[], []]
+
+
+def test_filter_on_an_index_without_partitions_is_rejected(build_rag):
+    rag = build_rag(DOCUMENTS)
+    retriever = rag.retriever.model_copy(update={"filters": {"directory": "docs"}, "partition_index": None})
+    with pytest.raises(ValueError, match="no metadata partitions"):
+        retriever.invoke("anything")
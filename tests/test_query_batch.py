@@ -0,0 +1,48 @@
+from typing import List
+
+import pytest
+
+from conftest import DOCUMENTS, HashEmbeddings
+from retrieval import FMBenchRetriever
+
+
+class FlakyEmbeddings(HashEmbeddings):
+    def embed_query(self, text: str) -> List[float]:
+        if "embedding fails" in text:
+            raise RuntimeError("bad input")
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def rag(build_rag):
+    return build_rag(DOCUMENTS, embeddings=FlakyEmbeddings())
+
+
+def test_errors_are_per_question_in_every_stage(rag, monkeypatch):
+    batch_documents = FMBenchRetriever.batch_documents
+
+    def failing_search(self, queries, query_vectors):
+        if any("search fails" in query for query in queries):
+            raise RuntimeError("search error")
+        return batch_documents(self, queries, query_vectors)
+
+    monkeypatch.setattr(FMBenchRetriever, "batch_documents", failing_search)
+    questions = ["which instance for page 1", "embedding fails here", "search fails here",
+                 "generation fails here", "how to benchmark model 3"]
+    results = rag.query_batch(questions)
+
+    assert [result["question"] for result in results] == questions
+    assert [result["error"] is None for result in results] == [True, False, False, False, True]
+    assert "bad input" in results[1]["error"]
+    assert "search error" in results[2]["error"]
+    assert "throttled" in results[3]["error"]
+    assert results[0]["answer"].startswith("answer") and results[0]["citations"]
+    assert results[4]["answer"].startswith("answer")
+
+
+def test_batch_matches_single_retrieval(rag):
+    questions = ["which instance for page 1", "how to benchmark model 3"]
+    vectors = rag.query_embeddings.embed_queries(questions)
+    batched = rag.retriever.batch_documents(questions, vectors)
+    for question, docs in zip(questions, batched):
+        assert [doc.page_content for doc in docs] == [doc.page_content for doc in rag.retriever.invoke(question)]
@@ -0,0 +1,40 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from conftest import DOCUMENTS
+from lexical_index import BM25Index
+from reranker import LexicalReranker
+
+TEXTS = [
+    "FMBench writes a report with latency and cost charts for each experiment.",
+    "# Deploying on g5.12xlarge\n\nUse the g5.12xlarge config to benchmark Llama 3 with tensor parallelism.",
+    "Inference containers supported by FMBench include DJL, vLLM and TGI.",
+]
+PATHS = ["docs/results.md", "fmbench/configs/llama3/8b/config-llama3-8b-g5.12xlarge.yml", "docs/containers.md"]
+
+
+def documents(scores):
+    return [Document(page_content=text, metadata={"path": path, "score": score})
+            for text, path, score in zip(TEXTS, PATHS, scores)]
+
+
+def test_query_terms_in_text_path_and_headings_outrank_a_better_retrieval_score():
+    index = BM25Index.build(TEXTS, [str(i) for i in range(len(TEXTS))])
+    scores = LexicalReranker(lexical_index=index).score("g5.12xlarge config for llama 3", documents([0.9, 0.8, 0.5]),
+                                                       positions=[0, 1, 2])
+    assert int(np.argmax(scores)) == 1
+
+
+def test_postings_and_tokenized_coverage_agree():
+    index = BM25Index.build(TEXTS, [str(i) for i in range(len(TEXTS))])
+    query = "which containers does FMBench support"
+    with_postings = LexicalReranker(lexical_index=index).score(query, documents([0.2, 0.4, 0.6]), positions=[0, 1, 2])
+    tokenized = LexicalReranker(lexical_index=index).score(query, documents([0.2, 0.4, 0.6]))
+    np.testing.assert_allclose(with_postings, tokenized, rtol=1e-6)
+
+
+def test_retriever_returns_final_k_reranked_chunks(build_rag):
+    rag = build_rag(DOCUMENTS, rerank_fanout_k=10, rerank_final_k=3)
+    docs = rag.retriever.invoke("benchmark model 7 on g5.7xlarge")
+    assert len(docs) == 3
+    assert docs[0].metadata["path"] == "docs/page7.md"
@@ -0,0 +1,26 @@
+import numpy as np
+
+from conftest import DOCUMENTS
+from retrieval import maximal_marginal_relevance
+
+
+def test_mmr_picks_a_diverse_chunk_over_a_near_duplicate():
+    relevance = np.asarray([1.0, 0.99, 0.6])
+    vectors = np.asarray([[1.0, 0.0], [0.999, 0.01], [0.0, 1.0]])
+    assert maximal_marginal_relevance(relevance, vectors, k=2, lambda_mult=0.5) == [0, 2]
+    # relevance only
+    assert maximal_marginal_relevance(relevance, vectors, k=2, lambda_mult=1.0) == [0, 1]
+    assert maximal_marginal_relevance(relevance, vectors, k=5, lambda_mult=0.5) == [0, 2, 1]
+    assert maximal_marginal_relevance(np.zeros(0), np.zeros((0, 2)), k=2, lambda_mult=0.5) == []
+
+
+def test_diversified_retrieval_drops_a_copy_of_the_best_chunk(build_rag):
+    copy = ("docs/copy.md", DOCUMENTS[3][1])
+    question = DOCUMENTS[3][1]
+
+    plain = build_rag(DOCUMENTS + [copy], retriever_k=2)
+    assert [doc.page_content for doc in plain.retriever.invoke(question)] == [question, question]
+
+    diverse = build_rag(DOCUMENTS + [copy], retriever_k=2, diversify_retrieval=True)
+    documents = diverse.retriever.invoke(question)
+    assert len(documents) == 2 and documents[0].page_content == question and documents[1].page_content != question
@@ -0,0 +1,299 @@
+import re
+import json
+import time
+import asyncio
+from typing import Any, Iterator, List, Optional
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.prebuilt import create_react_agent
+
+import server
+from agent_pool import AgentPool
+from conversation_store import InMemoryConversationStore
+
+
+class ScriptedChat(BaseChatModel):
+    """Calls get_fmbench_info with the question, then answers with the tool output, streamed word by word"""
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Any, **kwargs) -> "ScriptedChat":
+        return self
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=f"Answer: {last.content}")
+        return AIMessage(content="", tool_calls=[{"name": "get_fmbench_info", "args": {"question": last.content}, "id": f"call{len(messages)}"}])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        reply = self._reply(messages)
+        if reply.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": '{"question": "%s"}' % call["args"]["question"], "id": call["id"], "index": 0}
+                for call in reply.tool_calls]))
+            return
+        for word in re.findall(r"\S+\s*", reply.content):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class StubRag:
+    """Stands in for FMBenchRagSetup, answers after delay seconds"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    def query(self, question: str, filters: Any = None) -> str:
+        time.sleep(self.delay)
+        return f"docs for {question}"
+
+    async def aquery(self, question: str, filters: Any = None) -> str:
+        await asyncio.sleep(self.delay)
+        return f"docs for {question}"
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    """The FastAPI app with a scripted agent, a stub RAG system and fresh stores, no AWS call is made"""
+    monkeypatch.setattr(server, "_rag_system", StubRag())
+    monkeypatch.setattr(server, "_guardrail_id", "guardrail")
+    monkeypatch.setattr(server, "_guardrail_version", "1")
+    monkeypatch.setattr(server, "_build_agent", lambda region, model_id, guardrail_id, guardrail_version:
+                        create_react_agent(ScriptedChat(), server.tools))
+    monkeypatch.setattr(server, "_agent_pool", AgentPool(max_size=2))
+    monkeypatch.setattr(server, "conversation_memory", InMemoryConversationStore())
+    return server
+
+
+@pytest.fixture
+def client(stub_server):
+    # not entered as a context manager, so the lifespan warm-up does not run
+    return TestClient(stub_server.app)
+
+
+def test_generate_runs_the_agent_and_keeps_history(client):
+    first = client.post("/generate", json={"question": "which instances", "thread_id": 1}).json()
+    assert [message["role"] for message in first["result"]] == ["system", "human", "ai", "tool", "ai"]
+    assert first["result"][-1]["content"] == "Answer: docs for which instances"
+
+    second = client.post("/generate", json={"question": "and costs", "thread_id": 1}).json()
+    assert len(second["result"]) == 9
+    assert second["result"][-1]["content"] == "Answer: docs for and costs"
+
+
+def test_generate_requests_overlap(stub_server, monkeypatch):
+    # the tool awaits the RAG system, so requests on one event loop run concurrently
+    monkeypatch.setattr(server, "_rag_system", StubRag(delay=0.5))
+
+    async def run():
+        transport = httpx.ASGITransport(app=stub_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            start = time.perf_counter()
+            responses = await asyncio.gather(*[http.post("/generate", json={"question": f"q{i}", "thread_id": i})
+                                               for i in range(4)])
+            return time.perf_counter() - start, responses
+
+    elapsed, responses = asyncio.run(run())
+    assert all(response.status_code == 200 for response in responses)
+    assert elapsed < 4 * 0.5
+
+
+def read_events(response) -> List[tuple]:
+    """(event, data) pairs of a server-sent events response"""
+    events, event = [], None
+    for line in response.iter_lines():
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            events.append((event, json.loads(line[len("data:"):])))
+    return events
+
+
+def test_generate_stream_events(client):
+    with client.stream("POST", "/generate/stream", json={"question": "which instances", "thread_id": 3}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = read_events(response)
+
+    kinds = [event for event, _ in events]
+    assert kinds[:2] == ["tool", "tool"] and kinds[-1] == "done" and "error" not in kinds
+    assert [data["status"] for _, data in events[:2]] == ["start", "end"]
+    # the answer arrives as several token events, not in one piece
+    assert kinds.count("token") == 5
+    streamed = "".join(data["content"] for event, data in events if event == "token")
+    assert streamed == "Answer: docs for which instances"
+    assert events[-1][1]["result"][-1]["content"] == "Answer: docs for which instances"
+    # the streamed turn is kept like a /generate turn
+    assert len(server.conversation_memory.get(3)) == 5
+
+
+def test_generate_stream_reports_errors(client, monkeypatch):
+    def broken(*args):
+        raise RuntimeError("model not available")
+
+    monkeypatch.setattr(server, "_build_agent", broken)
+    with client.stream("POST", "/generate/stream", json={"question": "q", "thread_id": 4}) as response:
+        events = read_events(response)
+    assert events == [("error", {"detail": "model not available"})]
+
+
+def test_conversation_stats(client):
+    client.post("/generate", json={"question": "q", "thread_id": 5})
+    stats = client.get("/conversation-stats").json()
+    assert stats["threads"] == 1 and stats["bytes"] > 0
+
+
+def test_response_modes_and_since_cursor(client):
+    full = client.post("/generate", json={"question": "q1", "thread_id": 6}).json()
+    assert full["cursor"] == 5 and len(full["result"]) == 5
+
+    turn = client.post("/generate", json={"question": "q2", "thread_id": 6, "response_mode": "turn"}).json()
+    assert [message["role"] for message in turn["result"]] == ["human", "ai", "tool", "ai"]
+    assert turn["result"][0]["content"] == "q2" and turn["cursor"] == 9
+
+    # everything after the first response: the second and third turns
+    since = client.post("/generate", json={"question": "q3", "thread_id": 6, "since": full["cursor"]}).json()
+    assert [message["content"] for message in since["result"] if message["role"] == "human"] == ["q2", "q3"]
+
+    # a cursor past the start of the turn (history expired meanwhile) still returns the turn
+    fresh = client.post("/generate", json={"question": "q", "thread_id": 7, "since": 50}).json()
+    assert [message["role"] for message in fresh["result"]] == ["human", "ai", "tool", "ai"]
+
+
+def test_turn_mode_in_the_done_event(client):
+    client.post("/generate", json={"question": "q1", "thread_id": 8})
+    with client.stream("POST", "/generate/stream", json={"question": "q2", "thread_id": 8, "response_mode": "turn"}) as response:
+        done = read_events(response)[-1]
+    assert done[0] == "done" and done[1]["cursor"] == 9 and len(done[1]["result"]) == 4
+
+
+def test_large_responses_are_gzipped(client):
+    long_question = "which instance types " * 100
+    response = client.post("/generate", json={"question": long_question, "thread_id": 9},
+                           headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()["result"][1]["content"] == long_question
+    small = client.get("/conversation-stats", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    # server-sent events are not compressed, so they reach the client as they are produced
+    with client.stream("POST", "/generate/stream", json={"question": long_question, "thread_id": 10},
+                       headers={"Accept-Encoding": "gzip"}) as stream:
+        assert "content-encoding" not in stream.headers
+        assert read_events(stream)[-1][0] == "done"
+
+
+def test_stream_is_not_compressed_without_the_starlette_content_type_exclusion(client, monkeypatch):
+    # older Starlette releases compress text/event-stream like any other response
+    gzip = next(middleware for middleware in server.app.user_middleware
+                if middleware.cls is server.StreamExemptGZipMiddleware)
+    monkeypatch.setitem(gzip.kwargs, "exclude_content_types", ())
+    monkeypatch.setattr(server.app, "middleware_stack", None)
+    with client.stream("POST", "/generate/stream", json={"question": "which instance types " * 100, "thread_id": 11},
+                       headers={"Accept-Encoding": "gzip"}) as stream:
+        assert "content-encoding" not in stream.headers
+        assert read_events(stream)[-1][0] == "done"
+    assert client.post("/generate", json={"question": "which instance types " * 100, "thread_id": 12},
+                       headers={"Accept-Encoding": "gzip"}).headers["content-encoding"] == "gzip"
+
+
+def test_each_model_gets_its_own_pooled_agent(stub_server, client, monkeypatch):
+    built = []
+
+    def build(region, model_id, guardrail_id, guardrail_version):
+        built.append((region, model_id, guardrail_version))
+        return create_react_agent(ScriptedChat(), server.tools)
+
+    monkeypatch.setattr(server, "_build_agent", build)
+    for model_id in ["haiku", "sonnet", "haiku", "nova", "haiku"]:
+        response = client.post("/generate", json={"question": "q", "thread_id": 11, "response_model_id": model_id})
+        assert response.status_code == 200
+    assert built == [("us-east-1", "haiku", "1"), ("us-east-1", "sonnet", "1"), ("us-east-1", "nova", "1")]
+    stats = client.get("/agent-pool-stats").json()
+    # the pool holds 2 agents, least recently used first: sonnet was evicted when nova was built
+    assert stats["keys"] == [["us-east-1", "nova", "1"], ["us-east-1", "haiku", "1"]]
+    assert stats["hits"] == 2 and stats["misses"] == 3 and stats["evictions"] == 1
+
+
+@pytest.fixture
+def warm_server(stub_server, monkeypatch):
+    """stub_server with a fresh warm-up state and stub setup steps"""
+    monkeypatch.setattr(server.app.state, "startup", {"status": "pending", "attempts": 0, "timings_ms": {}, "error": None})
+    monkeypatch.setattr(server.app.state, "warm_up_task", None)
+    monkeypatch.setattr(server, "WARMUP_RETRY_SECONDS", 0)
+    monkeypatch.setattr(server, "_get_rag_system", StubRag)
+    monkeypatch.setattr(server, "_get_guardrail", lambda: ("guardrail", "1"))
+    monkeypatch.setattr(server, "_get_bedrock_client", lambda region: None)
+    return stub_server
+
+
+def wait_for_warm_up(client: TestClient) -> httpx.Response:
+    for _ in range(200):
+        # checked before the request, the task may finish between a 503 and the check
+        if server.app.state.warm_up_task.done():
+            return client.get("/ready")
+        time.sleep(0.01)
+    raise AssertionError("warm-up did not finish")
+
+
+def test_ready_after_warm_up(warm_server):
+    client = TestClient(warm_server.app)
+    assert client.get("/ready").status_code == 503
+    with TestClient(warm_server.app) as client:
+        response = wait_for_warm_up(client)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["ready"] and body["attempts"] == 1 and body["error"] is None
+    assert set(body["timings_ms"]) == {"rag_system", "guardrail", "bedrock_client", "agent", "total"}
+    assert warm_server._agent_pool.stats()["misses"] == 1
+
+
+def test_failed_warm_up_is_retried_in_the_background_up_to_the_cap(warm_server, monkeypatch):
+    monkeypatch.setattr(server, "WARMUP_MAX_ATTEMPTS", 2)
+    calls = []
+
+    def failing_setup():
+        calls.append(1)
+        raise RuntimeError("no permission")
+
+    monkeypatch.setattr(server, "_get_rag_system", failing_setup)
+    with TestClient(warm_server.app) as client:
+        response = wait_for_warm_up(client)
+        assert response.status_code == 503
+        assert response.json() | {"timings_ms": None} == {"ready": False, "status": "failed", "attempts": 2, "timings_ms": None,
+                                                          "error": "no permission", "max_attempts": 2}
+    # later lifespan startups (one per Lambda invocation under Mangum) do not try again
+    with TestClient(warm_server.app) as client:
+        assert client.get("/ready").json()["attempts"] == 2
+    assert len(calls) == 2
+
+
+def test_lambda_init_waits_at_most_the_init_budget(warm_server, monkeypatch):
+    def slow_setup():
+        time.sleep(0.3)
+        return StubRag()
+
+    monkeypatch.setattr(server, "_get_rag_system", slow_setup)
+    loop = asyncio.new_event_loop()
+    try:
+        start = time.perf_counter()
+        loop.run_until_complete(server._warm_up_within(server.app, 0.05))
+        assert time.perf_counter() - start < 0.25
+        assert server.app.state.startup["status"] == "warming"
+        # the warm-up carries on when the loop runs again, as Mangum does for the next invocation
+        loop.run_until_complete(server.app.state.warm_up_task)
+        assert server.app.state.startup["status"] == "ready"
+    finally:
+        loop.close()